@@ -3,18 +3,29 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+import time
+from itertools import islice
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from starlette.staticfiles import StaticFiles
 
+from .capture_log import CaptureReader, Record
+from .client_queue import ClientClosed
 from .config import Settings
-from .events import EventBus, now_iso
+from .decoders import DecoderPool, parse_decoders
+from .events import BusEvent, EventBus, EventFilter, Subscriber, dumps, encode_event, now_iso
 from .hub import Hub
+from .limits import parse_rules
 from .logging_config import setup_logging
+from .metrics import LOOP_TO_SEND
+from .profiling import StageTracer, sample_stacks, watch_loop_lag
+from .publisher import BinaryMessageReader, frames_from_message
+from .replay_buffer import ReplayBuffer
+from .sinks import build_sink, parse_sinks
 
 log = logging.getLogger("zmqhub.app")
 
@@ -39,18 +50,59 @@ async def on_startup() -> None:
     settings = Settings()
     setup_logging(settings)
     loop = asyncio.get_running_loop()
-    bus = EventBus(loop=loop, client_queue_size=settings.client_queue_size)
+    decoders = DecoderPool(parse_decoders(settings.decoders), settings.decoder_pool, settings.decoder_workers)
+    sinks = [build_sink(spec) for spec in parse_sinks(settings.sinks)]
+    if sinks and settings.hub_role == "worker":
+        # Every worker sees every event; N workers would export N copies
+        log.warning("Export sinks are ignored with hub_role=worker")
+        sinks = []
+    tracer = StageTracer() if settings.profiling_enabled else None
+    bus = EventBus(
+        loop=loop,
+        client_queue_size=settings.client_queue_size,
+        client_queue_bytes=settings.client_queue_bytes,
+        client_policy=settings.client_policy,
+        client_max_lag_ms=settings.client_max_lag_ms,
+        pending_size=settings.event_queue_size,
+        batch_max=settings.bus_batch_max,
+        flush_interval_ms=settings.bus_flush_interval_ms,
+        replay=ReplayBuffer(settings.replay_max_events, settings.replay_max_bytes) if settings.replay_max_events > 0 else None,
+        replay_topics=settings.replay_topics,
+        top_topics=settings.metrics_top_topics,
+        topic_depth=settings.metrics_topic_depth,
+        rate_limit=settings.ws_rate_limit,
+        rate_burst=settings.ws_rate_burst,
+        sampling=parse_rules(settings.ws_sampling),
+        decoders=decoders,
+        decode_backlog=settings.decoder_backlog,
+        decode_timeout_ms=settings.decoder_timeout_ms,
+        sinks=sinks,
+        tracer=tracer,
+    )
     hub = Hub(settings=settings, bus=bus)
     app.state.settings = settings
     app.state.bus = bus
     app.state.hub = hub
+    app.state.decoders = decoders
+    decoders.start()
+    for sink in sinks:
+        sink.start()
     hub.start()
+    app.state.lag_task = (
+        asyncio.create_task(watch_loop_lag(tracer, settings.profiling_lag_interval_ms / 1000.0)) if tracer is not None else None
+    )
 
 
 @app.on_event("shutdown")
 async def on_shutdown() -> None:
+    if app.state.lag_task is not None:
+        app.state.lag_task.cancel()
     hub: Hub = app.state.hub
     hub.stop()
+    app.state.decoders.close()
+    bus: EventBus = app.state.bus
+    for sink in bus.sinks:
+        sink.stop()
 
 
 @app.get("/")
@@ -64,25 +116,389 @@ async def healthz() -> JSONResponse:
     return JSONResponse(hub.health())
 
 
+def _query_int(params: Any, name: str) -> Optional[int]:
+    try:
+        return int(params[name]) if name in params else None
+    except ValueError:
+        return None
+
+
+@app.get("/api/replay")
+async def api_replay(since: Optional[int] = None, last: int = 100, topic: Optional[str] = None) -> Response:
+    """Recent events from the replay buffer: after seq `since`, or the last N (optionally on one topic)."""
+    bus: EventBus = app.state.bus
+    if bus.replay is None:
+        return JSONResponse({"ok": False, "error": "replay buffer disabled"}, status_code=404)
+    items = bus.replayed(since, last, topic)
+    headers = {"X-Zmqhub-Gap": "1" if bus.replay.gap(since) else "0"} if since is not None else None
+    return Response("[" + ",".join(map(encode_event, items)) + "]", media_type="application/json", headers=headers)
+
+
+def _capture_query(
+    start: Optional[float], end: Optional[float], topic: Optional[str], limit: Optional[int]
+) -> Optional[Iterator[BusEvent]]:
+    """Encoded events for stored captures in [start, end] (unix seconds) whose topic starts with `topic`."""
+    settings: Settings = app.state.settings
+    if not settings.capture_dir:
+        return None
+    records = CaptureReader(settings.capture_dir).query(
+        start_ns=int((start or 0) * 1e9),
+        end_ns=int(end * 1e9) if end is not None else None,
+        topic_prefix=(topic or "").encode("utf-8"),
+        limit=limit,
+    )
+    return (_record_event(r) for r in records)
+
+
+def _record_event(record: Record) -> BusEvent:
+    ts_ns, frames = record
+    return BusEvent("capture", frames, wall_ns=ts_ns)
+
+
+@app.get("/api/capture")
+async def api_capture(
+    start: Optional[float] = None, end: Optional[float] = None, topic: Optional[str] = None, limit: int = 10000
+) -> Response:
+    """Stream stored captures as NDJSON, straight off the memory-mapped segments."""
+    events = _capture_query(start, end, topic, limit)
+    if events is None:
+        return JSONResponse({"ok": False, "error": "capture log disabled"}, status_code=404)
+    return StreamingResponse((e.encode() + "\n" for e in events), media_type="application/x-ndjson")
+
+
+def _query_float(params: Any, name: str) -> Optional[float]:
+    try:
+        return float(params[name]) if name in params else None
+    except ValueError:
+        return None
+
+
+def _query_protocol(ws: WebSocket, settings: Settings) -> Dict[str, Any]:
+    params = ws.query_params
+    protocol: Dict[str, Any] = {
+        "batch": params.get("batch", "").lower() in ("1", "true", "yes"),
+        "batch_max": settings.ws_batch_max,
+        "flush_ms": settings.ws_batch_flush_ms,
+        "binary": params.get("binary", "").lower() in ("1", "true", "yes"),
+    }
+    try:
+        if "batch_max" in params:
+            protocol["batch_max"] = max(1, min(10000, int(params["batch_max"])))
+        if "flush_ms" in params:
+            protocol["flush_ms"] = max(0.0, min(1000.0, float(params["flush_ms"])))
+    except ValueError:
+        pass
+    return protocol
+
+
+async def _send_events(
+    ws: WebSocket,
+    sub: Subscriber,
+    backfill: List[Any],
+    hello_meta: Dict[str, Any],
+    stored: Optional[Iterator[BusEvent]] = None,
+) -> None:
+    # Tell the client its id so /ws/control can address set_filter to this stream
+    await ws.send_text(
+        dumps(
+            {
+                "ts": now_iso(),
+                "kind": "hello",
+                "source": "hub",
+                "topic": None,
+                "payload": None,
+                "meta": {"client_id": sub.id, "protocol": sub.protocol(), **hello_meta},
+            }
+        )
+    )
+    batch = sub.batch
+    step = sub.batch_max if batch else 1
+    if stored is not None:
+        # Read stored captures off the loop, one frame's worth at a time
+        while chunk := await asyncio.to_thread(lambda: [sub.encode(e) for e in islice(stored, step)]):
+            await _send_frame(ws, sub.join(chunk, batch))
+    for i in range(0, len(backfill), step):
+        await _send_frame(ws, sub.join(backfill[i : i + step], batch))
+    tracer = app.state.bus.tracer
+    while True:
+        # Already encoded once by the bus and shared across clients
+        try:
+            frame, queued_at = await sub.next_frame()
+        except ClientClosed:
+            # 1008: policy violation, the client lagged past its disconnect threshold
+            await ws.close(code=1008, reason="slow consumer")
+            return
+        if tracer is None:
+            await _send_frame(ws, frame)
+            LOOP_TO_SEND.observe(time.monotonic() - queued_at)
+            continue
+        started = time.monotonic()
+        await _send_frame(ws, frame)
+        done = time.monotonic()
+        LOOP_TO_SEND.observe(done - queued_at)
+        tracer.observe("queue", int((started - queued_at) * 1e9))
+        tracer.observe("send", int((done - started) * 1e9))
+
+
+async def _send_frame(ws: WebSocket, frame: Union[str, bytes]) -> None:
+    if isinstance(frame, bytes):
+        await ws.send_bytes(frame)
+    else:
+        await ws.send_text(frame)
+
+
+async def _wait_disconnect(ws: WebSocket) -> None:
+    while True:
+        msg = await ws.receive()
+        if msg["type"] == "websocket.disconnect":
+            return
+
+
+@app.get("/api/subscriptions")
+async def api_subscriptions() -> JSONResponse:
+    """Live XPUB subscriptions: which topic prefixes have downstream subscribers, and how many."""
+    hub: Hub = app.state.hub
+    return JSONResponse({"subscriptions": hub.subscriptions.snapshot()})
+
+
+@app.get("/api/connections")
+async def api_connections() -> JSONResponse:
+    """Connections seen by the XSUB/XPUB monitors: open peers, recently closed ones and per-endpoint event counts."""
+    hub: Hub = app.state.hub
+    return JSONResponse(hub.connections.snapshot())
+
+
+@app.get("/api/topics")
+async def api_topics(limit: int = 100, prefix: str = "", topic: str = "") -> JSONResponse:
+    """Heaviest topics and topic prefixes by rate, with sizes and first/last seen; `topic` looks up one topic."""
+    hub: Hub = app.state.hub
+    topics = hub.topics(limit, prefix, topic)
+    if topics is None:
+        return JSONResponse({"ok": False, "error": "topic statistics disabled"}, status_code=404)
+    return JSONResponse(topics)
+
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    hub: Hub = app.state.hub
+    return PlainTextResponse(hub.metrics_text(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/stages")
+async def debug_stages(reset: bool = False) -> JSONResponse:
+    """Latency quantiles per pipeline stage and event-loop lag since start or the last reset."""
+    tracer: Optional[StageTracer] = app.state.bus.tracer
+    if tracer is None:
+        return JSONResponse({"ok": False, "error": "profiling disabled"}, status_code=404)
+    snapshot = tracer.snapshot()
+    if reset:
+        tracer.reset()
+    return JSONResponse(snapshot)
+
+
+@app.get("/debug/profile")
+async def debug_profile(seconds: float = 5.0, hz: float = 100.0) -> Response:
+    """Sample every hub thread's stack for `seconds`; collapsed stacks for flame graph tools."""
+    settings: Settings = app.state.settings
+    if not settings.profiling_enabled:
+        return JSONResponse({"ok": False, "error": "profiling disabled"}, status_code=404)
+    seconds = min(max(seconds, 0.1), settings.profiling_max_s)
+    hz = min(max(hz, 1.0), 1000.0)
+    try:
+        text, samples = await asyncio.to_thread(sample_stacks, seconds, hz)
+    except RuntimeError as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=409)
+    return PlainTextResponse(text, headers={"X-Zmqhub-Samples": str(samples)})
+
+
 @app.websocket("/ws/events")
 async def ws_events(ws: WebSocket) -> None:
     await ws.accept()
     bus: EventBus = app.state.bus
-    q = await bus.subscribe()
+    params = ws.query_params
+    # ?capture_start=T[&capture_end=T&capture_topic=X] first streams stored captures
+    stored = None
+    if "capture_start" in params:
+        stored = _capture_query(
+            _query_float(params, "capture_start"),
+            _query_float(params, "capture_end"),
+            params.get("capture_topic"),
+            _query_int(params, "capture_limit"),
+        )
+    # ?since=S resumes after seq S; ?last=N[&topic=X] backfills recent history
+    since = _query_int(ws.query_params, "since")
+    last = _query_int(ws.query_params, "last") or 0
+    sub, backfill = await bus.subscribe(
+        since=since, last=last, topic=ws.query_params.get("topic"), **_query_protocol(ws, app.state.settings)
+    )
+    # ?policy=conflate[&max_lag_ms=T] picks the slow-consumer policy, as set_limits does
+    limits = {k: params[k] for k in ("policy",) if k in params}
     try:
-        while True:
-            event = await q.get()
-            await ws.send_json(event)
-    except WebSocketDisconnect:
+        if "max_lag_ms" in params:
+            limits["max_lag_ms"] = max(0.0, float(params["max_lag_ms"]))
+        sub.set_limits(limits)
+    except ValueError:
         pass
+    hello_meta: Dict[str, Any] = {"seq": bus.last_seq, "backfill": len(backfill)}
+    if since is not None and bus.replay is not None:
+        hello_meta["gap"] = bus.replay.gap(since)
+    if stored is not None:
+        hello_meta["capture"] = True
+    sender = asyncio.create_task(_send_events(ws, sub, backfill, hello_meta, stored))
+    receiver = asyncio.create_task(_wait_disconnect(ws))
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
     finally:
-        await bus.unsubscribe(q)
+        sender.cancel()
+        receiver.cancel()
+        await bus.unsubscribe(sub)
+
+
+def _publish_batch_command(hub: Hub, data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    {"action":"publish_batch","id":...,"messages":[{topic,payload,encoding,multipart},...]}
+    is acked once: invalid messages are listed by index and skipped, and if the hub
+    pushes back, `next` is the index to resend from.
+    """
+    messages = data.get("messages")
+    limit = app.state.settings.publish_batch_max
+    reply: Dict[str, Any] = {"action": "publish_batch", "id": data.get("id")}
+    if not isinstance(messages, list) or len(messages) > limit:
+        return {**reply, "ok": False, "error": f"messages must be an array of at most {limit} messages"}
+    batch: List[List[bytes]] = []
+    indexes: List[int] = []
+    errors: List[Dict[str, Any]] = []
+    for i, m in enumerate(messages):
+        try:
+            batch.append(frames_from_message(m))
+            indexes.append(i)
+        except ValueError as e:
+            errors.append({"index": i, "error": str(e)})
+    accepted, rejected = hub.publish_batch(batch)
+    reply.update(ok=not errors and not rejected, accepted=accepted, rejected=rejected, errors=errors)
+    if rejected:
+        reply["error"] = "backpressure"
+        reply["next"] = indexes[accepted]
+    return reply
+
+
+async def _inject(hub: Hub, batch: List[List[bytes]], timeout_s: float) -> Tuple[int, int]:
+    """Publish a batch, yielding to the loop while the hub pushes back, until it stalls for timeout_s."""
+    done = 0
+    deadline = time.monotonic() + timeout_s
+    while True:
+        accepted, rejected = hub.publish_batch(batch[done:])
+        done += accepted
+        if not rejected:
+            return done, 0
+        if accepted:
+            deadline = time.monotonic() + timeout_s
+        elif time.monotonic() >= deadline:
+            return done, rejected
+        await asyncio.sleep(0.001)
+
+
+@app.post("/api/publish")
+async def api_publish(request: Request) -> JSONResponse:
+    """
+    Bulk publish from a streamed body: NDJSON publish messages (the default), or with
+    Content-Type application/octet-stream a length-prefixed binary stream of raw frames.
+    Messages are injected in batches as the body arrives; while the hub pushes back,
+    reading the body pauses.
+    """
+    hub: Hub = app.state.hub
+    settings: Settings = app.state.settings
+    binary = request.headers.get("content-type", "").startswith("application/octet-stream")
+    timeout_s = settings.inject_timeout_ms / 1000.0
+    reader = BinaryMessageReader()
+    tail = b""
+    index = 0
+    accepted = rejected = 0
+    errors: List[Dict[str, Any]] = []
+    batch: List[List[bytes]] = []
+
+    async def flush() -> bool:
+        nonlocal accepted, rejected
+        if batch:
+            ok, refused = await _inject(hub, batch, timeout_s)
+            accepted += ok
+            rejected += refused
+            batch.clear()
+        return rejected == 0
+
+    async for chunk in request.stream():
+        if binary:
+            batch.extend(reader.feed(chunk))
+        else:
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for line in lines:
+                index += 1
+                if not line.strip():
+                    continue
+                try:
+                    batch.append(frames_from_message(json.loads(line)))
+                except (ValueError, UnicodeDecodeError) as e:
+                    if len(errors) < 100:
+                        errors.append({"line": index, "error": str(e)})
+        if len(batch) >= settings.publish_batch_max and not await flush():
+            break
+    else:
+        if tail.strip():
+            index += 1
+            try:
+                batch.append(frames_from_message(json.loads(tail)))
+            except (ValueError, UnicodeDecodeError) as e:
+                errors.append({"line": index, "error": str(e)})
+        await flush()
+        if binary and reader.pending:
+            errors.append({"error": f"truncated binary message ({reader.pending} trailing bytes)"})
+    body: Dict[str, Any] = {"ok": not errors and not rejected, "accepted": accepted, "rejected": rejected, "errors": errors}
+    if rejected:
+        body["error"] = "backpressure"
+    return JSONResponse(body, status_code=200 if not rejected else 503)
+
+
+def _client(bus: EventBus, client_id: Any) -> Optional[Subscriber]:
+    return bus.get_subscriber(client_id) if isinstance(client_id, str) else None
+
+
+def _replay_command(hub: Hub, data: Dict[str, Any]) -> Dict[str, Any]:
+    """{"action":"replay","op":"start|pause|resume|stop|status", ...} for stored captures."""
+    replayer = hub.replayer
+    if replayer is None:
+        return {"ok": False, "error": "capture log disabled"}
+    op = (data.get("op") or "status").lower()
+    try:
+        if op == "start":
+            topics = data.get("topics") or []
+            if not (isinstance(topics, list) and all(isinstance(t, str) for t in topics)):
+                raise ValueError("topics must be an array of strings")
+            start, end = data.get("start"), data.get("end")
+            replayer.start(
+                start_ns=int(float(start) * 1e9) if start is not None else 0,
+                end_ns=int(float(end) * 1e9) if end is not None else None,
+                topics=topics,
+                speed=float(data.get("speed", 1.0)),
+            )
+        elif op == "pause":
+            replayer.pause()
+        elif op == "resume":
+            replayer.resume()
+        elif op == "stop":
+            replayer.stop()
+        elif op != "status":
+            return {"ok": False, "error": "op must be one of start, pause, resume, stop, status"}
+    except (TypeError, ValueError, RuntimeError) as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "action": "replay", "status": replayer.status()}
 
 
 @app.websocket("/ws/control")
 async def ws_control(ws: WebSocket) -> None:
     await ws.accept()
     hub: Hub = app.state.hub
+    bus: EventBus = app.state.bus
     try:
         while True:
             msg = await ws.receive_text()
@@ -95,27 +511,56 @@ async def ws_control(ws: WebSocket) -> None:
             if action == "ping":
                 await ws.send_json({"action": "pong", "ts": now_iso()})
             elif action == "publish":
-                topic = data.get("topic") or ""
-                payload = data.get("payload")
-                encoding = (data.get("encoding") or "utf8").lower()
-                multipart = data.get("multipart")
-                if not isinstance(topic, str) or not topic:
-                    await ws.send_json({"ok": False, "error": "topic must be a non-empty string"})
+                try:
+                    ok = hub.publish_frames(frames_from_message(data))
+                    await ws.send_json({"ok": True} if ok else {"ok": False, "error": "backpressure"})
+                except Exception as e:
+                    await ws.send_json({"ok": False, "error": str(e)})
+            elif action == "publish_batch":
+                await ws.send_json(_publish_batch_command(hub, data))
+            elif action in ("subscribe", "set_filter"):
+                client_id = data.get("client_id")
+                sub = _client(bus, client_id)
+                if sub is None:
+                    await ws.send_json({"ok": False, "error": "unknown_client"})
                     continue
-                if encoding not in ("utf8", "base64"):
-                    await ws.send_json({"ok": False, "error": "encoding must be 'utf8' or 'base64'"})
+                try:
+                    if action == "subscribe":
+                        # Hint form: replaces only the topic prefixes of the current filter
+                        flt = EventFilter.from_dict({**sub.filter.to_dict(), "include": data.get("topics")})
+                    else:
+                        flt = EventFilter.from_dict(data)
+                except ValueError as e:
+                    await ws.send_json({"ok": False, "error": str(e)})
                     continue
-                if multipart is not None and not (isinstance(multipart, list) and all(isinstance(x, str) for x in multipart)):
-                    await ws.send_json({"ok": False, "error": "multipart must be an array of base64 strings"})
+                await bus.set_filter(client_id, flt)
+                await ws.send_json({"ok": True, "action": action, "client_id": client_id, "filter": flt.to_dict()})
+            elif action == "set_protocol":
+                client_id = data.get("client_id")
+                sub = _client(bus, client_id)
+                if sub is None:
+                    await ws.send_json({"ok": False, "error": "unknown_client"})
                     continue
                 try:
-                    hub.publish(topic=topic, payload=payload, encoding=encoding, multipart=multipart)
-                    await ws.send_json({"ok": True})
-                except Exception as e:
+                    sub.set_protocol(data)
+                except ValueError as e:
                     await ws.send_json({"ok": False, "error": str(e)})
-            elif action in ("subscribe", "set_filter"):
-                # Not implemented yet; acknowledge as no-op
-                await ws.send_json({"ok": True})
+                    continue
+                await ws.send_json({"ok": True, "action": action, "client_id": client_id, "protocol": sub.protocol()})
+            elif action == "set_limits":
+                client_id = data.get("client_id")
+                sub = _client(bus, client_id)
+                if sub is None:
+                    await ws.send_json({"ok": False, "error": "unknown_client"})
+                    continue
+                try:
+                    sub.set_limits(data)
+                except ValueError as e:
+                    await ws.send_json({"ok": False, "error": str(e)})
+                    continue
+                await ws.send_json({"ok": True, "action": action, "client_id": client_id, "limits": sub.limits()})
+            elif action == "replay":
+                await ws.send_json(_replay_command(hub, data))
             else:
                 await ws.send_json({"ok": False, "error": "unknown_action"})
     except WebSocketDisconnect:
@@ -0,0 +1,605 @@
+from __future__ import annotations
+
+import logging
+import math
+import secrets
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import zmq
+
+from .config import Settings
+from .zmq_proxy import Proxy
+
+log = logging.getLogger("zmqhub.bridge")
+
+# Bridge <-> bridge wire format. A link is a DEALER connected to another hub's
+# bridge_bind ROUTER; both ends speak the same commands over it:
+#   [b"PING", hub id, u64 sender wall_ns]
+#   [b"PONG", hub id, u64 echoed wall_ns, u64 responder wall_ns]
+#   [b"INT", hub id, *entries]  the sender's full interest set, one entry per frame:
+#                               u8 hops | u8 len(origin) | origin hub id | topic prefix
+#   [b"BAT", header, *frames]   a batch of messages: header is u64 wall_ns of the oldest
+#                               message | u16 count | u8 n origins | n * (u8 len, id) |
+#                               count * (u8 origin index, u8 hops, u16 nframes, u64 seq),
+#                               followed by every message's frames in order
+# (origin hub id, seq) names a message across the mesh; hops counts the links it crossed.
+_PING = b"PING"
+_PONG = b"PONG"
+_INTEREST = b"INT"
+_BATCH = b"BAT"
+_U64 = struct.Struct("<Q")
+_HEAD = struct.Struct("<QHB")
+_ENTRY = struct.Struct("<BBHQ")
+_INT_ENTRY = struct.Struct("<BB")
+
+# (origin hub id, seq, hops, frames)
+Item = Tuple[bytes, int, int, Sequence[Any]]
+
+
+def pack_batch(wall_ns: int, items: Sequence[Item]) -> List[Any]:
+    origins: Dict[bytes, int] = {}
+    entries: List[bytes] = []
+    frames: List[Any] = []
+    for origin, seq, hops, msg in items:
+        index = origins.setdefault(origin, len(origins))
+        entries.append(_ENTRY.pack(index, hops, len(msg), seq))
+        frames.extend(msg)
+    table = b"".join(bytes([len(o)]) + o for o in origins)
+    return [_BATCH, _HEAD.pack(wall_ns, len(items), len(origins)) + table + b"".join(entries), *frames]
+
+
+def unpack_batch(parts: Sequence[Any]) -> Tuple[int, List[Item]]:
+    """Split [header, *frames] back into items; raises ValueError on a malformed batch."""
+    head = parts[0].bytes if isinstance(parts[0], zmq.Frame) else parts[0]
+    wall_ns, count, norigins = _HEAD.unpack_from(head, 0)  # struct.error is a ValueError
+    pos = _HEAD.size
+    origins: List[bytes] = []
+    for _ in range(norigins):
+        n = head[pos]
+        origins.append(head[pos + 1 : pos + 1 + n])
+        pos += 1 + n
+    items: List[Item] = []
+    frame = 1
+    for _ in range(count):
+        index, hops, nframes, seq = _ENTRY.unpack_from(head, pos)
+        pos += _ENTRY.size
+        msg = parts[frame : frame + nframes]
+        if index >= len(origins) or not msg or len(msg) < nframes:
+            raise ValueError("malformed bridge batch")
+        items.append((origins[index], seq, hops, msg))
+        frame += nframes
+    return wall_ns, items
+
+
+def _same(a: Sequence[zmq.Frame], b: Sequence[zmq.Frame]) -> bool:
+    # Sizes first; contents are compared in place, only for a message due back
+    if len(a) != len(b) or any(len(x) != len(y) for x, y in zip(a, b)):
+        return False
+    return all(x.buffer == y.buffer for x, y in zip(a[1:], b[1:]))
+
+
+class _Link:
+    """One connection to another hub, either dialled (out) or accepted (in)."""
+
+    def __init__(self, name: str, direction: str, endpoint: str, sock: Optional[zmq.Socket] = None, route: Optional[bytes] = None) -> None:
+        self.name = name
+        self.direction = direction
+        self.endpoint = endpoint
+        self.sock = sock
+        self.route = route
+        self.peer = b""  # remote hub id, once it introduced itself
+        self.interest: Dict[Tuple[bytes, bytes], int] = {}  # (prefix, origin hub) -> hops
+        self.prefixes: Tuple[bytes, ...] = ()  # the interest this link is the best route for
+        # Prefixes to pass on, per other link, for messages that arrive over this one
+        self.relay: Dict["_Link", Tuple[bytes, ...]] = {}
+        self.advertised: Optional[FrozenSet[Tuple[Tuple[bytes, bytes], int]]] = None
+        self.items: List[Item] = []
+        self.origins: set = set()
+        self.nbytes = 0
+        self.since = 0.0  # monotonic time the pending batch was started
+        self.oldest_ns = 0
+        self.last_seen = 0.0
+        self.rtt_ms: Optional[float] = None
+        self.offset_ns = 0  # remote wall clock minus ours, from the last ping
+        self.lag_ms: Optional[float] = None
+        self.batch_delay_ms: Optional[float] = None
+        self.sent = self.sent_bytes = self.batches_sent = 0
+        self.received = self.received_bytes = self.batches_received = 0
+        self.dropped = self.duplicates = 0
+        self.send_rate = self.recv_rate = 0.0
+        self._prev = (0, 0, time.monotonic())
+
+    def tick(self, now: float) -> None:
+        sent, received, ts = self._prev
+        dt = now - ts
+        if dt > 0:
+            self.send_rate = (self.sent - sent) / dt
+            self.recv_rate = (self.received - received) / dt
+            self._prev = (self.sent, self.received, now)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "direction": self.direction,
+            "endpoint": self.endpoint,
+            "peer": self.peer.decode("utf-8", errors="replace") or None,
+            "connected": bool(self.peer),
+            "interest": len({p for p, _ in self.interest}),
+            "routed": len(self.prefixes),
+            "rtt_ms": None if self.rtt_ms is None else round(self.rtt_ms, 3),
+            "lag_ms": None if self.lag_ms is None else round(self.lag_ms, 3),
+            "batch_delay_ms": None if self.batch_delay_ms is None else round(self.batch_delay_ms, 3),
+            "pending": len(self.items),
+            "sent": self.sent,
+            "sent_bytes": self.sent_bytes,
+            "batches_sent": self.batches_sent,
+            "send_rate": round(self.send_rate, 3),
+            "received": self.received,
+            "received_bytes": self.received_bytes,
+            "batches_received": self.batches_received,
+            "recv_rate": round(self.recv_rate, 3),
+            "dropped": self.dropped,
+            "duplicates": self.duplicates,
+        }
+
+
+class Bridge:
+    """
+    Federates this hub with others. Every link advertises which topic prefixes its
+    side wants: the prefixes the local XPUB subscription table counts beyond the
+    bridge's own subscriptions, plus what other links want (split horizon, tagged
+    with the hub that wants them and a hop count, so interest never circulates in a
+    mesh for longer than bridge_max_hops). The bridge subscribes on the local XPUB
+    to whatever any link wants and forwards matching messages in batches; messages
+    from links go into the local XSUB when someone here subscribed, and on to other
+    links that want them.
+
+    Each message keeps the id of the hub it entered the mesh at and a sequence, so
+    copies arriving over several paths while routes change are dropped, and a message never goes back
+    to its origin. A hub only passes a message on towards hubs it is nearer to than
+    the neighbour it came from, so a loop does not carry every message both ways.
+    Injected messages come back through our own subscription without that header, in
+    the order they went in; each is matched to the oldest injection on its topic that
+    is still due back and dropped. A local publish identical to one just takes its
+    place, so this hub still sends exactly one copy on.
+
+    One thread owns every socket; links never block it, a full link drops batches.
+    """
+
+    def __init__(self, settings: Settings, proxy: Proxy) -> None:
+        self.settings = settings
+        self.proxy = proxy
+        self.id = (settings.bridge_id or secrets.token_hex(4)).encode("utf-8")[:255]
+        self._links: List[_Link] = []
+        self._routes: Dict[bytes, _Link] = {}
+        self._router: Optional[zmq.Socket] = None
+        self._local_sock: Optional[zmq.Socket] = None
+        self._inject_sock: Optional[zmq.Socket] = None
+        self._dedup: "OrderedDict[Tuple[bytes, int], None]" = OrderedDict()
+        # topic -> (origin, seq, frames) injected and due back through our own subscription
+        self._echo: Dict[bytes, Deque[Item]] = {}
+        self._subscribed: FrozenSet[bytes] = frozenset()  # our own subscriptions on XPUB
+        self._subscribed_prefixes: Tuple[bytes, ...] = ()
+        self._local: Tuple[bytes, ...] = ()  # prefixes subscribed here by anyone else
+        self._version = -1
+        self._seq = 0
+        self.originated = 0
+        self.injected = 0
+        self.inject_dropped = 0
+        self.duplicates = 0
+        self.hop_limited = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(self.proxy.context,), name="zmqhub-bridge", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        # Sockets live on the proxy's context, so this has to run before the proxy stops
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+    # -- sockets ---------------------------------------------------------------
+
+    def _open(self, ctx: zmq.Context) -> List[zmq.Socket]:
+        s = self.settings
+        local = ctx.socket(zmq.SUB)
+        local.setsockopt(zmq.LINGER, 0)
+        local.set_hwm(s.bridge_hwm)
+        local.connect(s.bridge_local_endpoint)
+        self._local_sock = local
+
+        inject = ctx.socket(zmq.XPUB)
+        inject.setsockopt(zmq.XPUB_NODROP, 1)
+        inject.setsockopt(zmq.LINGER, 0)
+        inject.set_hwm(s.bridge_hwm)
+        inject.connect(s.inject_endpoint)
+        self._inject_sock = inject
+        socks = [local, inject]
+
+        if s.bridge_bind:
+            router = ctx.socket(zmq.ROUTER)
+            router.setsockopt(zmq.LINGER, 0)
+            router.setsockopt(zmq.ROUTER_MANDATORY, 1)
+            router.set_hwm(s.bridge_link_hwm)
+            router.bind(s.bridge_bind)
+            self._router = router
+            socks.append(router)
+        for endpoint in s.bridge_links:
+            dealer = ctx.socket(zmq.DEALER)
+            dealer.setsockopt(zmq.LINGER, 0)
+            # No queueing for a link that is not up: those batches count as dropped
+            dealer.setsockopt(zmq.IMMEDIATE, 1)
+            dealer.set_hwm(s.bridge_link_hwm)
+            dealer.connect(endpoint)
+            self._links.append(_Link(endpoint, "out", endpoint, sock=dealer))
+            socks.append(dealer)
+        return socks
+
+    def _run(self, ctx: zmq.Context) -> None:
+        socks = self._open(ctx)
+        poller = zmq.Poller()
+        for sock in socks:
+            poller.register(sock, zmq.POLLIN)
+        dealers = {link.sock: link for link in self._links}
+        beat = max(0.05, self.settings.bridge_heartbeat_ms / 1000.0)
+        next_beat = time.monotonic()
+        log.info(
+            "Bridge %s: accepting on %s, linking to %s",
+            self.id.decode("utf-8", errors="replace"),
+            self.settings.bridge_bind or "-",
+            ", ".join(self.settings.bridge_links) or "-",
+        )
+        try:
+            while not self._stop.is_set():
+                try:
+                    events = dict(poller.poll(self._timeout(next_beat)))
+                except zmq.ZMQError as e:
+                    if e.errno == zmq.ETERM:
+                        break
+                    raise
+                for sock in events:
+                    if sock is self._local_sock:
+                        self._drain_local(sock)
+                    elif sock is self._inject_sock:
+                        self._drain_subscriptions(sock)
+                    elif sock is self._router:
+                        self._drain_router(sock)
+                    else:
+                        self._drain_dealer(dealers[sock])
+                now = time.monotonic()
+                if now >= next_beat:
+                    self._heartbeat(now, beat)
+                    next_beat = now + beat
+                elif self.proxy.subscriptions.version != self._version:
+                    self._sync()
+                self._flush_due(now)
+        except zmq.ZMQError as e:
+            if e.errno != zmq.ETERM:
+                log.exception("Bridge failed")
+        finally:
+            for sock in socks:
+                sock.close(0)
+            self._links.clear()
+            self._routes.clear()
+
+    def _timeout(self, next_beat: float) -> int:
+        now = time.monotonic()
+        deadline = min(next_beat, now + 0.1)
+        wait = self.settings.bridge_batch_ms / 1000.0
+        for link in self._links:
+            if link.items:
+                deadline = min(deadline, link.since + wait)
+        return max(0, math.ceil((deadline - now) * 1000))
+
+    def _drain_local(self, sock: zmq.Socket) -> None:
+        for _ in range(self.settings.bridge_batch_max):
+            try:
+                msg = sock.recv_multipart(flags=zmq.NOBLOCK, copy=False)
+            except zmq.Again:
+                return
+            self._on_local(msg)
+
+    def _drain_subscriptions(self, sock: zmq.Socket) -> None:
+        # The injecting XPUB hears the hub's subscriptions; the table has them already
+        while True:
+            try:
+                sock.recv(flags=zmq.NOBLOCK)
+            except zmq.Again:
+                return
+
+    def _drain_router(self, sock: zmq.Socket) -> None:
+        for _ in range(self.settings.bridge_link_hwm):
+            try:
+                route, *parts = sock.recv_multipart(flags=zmq.NOBLOCK, copy=False)
+            except zmq.Again:
+                return
+            key = route.bytes
+            link = self._routes.get(key)
+            if link is None:
+                link = self._routes[key] = _Link(f"in:{key.hex()}", "in", self.settings.bridge_bind, route=key)
+                self._links.append(link)
+            self._on_link(link, parts)
+
+    def _drain_dealer(self, link: _Link) -> None:
+        for _ in range(self.settings.bridge_link_hwm):
+            try:
+                parts = link.sock.recv_multipart(flags=zmq.NOBLOCK, copy=False)  # type: ignore[union-attr]
+            except zmq.Again:
+                return
+            self._on_link(link, parts)
+
+    def _send(self, link: _Link, parts: List[Any]) -> bool:
+        try:
+            if link.route is not None:
+                self._router.send_multipart([link.route, *parts], flags=zmq.NOBLOCK, copy=False)  # type: ignore[union-attr]
+            else:
+                link.sock.send_multipart(parts, flags=zmq.NOBLOCK, copy=False)  # type: ignore[union-attr]
+            return True
+        except zmq.Again:
+            return False
+        except zmq.ZMQError as e:
+            # A peer that went away; the heartbeat drops the link once it stays silent
+            if e.errno == zmq.EHOSTUNREACH:
+                return False
+            raise
+
+    # -- messages --------------------------------------------------------------
+
+    def _on_local(self, msg: List[zmq.Frame]) -> None:
+        topic = msg[0].bytes
+        if self._echo and self._is_echo(topic, msg):
+            return
+        self._seq += 1
+        self.originated += 1
+        for link in self._links:
+            if link.peer and topic.startswith(link.prefixes):
+                self._queue(link, (self.id, self._seq, 1, msg))
+
+    def _is_echo(self, topic: bytes, msg: List[zmq.Frame]) -> bool:
+        due = self._echo.get(topic)
+        if due is None:
+            return False
+        for i, (_, _, _, injected) in enumerate(due):
+            if _same(injected, msg):
+                # Echoes come back in order, so the ones before it were lost to a full pipe
+                for _ in range(i + 1):
+                    due.popleft()
+                if not due:
+                    del self._echo[topic]
+                return True
+        return False
+
+    def _on_link(self, link: _Link, parts: List[zmq.Frame]) -> None:
+        link.last_seen = time.monotonic()
+        cmd = parts[0].bytes if parts else b""
+        try:
+            if cmd == _BATCH:
+                self._on_batch(link, parts[1:])
+            elif cmd == _PING and len(parts) == 3:
+                self._hello(link, parts[1].bytes)
+                self._send(link, [_PONG, self.id, parts[2].bytes, _U64.pack(time.time_ns())])
+            elif cmd == _PONG and len(parts) == 4:
+                self._hello(link, parts[1].bytes)
+                (t0,) = _U64.unpack(parts[2].bytes)
+                (t1,) = _U64.unpack(parts[3].bytes)
+                rtt = time.time_ns() - t0
+                link.rtt_ms = rtt / 1e6
+                link.offset_ns = t1 - (t0 + rtt // 2)
+            elif cmd == _INTEREST and len(parts) >= 2:
+                self._hello(link, parts[1].bytes)
+                self._on_interest(link, parts[2:])
+        except (ValueError, IndexError):
+            log.warning("Malformed %r from bridge link %s", cmd[:8], link.name)
+
+    def _hello(self, link: _Link, peer: bytes) -> None:
+        if peer == link.peer:
+            return
+        if peer == self.id:
+            if link.direction == "out":
+                log.warning("Bridge link %s leads back to this hub; ignoring it", link.name)
+            return
+        log.info("Bridge link %s: connected to hub %s", link.name, peer.decode("utf-8", errors="replace"))
+        link.peer = peer
+        link.advertised = None
+        self._sync()
+
+    def _lose(self, link: _Link) -> None:
+        if link.peer:
+            log.info("Bridge link %s: lost hub %s", link.name, link.peer.decode("utf-8", errors="replace"))
+        link.peer = b""
+        link.dropped += len(link.items)
+        link.items, link.origins, link.nbytes = [], set(), 0
+        link.interest, link.prefixes, link.relay, link.advertised = {}, (), {}, None
+        if link.direction == "in":
+            self._routes.pop(link.route, None)  # type: ignore[arg-type]
+            self._links.remove(link)
+        self._sync()
+
+    def _on_interest(self, link: _Link, entries: List[zmq.Frame]) -> None:
+        interest: Dict[Tuple[bytes, bytes], int] = {}
+        for frame in entries:
+            data = frame.bytes
+            hops, n = _INT_ENTRY.unpack_from(data, 0)
+            origin = data[_INT_ENTRY.size : _INT_ENTRY.size + n]
+            prefix = data[_INT_ENTRY.size + n :]
+            interest[(prefix, origin)] = hops
+        if interest != link.interest:
+            link.interest = interest
+            self._sync()
+
+    def _on_batch(self, link: _Link, parts: List[zmq.Frame]) -> None:
+        wall_ns, items = unpack_batch(parts)
+        link.batches_received += 1
+        link.lag_ms = max(0, time.time_ns() - (wall_ns - link.offset_ns)) / 1e6
+        dedup = self._dedup
+        limit = max(1, self.settings.bridge_dedup)
+        max_hops = self.settings.bridge_max_hops
+        for origin, seq, hops, msg in items:
+            link.received += 1
+            link.received_bytes += sum(map(len, msg))
+            key = (origin, seq)
+            if origin == self.id or key in dedup:
+                link.duplicates += 1
+                self.duplicates += 1
+                continue
+            dedup[key] = None
+            if len(dedup) > limit:
+                dedup.popitem(last=False)
+            topic = msg[0].bytes
+            if topic.startswith(self._local):
+                self._inject((origin, seq, hops, msg))
+            if hops >= max_hops:
+                self.hop_limited += 1
+                continue
+            for other, prefixes in link.relay.items():
+                if other.peer and other.peer != origin and topic.startswith(prefixes):
+                    self._queue(other, (origin, seq, hops + 1, msg))
+
+    def _inject(self, item: Item) -> None:
+        msg = item[3]
+        try:
+            self._inject_sock.send_multipart(msg, flags=zmq.NOBLOCK, copy=False)  # type: ignore[union-attr]
+        except zmq.Again:
+            self.inject_dropped += 1
+            return
+        self.injected += 1
+        topic = msg[0].bytes
+        if topic.startswith(self._subscribed_prefixes):
+            echo = self._echo
+            due = echo.get(topic)
+            if due is None:
+                due = echo[topic] = deque(maxlen=max(1, self.settings.bridge_dedup))
+            due.append(item)
+            if len(echo) > max(1, self.settings.bridge_dedup):
+                del echo[next(iter(echo))]  # lost to a full pipe; forget the oldest topic
+
+    # -- batches ---------------------------------------------------------------
+
+    def _queue(self, link: _Link, item: Item) -> None:
+        if item[0] not in link.origins and len(link.origins) >= 255:
+            self._flush(link)
+        if not link.items:
+            link.since = time.monotonic()
+            link.oldest_ns = time.time_ns()
+        link.items.append(item)
+        link.origins.add(item[0])
+        link.nbytes += sum(map(len, item[3]))
+        if len(link.items) >= self.settings.bridge_batch_max or link.nbytes >= self.settings.bridge_batch_bytes:
+            self._flush(link)
+
+    def _flush(self, link: _Link) -> None:
+        items, nbytes = link.items, link.nbytes
+        link.items, link.origins, link.nbytes = [], set(), 0
+        if not items:
+            return
+        link.batch_delay_ms = (time.monotonic() - link.since) * 1000.0
+        if self._send(link, pack_batch(link.oldest_ns, items)):
+            link.sent += len(items)
+            link.sent_bytes += nbytes
+            link.batches_sent += 1
+        else:
+            link.dropped += len(items)
+
+    def _flush_due(self, now: float) -> None:
+        wait = self.settings.bridge_batch_ms / 1000.0
+        for link in list(self._links):
+            if link.items and now - link.since >= wait:
+                self._flush(link)
+
+    # -- interest --------------------------------------------------------------
+
+    def _sync(self) -> None:
+        """Re-derive local interest, our own subscriptions and every link's advertisement."""
+        table = self.proxy.subscriptions
+        self._version = table.version
+        # Our own subscriptions are counted in the table too; the in-flight ones make
+        # this briefly off, until the table catches up and bumps its version again
+        own = self._subscribed
+        self._local = tuple(sorted(p for p, n in table.counts().items() if n > (1 if p in own else 0)))
+
+        # Each hub's interest is served over the link with the fewest hops to it, so
+        # meshes only carry duplicates while routes change
+        best: Dict[Tuple[bytes, bytes], Tuple[int, _Link]] = {}
+        for link in self._links:
+            if link.peer:
+                for key, hops in link.interest.items():
+                    if key not in best or hops < best[key][0]:
+                        best[key] = (hops, link)
+        for link in self._links:
+            link.prefixes = tuple(sorted({key[0] for key, (_, via) in best.items() if via is link}))
+        # A message from a neighbour is only passed on towards hubs we are nearer to
+        # than that neighbour, which advertised its own distance plus one: otherwise
+        # it, or a hub on its shorter route, delivers the message itself
+        for link in self._links:
+            relay: Dict[_Link, set] = {}
+            for key, (hops, via) in best.items():
+                if via is not link and link.interest.get(key, 256) > hops + 1:
+                    relay.setdefault(via, set()).add(key[0])
+            link.relay = {via: tuple(sorted(prefixes)) for via, prefixes in relay.items()}
+
+        wanted = frozenset(p for link in self._links for p in link.prefixes)
+        sock = self._local_sock
+        if sock is not None and wanted != own:
+            for prefix in wanted - own:
+                sock.setsockopt(zmq.SUBSCRIBE, prefix)
+            for prefix in own - wanted:
+                sock.setsockopt(zmq.UNSUBSCRIBE, prefix)
+            self._subscribed = wanted
+            self._subscribed_prefixes = tuple(wanted)
+
+        max_hops = self.settings.bridge_max_hops
+        for link in self._links:
+            if not link.peer:
+                continue
+            entries: Dict[Tuple[bytes, bytes], int] = {(p, self.id): 1 for p in self._local}
+            for other in self._links:
+                if other is link or not other.peer:
+                    continue
+                for (prefix, origin), hops in other.interest.items():
+                    if origin == link.peer or hops >= max_hops:
+                        continue
+                    key = (prefix, origin)
+                    if hops + 1 < entries.get(key, 256):
+                        entries[key] = hops + 1
+            advertised = frozenset(entries.items())
+            if advertised != link.advertised:
+                frames = [_INT_ENTRY.pack(h, len(o)) + o + p for (p, o), h in sorted(entries.items())]
+                if self._send(link, [_INTEREST, self.id, *frames]):
+                    link.advertised = advertised
+
+    def _heartbeat(self, now: float, beat: float) -> None:
+        wall = _U64.pack(time.time_ns())
+        for link in list(self._links):
+            if (link.peer or link.direction == "in") and now - link.last_seen > 3 * beat:
+                self._lose(link)
+                continue
+            link.tick(now)
+            if link.direction == "out" or link.peer:
+                self._send(link, [_PING, self.id, wall])
+            link.advertised = None  # re-advertise, in case an update was dropped
+        self._sync()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "id": self.id.decode("utf-8", errors="replace"),
+            "bind": self.settings.bridge_bind or None,
+            "local_prefixes": len(self._local),
+            "forwarded_prefixes": len(self._subscribed),
+            "originated": self.originated,
+            "injected": self.injected,
+            "inject_dropped": self.inject_dropped,
+            "duplicates": self.duplicates,
+            "hop_limited": self.hop_limited,
+            "links": [link.stats() for link in list(self._links)],
+        }
@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .config import Settings
+
+log = logging.getLogger("zmqhub.capture_log")
+
+# Segment layout: MAGIC, then records of
+#   u32 body_len | u64 ts_ns | u16 nframes | nframes * u32 size | frame bytes...
+# where body_len counts everything after itself. Each segment has a sparse .idx
+# side file of (u64 ts_ns, u64 offset) pairs, one per `index_bytes` written.
+MAGIC = b"ZHCAP001"
+_REC = struct.Struct("<IQH")
+_SIZE = struct.Struct("<I")
+_IDX = struct.Struct("<QQ")
+_SEG_SUFFIX = ".seg"
+_IDX_SUFFIX = ".idx"
+
+Record = Tuple[int, List[bytes]]
+
+
+def pack_record(ts_ns: int, frames: Sequence[bytes]) -> bytes:
+    sizes = b"".join(_SIZE.pack(len(f)) for f in frames)
+    body_len = _REC.size - _SIZE.size + len(sizes) + sum(len(f) for f in frames)
+    return b"".join([_REC.pack(body_len, ts_ns, len(frames)), sizes, *frames])
+
+
+def _segment_paths(directory: Path) -> List[Path]:
+    # Names are the zero-padded ns timestamp of the first record, so they sort by time
+    return sorted(directory.glob("*" + _SEG_SUFFIX))
+
+
+class CaptureWriter:
+    """
+    Background writer for raw captured frames. append() is called from the capture
+    thread and only touches a bounded deque; the writer thread wakes every
+    `capture_flush_ms` and group-commits everything pending with a single write.
+    Segments rotate at `capture_segment_bytes` and old ones are pruned by total
+    size and age.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.directory = Path(settings.capture_dir)
+        self._pending: Deque[Record] = deque(maxlen=settings.capture_queue_size)
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._seg: Optional[Any] = None
+        self._idx: Optional[Any] = None
+        self._seg_size = 0
+        self._since_index = 0
+        self.written = 0
+        self.dropped = 0
+        self.bytes_written = 0
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="zmqhub-capture-log", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+        self._thread = None
+
+    def append(self, frames: Sequence[bytes]) -> None:
+        if len(self._pending) >= self.settings.capture_queue_size:
+            self.dropped += 1
+        self._pending.append((time.time_ns(), list(frames)))
+
+    def stats(self) -> Dict[str, Any]:
+        segments = _segment_paths(self.directory) if self.directory.exists() else []
+        return {
+            "dir": str(self.directory),
+            "written": self.written,
+            "dropped": self.dropped,
+            "pending": len(self._pending),
+            "bytes_written": self.bytes_written,
+            "segments": len(segments),
+            "disk_bytes": sum(p.stat().st_size for p in segments),
+        }
+
+    def _run(self) -> None:
+        interval = self.settings.capture_flush_ms / 1000.0
+        next_prune = time.monotonic() + 60.0
+        try:
+            while not self._stop.wait(interval):
+                self._commit()
+                if time.monotonic() >= next_prune and self._seg is not None:
+                    # Age-based retention also applies when traffic is too low to rotate
+                    self._prune(keep=Path(self._seg.name))
+                    next_prune = time.monotonic() + 60.0
+            self._commit()
+        except Exception:
+            log.exception("Capture log writer failed")
+        finally:
+            self._close_segment()
+
+    def _commit(self) -> None:
+        pending = self._pending
+        if not pending:
+            return
+        buf = bytearray()
+        index: List[bytes] = []
+        n = 0
+        while pending:
+            ts_ns, frames = pending.popleft()
+            if self._seg is None or self._seg_size + len(buf) >= self.settings.capture_segment_bytes:
+                self._write(buf, index)
+                buf, index = bytearray(), []
+                self._rotate(ts_ns)
+            offset = self._seg_size + len(buf)
+            if self._since_index <= 0:
+                index.append(_IDX.pack(ts_ns, offset))
+                self._since_index = self.settings.capture_index_bytes
+            rec = pack_record(ts_ns, frames)
+            buf += rec
+            self._since_index -= len(rec)
+            n += 1
+        self._write(buf, index)
+        self.written += n
+
+    def _write(self, buf: bytearray, index: List[bytes]) -> None:
+        if not buf or self._seg is None:
+            return
+        self._seg.write(buf)
+        self._seg.flush()
+        if index:
+            self._idx.write(b"".join(index))
+            self._idx.flush()
+        if self.settings.capture_fsync:
+            os.fsync(self._seg.fileno())
+        self._seg_size += len(buf)
+        self.bytes_written += len(buf)
+
+    def _rotate(self, ts_ns: int) -> None:
+        self._close_segment()
+        path = self.directory / f"{ts_ns:020d}{_SEG_SUFFIX}"
+        self._seg = open(path, "ab")
+        self._idx = open(path.with_suffix(_IDX_SUFFIX), "ab")
+        self._seg.write(MAGIC)
+        self._seg_size = len(MAGIC)
+        self._since_index = 0
+        self._prune(keep=path)
+
+    def _close_segment(self) -> None:
+        for f in (self._seg, self._idx):
+            if f is not None:
+                try:
+                    f.close()
+                except Exception:
+                    pass
+        self._seg = self._idx = None
+
+    def _prune(self, keep: Path) -> None:
+        segments = [p for p in _segment_paths(self.directory) if p != keep]
+        total = sum(p.stat().st_size for p in segments) + self._seg_size
+        cutoff = time.time() - self.settings.capture_retention_s
+        for p in segments:
+            too_big = total > self.settings.capture_retention_bytes
+            if not too_big and p.stat().st_mtime >= cutoff:
+                break
+            total -= p.stat().st_size
+            for f in (p, p.with_suffix(_IDX_SUFFIX)):
+                try:
+                    f.unlink()
+                except FileNotFoundError:
+                    pass
+            log.info("Pruned capture segment %s", p.name)
+
+
+class CaptureReader:
+    """
+    Query captured segments by time range and topic prefix. Segments are mmapped and
+    the sparse index is bisected to find the first candidate record, so only the
+    requested range is touched. Records are yielded lazily; safe against a segment
+    that is still being appended to.
+    """
+
+    def __init__(self, directory: str | Path) -> None:
+        self.directory = Path(directory)
+
+    def query(
+        self,
+        start_ns: int = 0,
+        end_ns: Optional[int] = None,
+        topic_prefix: bytes = b"",
+        limit: Optional[int] = None,
+    ) -> Iterator[Record]:
+        segments = _segment_paths(self.directory) if self.directory.exists() else []
+        starts = [int(p.stem) for p in segments]
+        # The last segment starting at or before start_ns may still contain it
+        first = max(0, bisect.bisect_right(starts, start_ns) - 1)
+        count = 0
+        for i in range(first, len(segments)):
+            if end_ns is not None and starts[i] > end_ns:
+                return
+            for ts_ns, frames in self._scan(segments[i], start_ns, end_ns, topic_prefix):
+                yield ts_ns, frames
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+    def _seek(self, seg: Path, start_ns: int) -> int:
+        try:
+            raw = seg.with_suffix(_IDX_SUFFIX).read_bytes()
+        except FileNotFoundError:
+            return len(MAGIC)
+        entries = [_IDX.unpack_from(raw, off) for off in range(0, len(raw) - _IDX.size + 1, _IDX.size)]
+        pos = bisect.bisect_right([ts for ts, _ in entries], start_ns) - 1
+        return entries[pos][1] if pos >= 0 else len(MAGIC)
+
+    def _scan(self, seg: Path, start_ns: int, end_ns: Optional[int], topic_prefix: bytes) -> Iterator[Record]:
+        try:
+            f = open(seg, "rb")
+        except FileNotFoundError:
+            return  # pruned since listing
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= len(MAGIC):
+                return
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    off = self._seek(seg, start_ns)
+                    while off + _REC.size <= size:
+                        body_len, ts_ns, nframes = _REC.unpack_from(mm, off)
+                        end = off + _SIZE.size + body_len
+                        if end > size:
+                            break  # partially written tail
+                        if end_ns is not None and ts_ns > end_ns:
+                            return
+                        if ts_ns >= start_ns:
+                            pos = off + _REC.size
+                            sizes = struct.unpack_from(f"<{nframes}I", mm, pos)
+                            pos += 4 * nframes
+                            if not topic_prefix or (
+                                nframes and sizes[0] >= len(topic_prefix) and view[pos : pos + len(topic_prefix)] == topic_prefix
+                            ):
+                                frames = []
+                                for n in sizes:
+                                    frames.append(bytes(view[pos : pos + n]))
+                                    pos += n
+                                yield ts_ns, frames
+                        off = end
+                finally:
+                    view.release()
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import zmq
+
+from .capture_log import CaptureReader
+from .config import Settings
+from .fanout import INJECT_PLAIN
+
+log = logging.getLogger("zmqhub.capture_replay")
+
+_ATTACH_TIMEOUT_MS = 1000
+
+
+class CaptureReplayer:
+    """
+    Re-inject stored captures through the hub's XSUB side from a background thread.
+
+    speed=1.0 keeps the original inter-message timing, other positive values scale it
+    and speed=0 sends as fast as the hub accepts. Messages go out in batches of up to
+    publish_batch_max: at speed=0 back to back, otherwise everything due before the
+    next wait. Embedded hubs attach() the proxy's context, and the replay sends like
+    Publisher, over an inproc XPUB to inject_endpoint with XPUB_NODROP, so sends wait
+    on the HWM instead of silently dropping. Workers push to the core's injector.
+    Only one replay runs at a time.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self._reader = CaptureReader(settings.capture_dir)
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._resume = threading.Event()
+        self._resume.set()
+        self._lock = threading.Lock()
+        self._status: Dict[str, Any] = {"state": "idle"}
+        self._context: Optional[zmq.Context] = None
+
+    def attach(self, context: Optional[zmq.Context]) -> None:
+        """Send through the proxy's context; without one, to the core process."""
+        self._context = context
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            st = dict(self._status)
+        if st.get("state") in ("running", "paused"):
+            elapsed = time.monotonic() - st.pop("_t0")
+            st["elapsed_s"] = round(elapsed, 3)
+            st["rate"] = round(st["sent"] / elapsed, 1) if elapsed > 0 else 0.0
+        else:
+            st.pop("_t0", None)
+        return st
+
+    def start(
+        self,
+        start_ns: int = 0,
+        end_ns: Optional[int] = None,
+        topics: Sequence[str] = (),
+        speed: float = 1.0,
+    ) -> None:
+        if speed < 0:
+            raise ValueError("speed must be >= 0")
+        if self._thread and self._thread.is_alive():
+            raise RuntimeError("a replay is already running")
+        # Freeze the range so traffic we re-inject (and re-capture) is not replayed again
+        end_ns = time.time_ns() if end_ns is None else end_ns
+        prefixes = tuple(t.encode("utf-8") for t in topics)
+        self._stop.clear()
+        self._resume.set()
+        with self._lock:
+            self._status = {
+                "state": "running",
+                "speed": speed,
+                "start_ns": start_ns,
+                "end_ns": end_ns,
+                "topics": list(topics),
+                "sent": 0,
+                "position_ns": None,
+                "_t0": time.monotonic(),
+            }
+        self._thread = threading.Thread(
+            target=self._run, args=(start_ns, end_ns, prefixes, speed), name="zmqhub-replay", daemon=True
+        )
+        self._thread.start()
+
+    def pause(self) -> None:
+        self._set_state("paused", only_from="running")
+        self._resume.clear()
+
+    def resume(self) -> None:
+        self._set_state("running", only_from="paused")
+        self._resume.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._resume.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def _set_state(self, state: str, only_from: str) -> None:
+        with self._lock:
+            if self._status.get("state") == only_from:
+                self._status["state"] = state
+
+    def _open(self) -> Tuple[zmq.Socket, Optional[zmq.Context], Optional[bytes]]:
+        """The sending socket, the context to terminate with it, and the core's inject header."""
+        if self._context is not None:
+            sock = self._context.socket(zmq.XPUB)
+            sock.setsockopt(zmq.XPUB_NODROP, 1)
+            sock.set_hwm(self.settings.replay_sndhwm)
+            sock.setsockopt(zmq.LINGER, self.settings.linger_ms)
+            sock.connect(self.settings.inject_endpoint)
+            # XSUB hands a new peer its subscriptions as it attaches; until they
+            # arrive, sends would be dropped. No subscription, no reader to lose.
+            sock.poll(_ATTACH_TIMEOUT_MS, zmq.POLLIN)
+            return sock, None, None
+        ctx = zmq.Context(io_threads=1)
+        sock = ctx.socket(zmq.PUSH)
+        sock.set_hwm(self.settings.replay_sndhwm)
+        sock.setsockopt(zmq.LINGER, self.settings.linger_ms)
+        sock.connect(self.settings.core_inject_endpoint)
+        return sock, ctx, INJECT_PLAIN
+
+    def _run(self, start_ns: int, end_ns: int, prefixes: tuple[bytes, ...], speed: float) -> None:
+        sock, ctx, head = self._open()
+        batch_max = max(1, self.settings.publish_batch_max)
+        state = "finished"
+        sent = 0
+        last_ts: Optional[int] = None
+        batch: List[List[bytes]] = []
+        try:
+            records = self._reader.query(
+                start_ns=start_ns, end_ns=end_ns, topic_prefix=prefixes[0] if len(prefixes) == 1 else b""
+            )
+            base_ts: Optional[int] = None
+            wall0 = time.monotonic()
+            for ts_ns, frames in records:
+                if prefixes and not frames[0].startswith(prefixes):
+                    continue
+                offset = 0.0  # when it is due, relative to wall0
+                if speed > 0:
+                    if base_ts is None:
+                        base_ts = ts_ns
+                    offset = (ts_ns - base_ts) / 1e9 / speed
+                # Everything already due goes out in one batch; sleeping for
+                # sub-millisecond gaps costs more than it buys
+                if (speed > 0 and wall0 + offset - time.monotonic() > 0.001) or len(batch) >= batch_max:
+                    if batch:
+                        if not self._send(sock, head, batch):
+                            state = "stopped"
+                            break
+                        sent += len(batch)
+                        batch = []
+                        self._progress(sent, last_ts)
+                    if not self._resume.is_set():
+                        paused_at = time.monotonic()
+                        self._resume.wait()
+                        wall0 += time.monotonic() - paused_at
+                    if self._stop.is_set():
+                        state = "stopped"
+                        break
+                    if speed > 0:
+                        delay = wall0 + offset - time.monotonic()
+                        if delay > 0.001 and self._stop.wait(delay):
+                            state = "stopped"
+                            break
+                batch.append(frames)
+                last_ts = ts_ns
+            else:
+                if batch and self._send(sock, head, batch):
+                    sent += len(batch)
+                elif batch:
+                    state = "stopped"
+            self._progress(sent, last_ts if state == "finished" else None)
+        except Exception as e:
+            log.exception("Capture replay failed")
+            state = "error"
+            with self._lock:
+                self._status["error"] = str(e)
+        finally:
+            with self._lock:
+                self._status["state"] = state
+                self._status["sent"] = sent
+            sock.close(self.settings.linger_ms)
+            if ctx is not None:
+                ctx.term()
+        log.info("Capture replay %s after %d messages", state, sent)
+
+    def _progress(self, sent: int, ts_ns: Optional[int]) -> None:
+        with self._lock:
+            self._status["sent"] = sent
+            if ts_ns is not None:
+                self._status["position_ns"] = ts_ns
+
+    def _send(self, sock: zmq.Socket, head: Optional[bytes], batch: List[List[bytes]]) -> bool:
+        """Send a whole batch, waiting out the HWM; False if stopped first."""
+        if head is None:
+            _drain(sock)
+        for frames in batch:
+            msg = frames if head is None else [head, *frames]
+            while True:
+                try:
+                    sock.send_multipart(msg, flags=zmq.NOBLOCK)
+                    break
+                except zmq.Again:
+                    # At the HWM: wait for room, but stay responsive to stop()
+                    if self._stop.is_set():
+                        return False
+                    sock.poll(100, zmq.POLLOUT)
+        return True
+
+
+def _drain(sock: zmq.Socket) -> None:
+    # The XPUB queues the subscriptions it sees; we have no use for them
+    while True:
+        try:
+            sock.recv(flags=zmq.NOBLOCK)
+        except zmq.Again:
+            return
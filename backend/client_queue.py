@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict, deque
+from itertools import count
+from typing import Any, Deque, Hashable, Optional, Tuple
+
+# Slow-consumer policies: what a full client queue does with the next event
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DISCONNECT = "disconnect"
+CONFLATE = "conflate"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT, CONFLATE)
+
+# Items are (encoded frame, loop time it was queued); the frame may be shared across clients
+Item = Tuple[Any, float]
+
+
+class ClientClosed(Exception):
+    """The client fell too far behind under the disconnect policy."""
+
+
+class ClientQueue:
+    """
+    One client's pending frames, bounded to `maxsize` items and `max_bytes` of encoded
+    data (0 = count only). When a frame does not fit, the policy decides:
+
+    - drop_oldest evicts from the front until it fits;
+    - drop_newest refuses the new frame;
+    - disconnect closes the queue, as it also does once the oldest frame has waited
+      longer than `max_lag_ms`;
+    - conflate keeps only the latest frame per key (the topic), replacing a queued one
+      in place, so a slow client gets a current view of every topic instead of a
+      backlog; keyless frames and new keys evict the oldest entries when full.
+
+    Loop-thread only.
+    """
+
+    __slots__ = ("maxsize", "max_bytes", "policy", "max_lag_ms", "nbytes", "closed", "_items", "_keyed", "_ids", "_waiter")
+
+    def __init__(self, maxsize: int, max_bytes: int = 0, policy: str = DROP_OLDEST, max_lag_ms: float = 0.0) -> None:
+        self.maxsize = max(1, maxsize)
+        self.max_bytes = max_bytes
+        self.policy = DROP_OLDEST
+        self.max_lag_ms = max_lag_ms
+        self.nbytes = 0
+        self.closed = False
+        self._items: Deque[Item] = deque()
+        self._keyed: "OrderedDict[Hashable, Item]" = OrderedDict()
+        self._ids = count()  # keys for keyless frames while conflating
+        self._waiter: Optional[asyncio.Future] = None
+        self.set_policy(policy)
+
+    def set_policy(self, policy: str) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {', '.join(POLICIES)}")
+        if (policy == CONFLATE) != (self.policy == CONFLATE):
+            # Switch storage; queued frames keep their order
+            if policy == CONFLATE:
+                self._keyed = OrderedDict((next(self._ids), item) for item in self._items)
+                self._items.clear()
+            else:
+                self._items = deque(self._keyed.values())
+                self._keyed.clear()
+        self.policy = policy
+
+    def qsize(self) -> int:
+        return len(self._keyed) if self.policy == CONFLATE else len(self._items)
+
+    def empty(self) -> bool:
+        return not self.qsize()
+
+    def _oldest(self) -> Optional[Item]:
+        if self.policy == CONFLATE:
+            return next(iter(self._keyed.values()), None)
+        return self._items[0] if self._items else None
+
+    def _pop(self) -> Item:
+        item = self._keyed.popitem(last=False)[1] if self.policy == CONFLATE else self._items.popleft()
+        self.nbytes -= len(item[0])
+        return item
+
+    def _fits(self, size: int) -> bool:
+        n = self.qsize()
+        # An empty queue takes any frame, however large
+        return n == 0 or (n < self.maxsize and (self.max_bytes <= 0 or self.nbytes + size <= self.max_bytes))
+
+    def put(self, item: Item, key: Optional[Hashable] = None) -> Tuple[int, int]:
+        """
+        Queue a frame; returns (dropped for lack of room, replaced by it on the same key).
+        Check `closed` afterwards: the disconnect policy may have given up on the client.
+        """
+        if self.closed:
+            return 1, 0
+        size = len(item[0])
+        policy = self.policy
+        if policy == DISCONNECT and self.max_lag_ms > 0:
+            oldest = self._oldest()
+            if oldest is not None and (item[1] - oldest[1]) * 1000.0 > self.max_lag_ms:
+                self.close()
+                return 1, 0
+        replaced = 0
+        if policy == CONFLATE:
+            if key is None:
+                key = next(self._ids)
+            old = self._keyed.get(key)
+            if old is not None:
+                # Latest value for the key, at the key's place in the queue
+                self._keyed[key] = item
+                self.nbytes += size - len(old[0])
+                replaced = 1
+        dropped = 0
+        if not replaced and not self._fits(size):
+            if policy == DROP_NEWEST:
+                return 1, 0
+            if policy == DISCONNECT:
+                self.close()
+                return 1, 0
+            while not self._fits(size):
+                self._pop()
+                dropped += 1
+        elif replaced and self.max_bytes > 0:
+            while self.nbytes > self.max_bytes and len(self._keyed) > 1 and next(iter(self._keyed)) != key:
+                self._pop()
+                dropped += 1
+        if not replaced:
+            if policy == CONFLATE:
+                self._keyed[key] = item
+            else:
+                self._items.append(item)
+            self.nbytes += size
+        self._wake()
+        return dropped, replaced
+
+    def get_nowait(self) -> Item:
+        if self.closed:
+            raise ClientClosed()
+        if self.empty():
+            raise asyncio.QueueEmpty()
+        return self._pop()
+
+    async def get(self) -> Item:
+        while self.empty() and not self.closed:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        return self.get_nowait()
+
+    def close(self) -> None:
+        self.closed = True
+        self._items.clear()
+        self._keyed.clear()
+        self.nbytes = 0
+        self._wake()
+
+    def _wake(self) -> None:
+        waiter = self._waiter
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from pydantic import Field
+from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings
 
 
@@ -13,8 +13,57 @@ class Settings(BaseSettings):
     xsub_bind: str = "tcp://0.0.0.0:5551"  # publishers connect here
     xpub_bind: str = "tcp://0.0.0.0:5552"  # subscribers connect here
 
-    # Injection path (internal publisher -> hub XSUB)
-    inject_connect: str = "tcp://127.0.0.1:5551"
+    # Forwarding: "steerable" runs zmq.proxy_steerable in libzmq with capture on a side
+    # channel; "poll" keeps the Python zmq.Poller loop.
+    proxy_mode: str = "steerable"
+    capture_endpoint: str = "inproc://zmqhub-capture"
+    control_endpoint: str = "inproc://zmqhub-control"
+    tap_endpoint: str = "inproc://zmqhub-tap"  # also bound by XPUB, to tell lookalike frames on the mirror apart
+    capture_hwm: int = 10000
+    # Captured payload frames larger than this reach the bus as a preview of their first
+    # capture_max_bytes plus the real size (0 = full payloads). The capture log always
+    # stores full frames.
+    capture_max_bytes: int = 64 * 1024
+
+    # Last-value cache: send a subscriber that subscribes on XPUB, and only it, the
+    # latest message for its subscription. libzmq can address only one message to a
+    # new subscriber, so that is one cached value per subscription; every value under
+    # a prefix is served by the lvc_snapshot_bind ROUTER instead. Forces
+    # proxy_mode=poll, giving up the steerable proxy's forwarding inside libzmq.
+    lvc_enabled: bool = False
+    lvc_max_topics: int = 10000
+    lvc_max_bytes: int = 64 * 1024 * 1024
+    lvc_prefixes: list[str] = Field(default_factory=list)  # topics to cache (empty = all)
+    lvc_snapshot_bind: str = ""  # ROUTER for snapshots of every cached topic under a prefix (empty disables)
+
+    # On-disk capture log of raw frames (empty dir disables)
+    capture_dir: str = ""
+    capture_segment_bytes: int = 64 * 1024 * 1024
+    capture_retention_bytes: int = 1024 * 1024 * 1024
+    capture_retention_s: float = 24 * 3600.0
+    capture_flush_ms: float = 50.0  # group-commit window
+    capture_index_bytes: int = 64 * 1024  # sparse index granularity
+    capture_queue_size: int = 100000
+    capture_fsync: bool = False
+    replay_sndhwm: int = 100000  # re-injection of stored captures waits at this HWM
+
+    # Injection path: the hub's publisher and capture replay use an inproc endpoint
+    # that XSUB also binds.
+    inject_endpoint: str = "inproc://zmqhub-inject"
+    inject_hwm: int = 10000
+    publish_batch_max: int = 10000  # messages per publish_batch control frame
+    inject_timeout_ms: float = 5000.0  # POST /api/publish gives up after stalling this long
+    # Removed: the TCP address the injector and capture replay used to connect to. Both
+    # now go through inject_endpoint; setting it is refused rather than ignored.
+    inject_connect: str = ""
+
+    # Process layout: "embedded" runs the ZMQ side inside the web process; "worker"
+    # only serves HTTP/WS and attaches to a single `python -m backend.core` process,
+    # so uvicorn can run with --workers N.
+    hub_role: str = "embedded"
+    core_fanout_endpoint: str = "ipc:///tmp/zmqhub-fanout"  # core PUB -> workers
+    core_inject_endpoint: str = "ipc:///tmp/zmqhub-inject"  # workers PUSH -> core injector
+    core_fanout_hwm: int = 100000
 
     # CORS
     cors_origins: list[str] = Field(default_factory=lambda: ["*"])
@@ -22,9 +71,109 @@ class Settings(BaseSettings):
     # WebSocket limits
     ws_max_msg_size: int = 2 * 1024 * 1024
 
+    # Batched /ws/events framing (opt-in per client with ?batch=1 or set_protocol)
+    ws_batch_max: int = 500
+    ws_batch_flush_ms: float = 25.0
+
+    # Per-client limits for /ws/events (adjustable per client with set_limits):
+    # events/s through a token bucket of `burst` (0 = rate) and per-topic sampling
+    # rules such as [{"prefix": "md/", "every": 10}, {"prefix": "", "max_rate": 50}]
+    ws_rate_limit: float = 0.0  # 0 = unlimited
+    ws_rate_burst: float = 0.0
+    ws_sampling: list[dict] = Field(default_factory=list)
+
+    # Payload decoders by topic prefix (longest wins), e.g. [{"prefix": "md/", "type":
+    # "msgpack"}, {"prefix": "orders/", "type": "protobuf", "descriptor_set":
+    # "orders.desc", "message": "shop.Order"}, {"prefix": "x/", "type": "python",
+    # "callable": "mymod:decode"}]. Only messages some client would receive are
+    # decoded, on a pool of decoder_workers threads or processes.
+    decoders: list[dict] = Field(default_factory=list)
+    decoder_pool: str = "thread"
+    decoder_workers: int = 2
+    decoder_backlog: int = 10000  # messages in flight; beyond it they go out undecoded
+    decoder_timeout_ms: float = 1000.0  # a batch waits this long for its decodes
+
+    # Export sinks fed from the bus, each with its own buffer, batching, retries and
+    # thread, e.g. [{"type": "file", "path": "exports/bus", "gzip": true, "kinds":
+    # ["bus"]}, {"type": "http", "url": "http://127.0.0.1:9000/ingest"}, {"type":
+    # "tcp", "address": "127.0.0.1:9001", "include": ["md/"]}]. Embedded hubs only.
+    sinks: list[dict] = Field(default_factory=list)
+
     # Event buffering and backpressure
-    event_queue_size: int = 10000
+    event_queue_size: int = 10000  # pending ring between capture threads and the loop
     client_queue_size: int = 1000
+    client_queue_bytes: int = 16 * 1024 * 1024  # encoded bytes per client queue (0 = count only)
+    # What a full client queue does (per client with set_limits or ?policy=): drop_oldest,
+    # drop_newest, disconnect (also once the oldest queued event is max_lag_ms old) or
+    # conflate (latest event per topic)
+    client_policy: str = "drop_oldest"
+    client_max_lag_ms: float = 0.0
+    bus_batch_max: int = 1000  # max events fanned out per loop callback
+    bus_flush_interval_ms: float = 0.0  # 0 = flush on the next loop tick
+
+    # Replay ring of recent events for backfill/resume (0 events disables). The ring
+    # keeps bus messages on `replay_topics` prefixes (empty = every topic), and those
+    # topics count as wanted, so capture can only skip topics outside them that no
+    # client views. With the default, nothing is skipped; list the topics worth a
+    # backfill to let capture skip the rest.
+    replay_max_events: int = 10000
+    replay_max_bytes: int = 32 * 1024 * 1024
+    replay_topics: list[str] = Field(default_factory=list)
+
+    # Metrics: per-topic-prefix totals for the heaviest prefixes, cut at this many "/" levels
+    metrics_top_topics: int = 100
+    metrics_topic_depth: int = 2
+
+    # Topic directory: fixed-memory statistics of every captured message (sketched
+    # totals, the `topics_capacity` heaviest topics and prefixes per level, size
+    # quantiles), served by /api/topics and pushed as kind "stats" events
+    topics_enabled: bool = True
+    topics_capacity: int = 1000  # tracked keys per level
+    topics_depth: int = 2  # "/"-separated prefix levels
+    topics_sketch_width: int = 4096  # count-min counters per row (4 rows)
+    topics_interval_ms: float = 2000.0  # rate window and stats event period
+    topics_push: int = 20  # topics/prefixes per level in each stats event (0 = no events)
+
+    # Hub-to-hub bridge, enabled by bridge_bind and/or bridge_links: links to other
+    # hubs' bridge_bind endpoints carry, in batches, only the topics someone subscribed
+    # to on the far side; (origin hub, sequence) ids drop duplicates and loops in meshes
+    bridge_id: str = ""  # this hub's name on links (empty = random per start)
+    bridge_bind: str = ""  # where other hubs' links connect, e.g. tcp://0.0.0.0:5553
+    bridge_links: list[str] = Field(default_factory=list)  # other hubs' bridge_bind endpoints
+    bridge_local_endpoint: str = "inproc://zmqhub-bridge"  # also bound by XPUB
+    bridge_batch_max: int = 1000  # messages per batch
+    bridge_batch_bytes: int = 1024 * 1024
+    bridge_batch_ms: float = 5.0  # a batch waits at most this long to fill
+    bridge_hwm: int = 10000  # messages on the bridge's local sockets
+    bridge_link_hwm: int = 100  # batches queued per link; beyond that they are dropped
+    bridge_max_hops: int = 4  # links a message or an interest crosses at most
+    bridge_dedup: int = 100000  # recent message ids remembered per hub
+    bridge_heartbeat_ms: float = 1000.0  # pings and interest resync; 3 missed lose the link
+
+    # Profiling (off by default): per-stage latency of bus messages from receipt to the
+    # WebSocket send and event-loop lag at /debug/stages, and an all-thread sampling
+    # profiler at /debug/profile
+    profiling_enabled: bool = False
+    profiling_lag_interval_ms: float = 100.0  # event-loop lag probe period
+    profiling_max_s: float = 60.0  # longest /debug/profile run
+
+    # Socket monitor events: events listed in monitor_aggregate pass `monitor_burst`
+    # times per socket/endpoint and window, the rest as one counted summary event
+    monitor_window_ms: float = 1000.0
+    monitor_burst: int = 3
+    monitor_aggregate: list[str] = Field(
+        default_factory=lambda: [
+            "EVENT_CONNECT_DELAYED",
+            "EVENT_CONNECT_RETRIED",
+            "EVENT_CLOSED",  # one per failed connect attempt
+            "EVENT_ACCEPT_FAILED",
+            "EVENT_CLOSE_FAILED",
+            "EVENT_HANDSHAKE_FAILED_NO_DETAIL",
+            "EVENT_HANDSHAKE_FAILED_PROTOCOL",
+            "EVENT_HANDSHAKE_FAILED_AUTH",
+        ]
+    )
+    monitor_recent: int = 100  # closed connections kept in the connection table
 
     # Heartbeats
     heartbeat_interval_s: float = 15.0
@@ -38,6 +187,17 @@ class Settings(BaseSettings):
     xpub_sndhwm: int = 10000
     linger_ms: int = 0
 
+    @field_validator("inject_connect")
+    @classmethod
+    def _no_inject_connect(cls, value: str) -> str:
+        if value:
+            raise ValueError(
+                "inject_connect is no longer used: publishes and capture replay go through the "
+                "in-process inject_endpoint, which XSUB binds; unset ZMQHUB_INJECT_CONNECT "
+                "(publishers outside the hub connect to xsub_bind)"
+            )
+        return value
+
     class Config:
         env_prefix = "ZMQHUB_"
         env_file = ".env"
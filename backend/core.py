@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import logging
+import signal
+import threading
+
+import zmq
+
+from .bridge import Bridge
+from .capture_log import CaptureWriter
+from .config import Settings
+from .fanout import INJECT_ECHO, FanoutSink
+from .logging_config import setup_logging
+from .publisher import Publisher
+from .zmq_proxy import Proxy
+
+log = logging.getLogger("zmqhub.core")
+
+
+class Core:
+    """
+    The single ZMQ side of a multi-worker deployment: proxy, capture, capture log and
+    the injector, with every event fanned out to the web workers (hub_role=worker)
+    over `core_fanout_endpoint`. Workers push UI publishes to `core_inject_endpoint`.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.sink = FanoutSink(settings)
+        self.capture_log = CaptureWriter(settings) if settings.capture_dir else None
+        self._proxy = Proxy(settings, self.sink, capture_log=self.capture_log)  # type: ignore[arg-type]
+        self._publisher = Publisher(settings, self.sink)  # type: ignore[arg-type]
+        self._bridge = Bridge(settings, self._proxy) if settings.bridge_bind or settings.bridge_links else None
+        self._stop = threading.Event()
+        self._inject_thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self.sink.start()
+        if self.capture_log is not None:
+            self.capture_log.start()
+        self._proxy.start()
+        self._publisher.start(context=self._proxy.context)
+        if self._bridge is not None:
+            self._bridge.start()
+        self._inject_thread = threading.Thread(target=self._inject_loop, name="zmqhub-core-inject", daemon=True)
+        self._inject_thread.start()
+        log.info("Core started: fan-out %s, inject %s", self.settings.core_fanout_endpoint, self.settings.core_inject_endpoint)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._inject_thread:
+            self._inject_thread.join(timeout=2.0)
+        self._publisher.stop()
+        if self._bridge is not None:
+            self._bridge.stop()
+        self._proxy.stop()
+        if self.capture_log is not None:
+            self.capture_log.stop()
+        self.sink.stop()
+        log.info("Core stopped")
+
+    def _inject_loop(self) -> None:
+        ctx = zmq.Context(io_threads=1)
+        sock = ctx.socket(zmq.PULL)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.bind(self.settings.core_inject_endpoint)
+        try:
+            while not self._stop.is_set():
+                if not sock.poll(100):
+                    continue
+                head, *frames = sock.recv_multipart()
+                if not frames:
+                    continue
+                # This thread owns the publisher, so it can wait out backpressure;
+                # meanwhile the workers' PUSH sockets queue up and then refuse.
+                while not self._publisher.publish_frames(frames, echo=head == INJECT_ECHO) and not self._stop.is_set():
+                    self._publisher.wait_writable(100)
+        finally:
+            sock.close(0)
+            ctx.term()
+
+
+def main() -> None:
+    settings = Settings()
+    setup_logging(settings)
+    core = Core(settings)
+    done = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: done.set())
+    core.start()
+    try:
+        done.wait()
+    finally:
+        core.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import base64
+import importlib
+import json
+import logging
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+log = logging.getLogger("zmqhub.decoders")
+
+# A decoder turns (topic, payload frames) into a JSON-serializable value
+DecodeFn = Callable[[bytes, List[bytes]], Any]
+
+TYPES = ("json", "msgpack", "protobuf", "python")
+POOLS = ("thread", "process")
+
+
+@dataclass(frozen=True)
+class DecoderSpec:
+    """
+    Payload decoder for topics starting with `prefix`: json, msgpack, protobuf
+    (`message` is the full type name, looked up in the FileDescriptorSet at
+    `descriptor_set`) or python (`callable` is "module:function", called with the
+    topic and payload frames).
+    """
+
+    prefix: str
+    type: str
+    message: str = ""
+    descriptor_set: str = ""
+    callable: str = ""
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "DecoderSpec":
+        if not isinstance(data, dict):
+            raise ValueError("decoders must be objects")
+        values = {k: data.get(k) or "" for k in ("prefix", "type", "message", "descriptor_set", "callable")}
+        for key, value in values.items():
+            if not isinstance(value, str):
+                raise ValueError(f"{key} must be a string")
+        spec = cls(**values)
+        if spec.type not in TYPES:
+            raise ValueError(f"decoder type must be one of {', '.join(TYPES)}")
+        if spec.type == "protobuf" and not (spec.message and spec.descriptor_set):
+            raise ValueError("protobuf decoders need message and descriptor_set")
+        if spec.type == "python" and ":" not in spec.callable:
+            raise ValueError("python decoders need callable as 'module:function'")
+        return spec
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: v for k, v in self.__dict__.items() if v}
+
+
+def parse_decoders(data: Any) -> Tuple[DecoderSpec, ...]:
+    if data is None:
+        return ()
+    if not isinstance(data, list):
+        raise ValueError("decoders must be an array")
+    return tuple(DecoderSpec.from_dict(d) for d in data)
+
+
+def _jsonable(value: Any) -> Any:
+    """Make decoded values JSON-safe: bytes become base64, keys strings."""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    if isinstance(value, dict):
+        return {k if isinstance(k, str) else str(_jsonable(k)): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return str(value)
+
+
+def _per_frame(decode: Callable[[bytes], Any]) -> DecodeFn:
+    def run(topic: bytes, frames: List[bytes]) -> Any:
+        values = [decode(f) for f in frames]
+        return values[0] if len(values) == 1 else values
+
+    return run
+
+
+def _msgpack() -> DecodeFn:
+    try:
+        import msgpack
+    except ImportError:
+        raise ValueError("msgpack decoders need the msgpack package: pip install zmqhub[msgpack]") from None
+    return _per_frame(lambda b: msgpack.unpackb(b, raw=False, strict_map_key=False))
+
+
+def _protobuf(spec: DecoderSpec) -> DecodeFn:
+    try:
+        from google.protobuf import descriptor_pb2, descriptor_pool, json_format, message_factory
+    except ImportError:
+        raise ValueError("protobuf decoders need the protobuf package: pip install zmqhub[protobuf]") from None
+    with open(spec.descriptor_set, "rb") as f:
+        fds = descriptor_pb2.FileDescriptorSet.FromString(f.read())
+    pool = descriptor_pool.DescriptorPool()
+    for fd in fds.file:
+        pool.Add(fd)
+    try:
+        desc = pool.FindMessageTypeByName(spec.message)
+    except KeyError:
+        raise ValueError(f"message {spec.message} not in {spec.descriptor_set}") from None
+    if hasattr(message_factory, "GetMessageClass"):
+        cls = message_factory.GetMessageClass(desc)
+    else:  # protobuf < 4.21
+        cls = message_factory.MessageFactory(pool).GetPrototype(desc)
+    return _per_frame(lambda b: json_format.MessageToDict(cls.FromString(b), preserving_proto_field_name=True))
+
+
+def _python(spec: DecoderSpec) -> DecodeFn:
+    module, _, name = spec.callable.partition(":")
+    try:
+        fn = getattr(importlib.import_module(module), name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f"cannot load decoder {spec.callable}: {e}") from None
+    if not callable(fn):
+        raise ValueError(f"decoder {spec.callable} is not callable")
+    return fn
+
+
+def build(spec: DecoderSpec) -> DecodeFn:
+    if spec.type == "json":
+        return _per_frame(json.loads)
+    if spec.type == "msgpack":
+        return _msgpack()
+    if spec.type == "protobuf":
+        return _protobuf(spec)
+    return _python(spec)
+
+
+# Decoders of the current process; pool workers build their own from the specs
+_decoders: List[DecodeFn] = []
+
+
+def _init_worker(specs: Sequence[DecoderSpec]) -> None:
+    global _decoders
+    _decoders = [build(s) for s in specs]
+
+
+# One job: (decoder index, topic, payload frames) -> (value, error)
+Job = Tuple[int, bytes, List[bytes]]
+Result = Tuple[Any, Optional[str]]
+
+
+def _run_jobs(jobs: List[Job]) -> List[Result]:
+    out: List[Result] = []
+    for index, topic, frames in jobs:
+        try:
+            out.append((_jsonable(_decoders[index](topic, frames)), None))
+        except Exception as e:
+            out.append((None, f"{type(e).__name__}: {e}"))
+    return out
+
+
+class DecoderPool:
+    """
+    Decoder registry keyed by topic prefix (the longest matching prefix wins) and
+    the bounded thread or process pool that runs it, so slow decoders never run on
+    the event loop or a ZMQ thread. Decoders are built once up front to surface
+    configuration errors at startup, then again in every pool worker.
+    """
+
+    def __init__(self, specs: Sequence[DecoderSpec], pool: str = "thread", workers: int = 2) -> None:
+        if pool not in POOLS:
+            raise ValueError(f"decoder pool must be one of {', '.join(POOLS)}")
+        self.specs = tuple(sorted(specs, key=lambda s: len(s.prefix), reverse=True))
+        for spec in self.specs:
+            build(spec)
+        self._prefixes = [(s.prefix.encode("utf-8"), i) for i, s in enumerate(self.specs)]
+        self.pool = pool
+        self.workers = max(1, workers)
+        self._executor: Optional[Executor] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.specs)
+
+    def match(self, topic: bytes) -> Optional[int]:
+        for prefix, index in self._prefixes:
+            if topic.startswith(prefix):
+                return index
+        return None
+
+    def name(self, index: int) -> str:
+        return self.specs[index].type
+
+    def start(self) -> None:
+        if self._executor is not None or not self.specs:
+            return
+        if self.pool == "process":
+            # Spawned, not forked: the parent runs ZMQ and event-loop threads
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker, initargs=(self.specs,)
+            )
+            for _ in range(self.workers):
+                self._executor.submit(_run_jobs, [])  # start the workers now, not on the first message
+        else:
+            self._executor = ThreadPoolExecutor(
+                self.workers, thread_name_prefix="zmqhub-decode", initializer=_init_worker, initargs=(self.specs,)
+            )
+        log.info("Decoding %d topic prefixes on %d %s workers", len(self.specs), self.workers, self.pool)
+
+    def submit(self, jobs: List[Job]) -> Future:
+        if self._executor is None:
+            self.start()
+        return self._executor.submit(_run_jobs, jobs)  # type: ignore[union-attr]
+
+    def close(self) -> None:
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # Worker processes stuck in a decoder would otherwise hold up interpreter exit
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for proc in processes:
+            proc.terminate()
@@ -1,78 +1,1070 @@
 from __future__ import annotations
 
 import asyncio
-from dataclasses import dataclass
-from typing import Any, Dict, List, Set
+import base64
+import json
+import secrets
+import struct
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Deque, Dict, FrozenSet, List, Optional, Sequence, Set, Tuple, Union
 from datetime import datetime, timezone
 
+from .client_queue import CONFLATE, DROP_NEWEST, POLICIES, ClientQueue
+from .decoders import DecoderPool, Job
+from .limits import DROP, HOLD, SamplingRule, TokenBucket, TopicSampler, parse_rules
+from .metrics import CAPTURE_TO_LOOP, TopK, topic_prefix
+from .replay_buffer import ReplayBuffer
+
+if TYPE_CHECKING:
+    from .profiling import StageTracer
+    from .sinks import Sink
+
+try:
+    import orjson
+except ImportError:  # optional speedup: pip install zmqhub[fast]
+    orjson = None
+
+
+if orjson is not None:
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(obj: Any) -> str:
+        return _encoder.encode(obj)
+
 
 def now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def iso_from_ns(ts_ns: int) -> str:
+    return datetime.fromtimestamp(ts_ns / 1e9, timezone.utc).isoformat()
+
+
+def _decode_part(b: bytes) -> Tuple[str, str]:
+    try:
+        return b.decode("utf-8"), "utf8"
+    except UnicodeDecodeError:
+        return base64.b64encode(b).decode("ascii"), "base64"
+
+
+# Binary /ws/events record (little-endian), self-delimiting so a batch is a plain
+# concatenation:
+#   u32 record_len | u8 version | u8 flags | u16 nparts | u64 seq | f64 ts_ms
+#   | u8 kind_len | u8 source_len | kind | source | nparts * u32 size | part bytes...
+# record_len counts everything after itself. With FLAG_JSON the single part is the
+# UTF-8 JSON of a non-bus event (hello, monitor, inject) or of a bus event whose
+# payload a topic decoder turned into JSON; it carries its own ts.
+# With FLAG_TRUNCATED the parts are capture previews and nparts * u32 original
+# sizes follow the part bytes.
+BIN_VERSION = 1
+BIN_FLAG_JSON = 0x01
+BIN_FLAG_TRUNCATED = 0x02
+_BIN_HEAD = struct.Struct("<IBBHQdBB")
+_BIN_SIZE = struct.Struct("<I")
+
+
+def pack_binary(
+    seq: int,
+    ts_ms: float,
+    kind: str,
+    source: str,
+    parts: List[bytes],
+    flags: int = 0,
+    full_sizes: Optional[List[int]] = None,
+) -> bytes:
+    k, s = kind.encode("utf-8")[:255], source.encode("utf-8")[:255]
+    sizes = b"".join(_BIN_SIZE.pack(len(p)) for p in parts)
+    trailer = b""
+    if full_sizes is not None:
+        flags |= BIN_FLAG_TRUNCATED
+        trailer = b"".join(_BIN_SIZE.pack(n) for n in full_sizes)
+    body = len(k) + len(s) + len(sizes) + sum(len(p) for p in parts) + len(trailer)
+    head = _BIN_HEAD.pack(_BIN_HEAD.size - 4 + body, BIN_VERSION, flags, len(parts), seq, ts_ms, len(k), len(s))
+    return b"".join([head, k, s, sizes, *parts, trailer])
+
+
+class BusEvent:
+    """
+    A captured bus message kept as raw frames. Capture only records the frames and a
+    monotonic timestamp; the topic, decoded payload, ISO time, event dict and JSON text
+    are built on first use and cached, so messages nobody views are never decoded.
+    The bus assigns `seq` before any of them are built. When capture keeps only a
+    preview of large frames, `sizes` holds the original frame sizes. A topic decoder's
+    result, once set, replaces the payload in the event dict, and binary clients get
+    that dict as a JSON record.
+    """
+
+    __slots__ = (
+        "source", "frames", "sizes", "ts_ns", "seq", "decoded", "trace",
+        "_wall_ns", "_ts", "_topic", "_parts", "_dict", "_json", "_bin",
+    )
+
+    kind = "bus"
+
+    def __init__(
+        self,
+        source: str,
+        frames: List[bytes],
+        ts_ns: Optional[int] = None,
+        wall_ns: Optional[int] = None,
+        sizes: Optional[List[int]] = None,
+    ) -> None:
+        self.source = source
+        self.frames = frames
+        self.sizes = sizes
+        self.ts_ns = time.monotonic_ns() if ts_ns is None else ts_ns
+        self.seq: Optional[int] = None
+        self.decoded: Optional[Tuple[str, Any, Optional[str]]] = None  # (decoder, value, error)
+        # With profiling on: [received, flushed to the loop], monotonic ns
+        self.trace: Optional[List[int]] = None
+        # Stored captures pass their own wall-clock time
+        self._wall_ns = wall_ns
+        self._ts: Optional[str] = None
+        self._topic: Optional[Tuple[str, str]] = None
+        self._parts: Optional[List[Tuple[str, str]]] = None
+        self._dict: Optional[Dict[str, Any]] = None
+        self._json: Optional[str] = None
+        self._bin: Optional[bytes] = None
+
+    @property
+    def wall_ns(self) -> int:
+        if self._wall_ns is None:
+            # Anchor the monotonic stamp to the wall clock when it is first needed
+            self._wall_ns = self.ts_ns + time.time_ns() - time.monotonic_ns()
+        return self._wall_ns
+
+    @property
+    def ts(self) -> str:
+        if self._ts is None:
+            self._ts = iso_from_ns(self.wall_ns)
+        return self._ts
+
+    @property
+    def nbytes(self) -> int:
+        return sum(self.sizes) if self.sizes is not None else sum(map(len, self.frames))
+
+    def _topic_part(self) -> Tuple[str, str]:
+        if self._topic is None:
+            self._topic = _decode_part(self.frames[0] if self.frames else b"")
+        return self._topic
+
+    def _payload_parts(self) -> List[Tuple[str, str]]:
+        if self._parts is None:
+            self._parts = [_decode_part(f) for f in self.frames[1:]]
+        return self._parts
+
+    @property
+    def topic(self) -> str:
+        return self._topic_part()[0]
+
+    def set_decoded(self, decoder: str, value: Any, error: Optional[str] = None) -> None:
+        self.decoded = (decoder, value, error)
+        self._dict = self._json = self._bin = None
+
+    @property
+    def payload(self) -> Any:
+        parts = self._payload_parts()
+        if not parts:
+            return None
+        if len(parts) == 1:
+            return parts[0][0]
+        return [s for s, _ in parts]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Dict-style access for filters; only decodes what the key needs."""
+        if key == "kind":
+            return self.kind
+        if key == "source":
+            return self.source
+        if key == "topic":
+            return self.topic
+        if key == "payload":
+            return self.payload
+        return self.to_dict().get(key, default)
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self._dict is None:
+            topic, topic_enc = self._topic_part()
+            ev: Dict[str, Any] = {
+                "ts": self.ts,
+                "kind": self.kind,
+                "source": self.source,
+                "topic": topic,
+                "payload": self.payload,
+                "meta": {
+                    "topic_encoding": topic_enc,
+                    "payload_encodings": [enc for _, enc in self._payload_parts()],
+                    "parts": len(self.frames),
+                    "sizes": self.sizes if self.sizes is not None else [len(x) for x in self.frames],
+                },
+            }
+            if self.sizes is not None:
+                ev["meta"]["truncated"] = True
+            if self.decoded is not None:
+                decoder, value, error = self.decoded
+                ev["meta"]["decoder"] = decoder
+                if error is None:
+                    ev["payload"] = value
+                else:
+                    ev["meta"]["decode_error"] = error
+            if self.seq is not None:
+                ev["seq"] = self.seq
+            self._dict = ev
+        return self._dict
+
+    def copy(self) -> "BusEvent":
+        """The same numbered (and decoded) message, without any cached encodings."""
+        other = BusEvent(self.source, self.frames, self.ts_ns, self.wall_ns, self.sizes)
+        other.seq = self.seq
+        other.decoded = self.decoded
+        return other
+
+    def encode(self) -> str:
+        if self._json is None:
+            self._json = dumps(self.to_dict())
+        return self._json
+
+    def encode_binary(self) -> bytes:
+        """Raw frames behind a binary header: no decoding, base64 or JSON at all."""
+        if self._bin is None and self.decoded is not None:
+            self._bin = pack_binary(
+                self.seq or 0, self.wall_ns / 1e6, self.kind, self.source, [self.encode().encode("utf-8")], flags=BIN_FLAG_JSON
+            )
+        if self._bin is None:
+            self._bin = pack_binary(
+                self.seq or 0, self.wall_ns / 1e6, self.kind, self.source, self.frames, full_sizes=self.sizes
+            )
+        return self._bin
+
+
+Event = Union[Dict[str, Any], BusEvent]
+
+
+def encode_event(event: Event) -> str:
+    return event.encode() if isinstance(event, BusEvent) else dumps(event)
+
+
+def encode_event_binary(event: Event) -> bytes:
+    if isinstance(event, BusEvent):
+        return event.encode_binary()
+    return pack_binary(
+        event.get("seq") or 0,
+        0.0,
+        event.get("kind") or "",
+        event.get("source") or "",
+        [dumps(event).encode("utf-8")],
+        flags=BIN_FLAG_JSON,
+    )
+
+
 @dataclass
 class BusStats:
     published: int = 0
+    delivered: int = 0
     dropped_ws: int = 0
+    dropped_queue: int = 0
+    dropped_rate: int = 0
+    dropped_sampled: int = 0
+    dropped_conflated: int = 0
+    disconnected_slow: int = 0
     subscribers: int = 0
+    pending: int = 0
+    batches: int = 0
+    batch_avg: float = 0.0
+    batch_max: int = 0
+    flush_latency_ms_last: float = 0.0
+    flush_latency_ms_max: float = 0.0
+    decoded: int = 0
+    decode_errors: int = 0
+    decode_skipped: int = 0
+    decode_timeouts: int = 0
+    decoding: int = 0
+
+
+def _str_list(data: Dict[str, Any], key: str) -> Tuple[str, ...]:
+    value = data.get(key)
+    if value is None:
+        return ()
+    if not (isinstance(value, list) and all(isinstance(x, str) for x in value)):
+        raise ValueError(f"{key} must be an array of strings")
+    return tuple(dict.fromkeys(value))
+
+
+@dataclass(frozen=True)
+class EventFilter:
+    """Per-client event filter. Topic prefixes only apply to events that carry a topic."""
+
+    include: Tuple[str, ...] = ()
+    exclude: Tuple[str, ...] = ()
+    kinds: FrozenSet[str] = frozenset()
+    sources: FrozenSet[str] = frozenset()
+    text: str = ""
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "EventFilter":
+        text = data.get("text") or ""
+        if not isinstance(text, str):
+            raise ValueError("text must be a string")
+        return cls(
+            include=_str_list(data, "include"),
+            exclude=_str_list(data, "exclude"),
+            kinds=frozenset(_str_list(data, "kinds")),
+            sources=frozenset(_str_list(data, "sources")),
+            text=text,
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return not (self.include or self.exclude or self.kinds or self.sources or self.text)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "include": list(self.include),
+            "exclude": list(self.exclude),
+            "kinds": sorted(self.kinds),
+            "sources": sorted(self.sources),
+            "text": self.text,
+        }
+
+    def accepts(self, event: Event) -> bool:
+        """Check everything except include prefixes, which FilterIndex resolves."""
+        if self.kinds and event.get("kind") not in self.kinds:
+            return False
+        if self.sources and event.get("source") not in self.sources:
+            return False
+        if self.exclude:
+            topic = event.get("topic")
+            if isinstance(topic, str) and topic.startswith(self.exclude):
+                return False
+        if self.text:
+            payload = event.get("payload")
+            if isinstance(payload, list):
+                return any(isinstance(p, str) and self.text in p for p in payload)
+            return isinstance(payload, str) and self.text in payload
+        return True
+
+
+class Subscriber:
+    """
+    One /ws/events client: its queue of pre-encoded events, current filter and
+    framing. With batch=True up to batch_max queued events, or whatever arrives within
+    flush_ms of the first one, are sent as a single JSON array frame. With binary=True
+    (fixed at connect) events are binary records and a batch is their concatenation.
+    An optional token bucket caps the client's event rate and a TopicSampler thins
+    individual topics; the queue's slow-consumer policy decides what a full queue
+    gives up. `drops` counts what was not delivered, by reason.
+    """
+
+    __slots__ = (
+        "id", "queue", "filter", "batch", "batch_max", "flush_ms", "binary",
+        "bucket", "sampler", "release", "drops",
+    )
+
+    def __init__(
+        self,
+        queue: ClientQueue,
+        batch: bool = False,
+        batch_max: int = 500,
+        flush_ms: float = 25.0,
+        binary: bool = False,
+    ) -> None:
+        self.id = secrets.token_hex(8)
+        # Items are (encoded event, loop time it was queued), shared across clients
+        self.queue = queue
+        self.filter = EventFilter()
+        self.bucket: Optional[TokenBucket] = None
+        self.sampler: Optional[TopicSampler] = None
+        self.release: Optional[asyncio.TimerHandle] = None  # pending release of held samples
+        self.drops = {"queue_full": 0, "rate_limit": 0, "sampled": 0, "conflated": 0}
+        self.batch = batch
+        self.batch_max = batch_max
+        self.flush_ms = flush_ms
+        self.binary = binary
+
+    def encode(self, event: Event) -> Union[str, bytes]:
+        return encode_event_binary(event) if self.binary else encode_event(event)
+
+    def join(self, items: List[Any], batch: bool) -> Union[str, bytes]:
+        """
+        One WebSocket frame from already encoded events, framed by the `batch` setting
+        they were collected under (set_protocol may change it meanwhile).
+        """
+        if self.binary:
+            return b"".join(items)
+        return "[" + ",".join(items) + "]" if batch else items[0]
+
+    def set_protocol(self, data: Dict[str, Any]) -> None:
+        batch = data.get("batch", self.batch)
+        batch_max = data.get("batch_max", self.batch_max)
+        flush_ms = data.get("flush_ms", self.flush_ms)
+        if data.get("binary", self.binary) != self.binary:
+            raise ValueError("binary can only be chosen when connecting")
+        if not isinstance(batch, bool):
+            raise ValueError("batch must be a boolean")
+        if not isinstance(batch_max, int) or isinstance(batch_max, bool) or not 1 <= batch_max <= 10000:
+            raise ValueError("batch_max must be an integer between 1 and 10000")
+        if not isinstance(flush_ms, (int, float)) or isinstance(flush_ms, bool) or not 0 <= flush_ms <= 1000:
+            raise ValueError("flush_ms must be a number between 0 and 1000")
+        self.batch, self.batch_max, self.flush_ms = batch, batch_max, float(flush_ms)
+
+    def configure_limits(self, rate: float, burst: float, rules: Tuple[SamplingRule, ...]) -> None:
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        # Messages held for interval sampling carry over; ones without a rule now are released next
+        held = self.sampler.held if self.sampler is not None else {}
+        self.sampler = TopicSampler(rules) if rules or held else None
+        if self.sampler is not None:
+            self.sampler.held.update(held)
+
+    def set_limits(self, data: Dict[str, Any]) -> None:
+        """Partial update from a control message; absent keys keep their values."""
+        current = self.limits()
+        rate = data.get("rate", current["rate"])
+        burst = data.get("burst", current["burst"])
+        max_lag_ms = data.get("max_lag_ms", current["max_lag_ms"])
+        for key, value in (("rate", rate), ("burst", burst), ("max_lag_ms", max_lag_ms)):
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+                raise ValueError(f"{key} must be a non-negative number")
+        if "sampling" in data:
+            rules = parse_rules(data["sampling"])
+        else:
+            rules = self.sampler.rules if self.sampler is not None else ()
+        policy = data.get("policy", current["policy"])
+        if not isinstance(policy, str):
+            raise ValueError("policy must be a string")
+        self.queue.set_policy(policy)
+        self.queue.max_lag_ms = float(max_lag_ms)
+        self.configure_limits(float(rate), float(burst), rules)
+
+    def limits(self) -> Dict[str, Any]:
+        bucket = self.bucket
+        return {
+            "rate": bucket.rate if bucket is not None else 0.0,
+            "burst": bucket.burst if bucket is not None else 0.0,
+            "sampling": [r.to_dict() for r in self.sampler.rules] if self.sampler is not None else [],
+            "policy": self.queue.policy,
+            "max_lag_ms": self.queue.max_lag_ms,
+        }
+
+    def protocol(self) -> Dict[str, Any]:
+        return {"batch": self.batch, "batch_max": self.batch_max, "flush_ms": self.flush_ms, "binary": self.binary}
+
+    async def next_frame(self) -> Tuple[Union[str, bytes], float]:
+        """
+        Wait for the next WebSocket frame: one event, or a batch of events.
+        Also returns when the oldest event in the frame was queued.
+        """
+        q = self.queue
+        first, queued_at = await q.get()
+        batch = self.batch
+        if not batch:
+            return first, queued_at
+        if q.qsize() < self.batch_max - 1 and self.flush_ms > 0:
+            # Coalesce whatever arrives within the flush window into this frame
+            await asyncio.sleep(self.flush_ms / 1000.0)
+        items = [first]
+        while len(items) < self.batch_max:
+            try:
+                items.append(q.get_nowait()[0])
+            except asyncio.QueueEmpty:
+                break
+        return self.join(items, batch), queued_at
+
+
+class _FilterGroup:
+    __slots__ = ("filter", "subs")
+
+    def __init__(self, flt: EventFilter) -> None:
+        self.filter = flt
+        self.subs: Set[Subscriber] = set()
+
+
+@dataclass
+class _TrieNode:
+    children: Dict[str, "_TrieNode"] = field(default_factory=dict)
+    groups: List[_FilterGroup] = field(default_factory=list)
+
+
+class FilterIndex:
+    """
+    Groups subscribers by identical filter and resolves include prefixes with a shared
+    trie, so matching an event costs O(len(topic) + distinct filters hit) rather than
+    O(subscribers). Topic lookups are memoized until the set of filters changes.
+    """
+
+    _CACHE_MAX = 10000
+
+    def __init__(self) -> None:
+        self._groups: Dict[EventFilter, _FilterGroup] = {}
+        self._unprefixed: List[_FilterGroup] = []
+        self._root = _TrieNode()
+        self._cache: Dict[str, List[_FilterGroup]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(g.subs) for g in self._groups.values())
+
+    def filters(self) -> List[EventFilter]:
+        return list(self._groups)
+
+    def add(self, sub: Subscriber) -> None:
+        group = self._groups.get(sub.filter)
+        if group is None:
+            group = _FilterGroup(sub.filter)
+            self._groups[sub.filter] = group
+            self._rebuild()
+        group.subs.add(sub)
+
+    def discard(self, sub: Subscriber) -> None:
+        group = self._groups.get(sub.filter)
+        if group is None:
+            return
+        group.subs.discard(sub)
+        if not group.subs:
+            del self._groups[sub.filter]
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        self._cache.clear()
+        self._unprefixed = []
+        self._root = _TrieNode()
+        for group in self._groups.values():
+            if not group.filter.include:
+                self._unprefixed.append(group)
+                continue
+            for prefix in group.filter.include:
+                node = self._root
+                for ch in prefix:
+                    node = node.children.setdefault(ch, _TrieNode())
+                node.groups.append(group)
+
+    def _topic_groups(self, topic: str) -> List[_FilterGroup]:
+        groups = self._cache.get(topic)
+        if groups is not None:
+            return groups
+        groups = list(self._unprefixed)
+        seen = {id(g) for g in groups}
+        node: Optional[_TrieNode] = self._root
+        for ch in topic:
+            for g in node.groups:
+                if id(g) not in seen:
+                    seen.add(id(g))
+                    groups.append(g)
+            node = node.children.get(ch)
+            if node is None:
+                break
+        if node is not None:
+            for g in node.groups:
+                if id(g) not in seen:
+                    groups.append(g)
+        if len(self._cache) >= self._CACHE_MAX:
+            self._cache.clear()
+        self._cache[topic] = groups
+        return groups
+
+    def match(self, event: Event) -> List[Subscriber]:
+        topic = event.get("topic")
+        if isinstance(topic, str):
+            groups = self._topic_groups(topic)
+        else:
+            groups = list(self._groups.values())
+        out: List[Subscriber] = []
+        for g in groups:
+            if g.filter.is_open or g.filter.accepts(event):
+                out.extend(g.subs)
+        return out
+
+
+def _retained(event: Event, prefixes: Tuple[str, ...]) -> bool:
+    """Whether a replay buffer limited to topic `prefixes` keeps the event; non-bus events always."""
+    if isinstance(event, BusEvent):
+        return event.topic.startswith(prefixes)
+    if event.get("kind") != "bus":
+        return True
+    topic = event.get("topic")
+    return isinstance(topic, str) and topic.startswith(prefixes)
+
+
+def _conflation_key(event: Event) -> Optional[str]:
+    # Bus messages conflate per topic; anything else is kept in order
+    if isinstance(event, BusEvent):
+        return event.topic
+    return event.get("topic") if event.get("kind") == "bus" else None
 
 
 class EventBus:
     """
     Simple in-process async fan-out bus with per-subscriber bounded queues.
+    Each event is JSON-encoded once, only if some client matches it, and the same str
+    is queued for every matching client.
     publish() must be called from the event loop thread.
-    publish_threadsafe() can be called from other threads.
+    publish_threadsafe() can be called from other threads; events are appended to a
+    bounded ring and drained on the loop in batches, one scheduled callback at a time.
+    With `decoders`, bus messages on decoded topics that some client would receive are
+    decoded on the decoder pool and held until then; messages on other topics are
+    fanned out at once. Held messages leave in order, and those whose decoding misses
+    `decode_timeout_ms` go out undecoded.
+    Export `sinks` are offered every event they match after it is numbered; they
+    buffer and send it on their own threads. With a `tracer`, bus messages are
+    timed through the ring, decoding and fan-out.
     """
 
-    def __init__(self, loop: asyncio.AbstractEventLoop, client_queue_size: int = 1000) -> None:
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        client_queue_size: int = 1000,
+        client_queue_bytes: int = 0,
+        client_policy: str = "drop_oldest",
+        client_max_lag_ms: float = 0.0,
+        pending_size: int = 10000,
+        batch_max: int = 1000,
+        flush_interval_ms: float = 0.0,
+        replay: Optional[ReplayBuffer] = None,
+        replay_topics: Sequence[str] = (),
+        top_topics: int = 100,
+        topic_depth: int = 2,
+        rate_limit: float = 0.0,
+        rate_burst: float = 0.0,
+        sampling: Tuple[SamplingRule, ...] = (),
+        decoders: Optional[DecoderPool] = None,
+        decode_backlog: int = 10000,
+        decode_timeout_ms: float = 1000.0,
+        sinks: Sequence["Sink"] = (),
+        tracer: Optional["StageTracer"] = None,
+    ) -> None:
         self._loop = loop
-        self._subs: Set[asyncio.Queue] = set()
-        self._client_queue_size = client_queue_size
+        self.tracer = tracer
+        self._subs: Dict[str, Subscriber] = {}
+        self._index = FilterIndex()
+        self.sinks: Tuple["Sink", ...] = tuple(sinks)
+        if client_policy not in POLICIES:
+            raise ValueError(f"client_policy must be one of {', '.join(POLICIES)}")
+        self._client_queue = (client_queue_size, client_queue_bytes, client_policy, client_max_lag_ms)
         self._stats = BusStats()
         self._lock = asyncio.Lock()
+        # deque.append/popleft are atomic, so producer threads need no lock;
+        # maxlen evicts the oldest pending event when the loop falls behind.
+        self._pending: Deque[Tuple[Event, float]] = deque(maxlen=pending_size)
+        self._pending_size = pending_size
+        self._batch_max = max(1, batch_max)
+        self._flush_interval = flush_interval_ms / 1000.0
+        self._flush_scheduled = False
+        self._pending_since = 0.0
+        self._batched_events = 0
+        self._seq = 0
+        self.replay = replay
+        # Topic prefixes the replay buffer keeps (empty = all); they count as interest
+        self._replay_topics = tuple(replay_topics)
+        # Message/byte totals per topic prefix, bounded to the heaviest prefixes
+        self.topics = TopK(top_topics)
+        self._topic_depth = topic_depth
+        # Defaults for new clients; /ws/control set_limits adjusts them per client
+        self._limits = (rate_limit, rate_burst, sampling)
+        # Topic prefixes (UTF-8) some client could want; None = anything. Replaced
+        # wholesale when filters change so capture threads can read it without a lock.
+        self._interest: Optional[Tuple[bytes, ...]] = None
+        self._update_interest()
+        self._decoders = decoders if decoders else None
+        self._decode_backlog = decode_backlog
+        self._decode_timeout = decode_timeout_ms / 1000.0
+        # Messages on decoded topics waiting on (or queued behind) the decoder pool:
+        # [events, [(event, decoder index)], future, deadline]
+        self._held: Deque[List[Any]] = deque()
 
     @property
     def stats(self) -> BusStats:
+        st = self._stats
         s = BusStats(
-            published=self._stats.published,
-            dropped_ws=self._stats.dropped_ws,
+            published=st.published,
+            dropped_ws=st.dropped_ws,
+            dropped_queue=st.dropped_queue,
+            dropped_rate=st.dropped_rate,
+            dropped_sampled=st.dropped_sampled,
+            dropped_conflated=st.dropped_conflated,
+            disconnected_slow=st.disconnected_slow,
             subscribers=len(self._subs),
+            delivered=st.delivered,
+            pending=len(self._pending),
+            batches=st.batches,
+            batch_avg=round(self._batched_events / st.batches, 2) if st.batches else 0.0,
+            batch_max=st.batch_max,
+            flush_latency_ms_last=st.flush_latency_ms_last,
+            flush_latency_ms_max=st.flush_latency_ms_max,
+            decoded=st.decoded,
+            decode_errors=st.decode_errors,
+            decode_skipped=st.decode_skipped,
+            decode_timeouts=st.decode_timeouts,
+            decoding=st.decoding,
         )
         return s
 
-    async def subscribe(self) -> asyncio.Queue:
-        q: asyncio.Queue = asyncio.Queue(maxsize=self._client_queue_size)
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    async def subscribe(
+        self, since: Optional[int] = None, last: int = 0, topic: Optional[str] = None, **protocol: Any
+    ) -> Tuple[Subscriber, List[Any]]:
+        """
+        Register a client and return it with its backfill: events after `since`, or the
+        last `last` events (optionally on one topic) from the replay buffer. The snapshot
+        and registration happen without yielding, so live events continue exactly after it.
+        """
+        sub = Subscriber(ClientQueue(*self._client_queue), **protocol)
+        sub.configure_limits(*self._limits)
         async with self._lock:
-            self._subs.add(q)
-        return q
+            backfill = [sub.encode(e) for e in self.replayed(since, last, topic)]
+            self._subs[sub.id] = sub
+            self._index.add(sub)
+            self._update_interest()
+        return sub, backfill
 
-    async def unsubscribe(self, q: asyncio.Queue) -> None:
+    def replayed(self, since: Optional[int] = None, last: int = 0, topic: Optional[str] = None) -> List[Event]:
+        """
+        Retained events after seq `since`, or the last `last` (optionally on one topic).
+        Bus messages are handed out as copies, so encoding them for a reader does not
+        grow what the replay buffer holds.
+        """
+        replay = self.replay
+        if replay is None:
+            return []
+        items = replay.since(since) if since is not None else replay.last(last, topic)
+        return [e.copy() if isinstance(e, BusEvent) else e for e in items]
+
+    async def unsubscribe(self, sub: Subscriber) -> None:
         async with self._lock:
-            self._subs.discard(q)
+            self._remove(sub)
 
-    def publish_threadsafe(self, event: Dict[str, Any]) -> None:
-        # schedule on the loop to avoid cross-thread access to queues
-        self._loop.call_soon_threadsafe(asyncio.create_task, self.publish(event))
+    def _remove(self, sub: Subscriber) -> None:
+        if self._subs.pop(sub.id, None) is not None:
+            self._index.discard(sub)
+            self._update_interest()
+            if sub.release is not None:
+                sub.release.cancel()
+                sub.release = None
 
-    async def publish(self, event: Dict[str, Any]) -> None:
-        self._stats.published += 1
-        remove: List[asyncio.Queue] = []
-        for q in list(self._subs):
-            try:
-                q.put_nowait(event)
-            except asyncio.QueueFull:
-                # Drop oldest one and insert newest
-                try:
-                    _ = q.get_nowait()
-                except asyncio.QueueEmpty:
-                    pass
-                self._stats.dropped_ws += 1
-                try:
-                    q.put_nowait(event)
-                except asyncio.QueueFull:
-                    # Client is too slow; schedule removal
-                    remove.append(q)
-        if remove:
-            async with self._lock:
-                for q in remove:
-                    self._subs.discard(q)
+    def get_subscriber(self, client_id: str) -> Optional[Subscriber]:
+        return self._subs.get(client_id)
+
+    def subscribers(self) -> List[Subscriber]:
+        return list(self._subs.values())
+
+    async def set_filter(self, client_id: str, flt: EventFilter) -> bool:
+        async with self._lock:
+            sub = self._subs.get(client_id)
+            if sub is None:
+                return False
+            self._index.discard(sub)
+            sub.filter = flt
+            self._index.add(sub)
+            self._update_interest()
+        return True
+
+    def _update_interest(self) -> None:
+        prefixes: Set[bytes] = set()
+        if self.replay is not None:
+            if not self._replay_topics:
+                # Everything is kept for backfill
+                self._interest = None
+                return
+            prefixes.update(p.encode("utf-8") for p in self._replay_topics)
+        for flt in [*self._index.filters(), *(sink.filter for sink in self.sinks)]:
+            if (flt.kinds and "bus" not in flt.kinds) or (flt.sources and "xsub" not in flt.sources):
+                continue
+            if not flt.include:
+                self._interest = None
+                return
+            prefixes.update(p.encode("utf-8") for p in flt.include)
+        self._interest = tuple(prefixes)
+
+    def wants(self, topic: bytes) -> bool:
+        """
+        Whether a captured message on `topic` could reach any client or the replay
+        buffer. Safe from any thread; a False lets capture skip the message entirely.
+        """
+        interest = self._interest
+        if interest is None or topic.startswith(interest):
+            return True
+        # Non-UTF-8 topics are matched in their base64 form; let the bus decide
+        return bool(interest) and not topic.isascii()
+
+    def account(self, topic: bytes, nbytes: int) -> None:
+        """
+        Count a captured message in the per-topic totals. The capturing thread calls
+        this before wants(), so traffic nobody views is counted too; single writer.
+        """
+        self.topics.update(topic_prefix(_decode_part(topic)[0], self._topic_depth), nbytes)
+
+    def publish_threadsafe(self, event: Event) -> None:
+        pending = self._pending
+        if len(pending) >= self._pending_size:
+            self._stats.dropped_queue += 1
+        pending.append((event, time.monotonic()))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._pending_since = time.monotonic()
+            if self._flush_interval > 0:
+                self._loop.call_soon_threadsafe(self._loop.call_later, self._flush_interval, self._flush)
+            else:
+                self._loop.call_soon_threadsafe(self._flush)
+
+    def _flush(self) -> None:
+        # Clear the flag before draining so appends racing with us schedule a new flush
+        self._flush_scheduled = False
+        pending = self._pending
+        n = min(len(pending), self._batch_max)
+        if not n:
+            return
+        st = self._stats
+        latency_ms = (time.monotonic() - self._pending_since) * 1000.0
+        st.flush_latency_ms_last = round(latency_ms, 3)
+        if latency_ms > st.flush_latency_ms_max:
+            st.flush_latency_ms_max = st.flush_latency_ms_last
+        now = time.monotonic()
+        batch = []
+        tracer = self.tracer
+        if tracer is None:
+            for _ in range(n):
+                event, captured_at = pending.popleft()
+                CAPTURE_TO_LOOP.observe(now - captured_at)
+                batch.append(event)
+        else:
+            now_ns = time.monotonic_ns()
+            for _ in range(n):
+                event, captured_at = pending.popleft()
+                CAPTURE_TO_LOOP.observe(now - captured_at)
+                tracer.observe("ring", int((now - captured_at) * 1e9))
+                if isinstance(event, BusEvent):
+                    if event.trace is None:
+                        event.trace = [event.ts_ns, now_ns]
+                    else:
+                        event.trace[1] = now_ns
+                batch.append(event)
+        if pending and not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._pending_since = time.monotonic()
+            self._loop.call_soon(self._flush)
+        st.batches += 1
+        self._batched_events += n
+        if n > st.batch_max:
+            st.batch_max = n
+        self._dispatch(batch)
+
+    async def publish(self, event: Event) -> None:
+        self._dispatch([event])
+
+    def _dispatch(self, batch: List[Event]) -> None:
+        """
+        Fan out a batch, holding back only the messages on decoded topics until the
+        payloads their viewers need are decoded; everything else leaves at once.
+        """
+        if self._decoders is None:
+            self._fanout(batch)
+            return
+        ready, held, work = self._decode_work(batch)
+        if ready:
+            self._fanout(ready)
+        if not held:
+            return
+        entry: List[Any] = [held, work, None, 0.0]
+        if work:
+            jobs: List[Job] = [(index, event.frames[0], event.frames[1:]) for event, index in work]
+            self._stats.decoding += len(jobs)
+            future = asyncio.wrap_future(self._decoders.submit(jobs), loop=self._loop)
+            future.add_done_callback(lambda _, n=len(jobs): self._decode_done(n))
+            entry[2] = future
+            entry[3] = self._loop.time() + self._decode_timeout
+            self._loop.call_later(self._decode_timeout, self._drain_held)
+        self._held.append(entry)
+        self._drain_held()
+
+    def _decode_work(self, batch: List[Event]) -> Tuple[List[Event], List[Event], List[Tuple[BusEvent, int]]]:
+        """
+        Split a batch into events to fan out now and events to hold, and list the
+        decoding the held ones need. Messages on decoded topics that need no decoding
+        are held too while others wait, so they stay in order behind them.
+        """
+        decoders = self._decoders
+        match = self._index.match
+        sinks = self.sinks
+        viewed = bool(self._subs or sinks)
+        st = self._stats
+        ready: List[Event] = []
+        held: List[Event] = []
+        work: List[Tuple[BusEvent, int]] = []
+        for event in batch:
+            index = None
+            if isinstance(event, BusEvent) and event.frames:
+                index = decoders.match(event.frames[0])  # type: ignore[union-attr]
+            if index is None:
+                ready.append(event)
+                continue
+            # Previews of truncated payloads cannot be decoded
+            decodable = viewed and event.sizes is None and len(event.frames) >= 2 and not event.decoded
+            if decodable and (match(event) or any(sink.wants(event) for sink in sinks)):
+                if st.decoding + len(work) < self._decode_backlog:
+                    work.append((event, index))  # type: ignore[arg-type]
+                    held.append(event)
+                    continue
+                st.decode_skipped += 1
+            if held or self._held:
+                held.append(event)
+            else:
+                ready.append(event)
+        return ready, held, work
+
+    def _decode_done(self, n: int) -> None:
+        self._stats.decoding -= n
+        self._drain_held()
+
+    def _drain_held(self) -> None:
+        held = self._held
+        now = self._loop.time()
+        st = self._stats
+        while held:
+            batch, work, future, deadline = held[0]
+            if future is not None:
+                name = self._decoders.name  # type: ignore[union-attr]
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    for (event, index), (value, error) in zip(work, future.result()):
+                        event.set_decoded(name(index), value, error)
+                        st.decoded += 1
+                        if error is not None:
+                            st.decode_errors += 1
+                elif future.done():
+                    error = "cancelled" if future.cancelled() else f"decoder pool failed: {future.exception()!r}"
+                    for event, index in work:
+                        event.set_decoded(name(index), None, error)
+                    st.decode_errors += len(work)
+                elif now >= deadline:
+                    # Cancelling also drops the job from the pool if it has not started
+                    future.cancel()
+                    for event, index in work:
+                        event.set_decoded(name(index), None, "timeout")
+                    st.decode_timeouts += len(work)
+                else:
+                    return
+            held.popleft()
+            self._fanout(batch)
+
+    def _fanout(self, batch: List[Event]) -> None:
+        self._stats.published += len(batch)
+        replay = self.replay
+        replay_topics = self._replay_topics
+        sinks = self.sinks
+        if not self._subs and replay is None and not sinks:
+            self._seq += len(batch)
+            return
+        match = self._index.match
+        now = time.monotonic()
+        tracer = self.tracer
+        start_ns = time.monotonic_ns() if tracer is not None else 0
+        for event in batch:
+            self._seq += 1
+            lazy = isinstance(event, BusEvent)
+            if lazy:
+                event.seq = self._seq
+            else:
+                event["seq"] = self._seq
+            for sink in sinks:
+                if sink.wants(event):
+                    sink.offer(event)
+            subs = match(event)
+            # Encoded lazily per wire format, once each, shared by every client using it
+            text = (encode_event(event), now) if not lazy and (subs or replay is not None) else None
+            binary = None
+            for sub in subs:
+                if (sub.sampler is not None or sub.bucket is not None) and not self._admit(sub, event, now):
+                    continue
+                if sub.binary:
+                    if binary is None:
+                        binary = (encode_event_binary(event), now)
+                    item = binary
+                else:
+                    if text is None:
+                        text = (encode_event(event), now)
+                    item = text
+                if sub.queue.policy == CONFLATE:
+                    self._enqueue(sub, item, _conflation_key(event))
+                else:
+                    self._enqueue(sub, item)
+            if replay is not None and (not replay_topics or _retained(event, replay_topics)):
+                # Bus messages are kept as their raw frames and encoded again for
+                # each replay, so the buffer's byte count stays what it holds
+                if lazy:
+                    size = event.nbytes + (len(event.encode()) if event.decoded is not None else 0)
+                    replay.append(self._seq, event.topic, event.copy(), size)
+                else:
+                    replay.append(self._seq, event.get("topic"), event, len(text[0]))  # type: ignore[index]
+            if tracer is not None and lazy and event.trace is not None:
+                done = time.monotonic_ns()
+                received, flushed = event.trace
+                tracer.observe("decode", start_ns - flushed)
+                tracer.observe("fanout", done - start_ns)
+                tracer.observe("total", done - received)
+
+    def _enqueue(self, sub: Subscriber, item: Tuple[Any, float], key: Optional[str] = None) -> None:
+        q = sub.queue
+        if q.closed:
+            return
+        dropped, replaced = q.put(item, key)
+        st = self._stats
+        if dropped:
+            st.dropped_ws += dropped
+            sub.drops["queue_full"] += dropped
+        if replaced:
+            st.dropped_conflated += replaced
+            sub.drops["conflated"] += replaced
+        if q.closed:
+            # Too far behind under the disconnect policy; its sender closes the socket
+            st.disconnected_slow += 1
+            self._remove(sub)
+        elif not (dropped and q.policy == DROP_NEWEST):
+            st.delivered += 1
+
+    def _admit(self, sub: Subscriber, event: Event, now: float) -> bool:
+        """Apply the client's topic sampling, then its rate limit."""
+        sampler = sub.sampler
+        if sampler is not None:
+            topic = event.get("topic")
+            if isinstance(topic, str):
+                verdict = sampler.check(topic, now)
+                if verdict == DROP:
+                    sub.drops["sampled"] += 1
+                    self._stats.dropped_sampled += 1
+                    return False
+                if verdict == HOLD:
+                    replaced, due_at = sampler.hold(topic, event)
+                    if replaced:
+                        sub.drops["sampled"] += 1
+                        self._stats.dropped_sampled += 1
+                    if sub.release is None:
+                        sub.release = self._loop.call_later(max(0.0, due_at - now), self._release, sub)
+                    return False
+        if sub.bucket is not None and not sub.bucket.take(now):
+            sub.drops["rate_limit"] += 1
+            self._stats.dropped_rate += 1
+            return False
+        return True
+
+    def _release(self, sub: Subscriber) -> None:
+        """Timer callback: queue the held latest-per-interval samples that are due."""
+        sub.release = None
+        sampler = sub.sampler
+        if sampler is None or sub.id not in self._subs:
+            return
+        now = time.monotonic()
+        events, next_at = sampler.due(now)
+        for event in events:
+            if sub.bucket is not None and not sub.bucket.take(now):
+                sub.drops["rate_limit"] += 1
+                self._stats.dropped_rate += 1
+                continue
+            self._enqueue(sub, (sub.encode(event), now), _conflation_key(event) if sub.queue.policy == CONFLATE else None)
+        if next_at is not None:
+            sub.release = self._loop.call_later(max(0.0, next_at - now), self._release, sub)
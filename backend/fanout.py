@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import base64
+import json
+import logging
+import struct
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import zmq
+
+from .config import Settings
+from .events import BusEvent, EventBus, Event, dumps
+from .metrics import CAPTURE_SKIPPED, MSGS_IN, PUBLISH_REQUESTS
+from .subscriptions import SubscriptionTable
+from .zmq_monitor import ConnectionTable
+
+log = logging.getLogger("zmqhub.fanout")
+
+# Core -> worker wire format, one ZMQ multipart message per event:
+#   [b"B" | u64 wall_ns | source, *raw frames]   captured bus message
+#   [b"P" | u64 wall_ns | u16 n | n * u32 size | source, *frames]
+#                                                 same, payloads cut to previews
+#   [b"J", event JSON]                            any other event (monitor, inject)
+# Bus messages stay raw so each worker decodes/encodes only what its viewers need.
+# Worker -> core injects are [b"E" or b"-", *frames]: whether to echo an inject event.
+_BUS = b"B"
+_PREVIEW = b"P"
+_JSON = b"J"
+_WALL = struct.Struct("<Q")
+_COUNT = struct.Struct("<H")
+INJECT_ECHO = b"E"
+INJECT_PLAIN = b"-"
+
+
+def pack_event(event: Event) -> List[bytes]:
+    if isinstance(event, BusEvent):
+        source = event.source.encode("utf-8")
+        if event.sizes is None:
+            return [_BUS + _WALL.pack(event.wall_ns) + source, *event.frames]
+        sizes = struct.pack(f"<{len(event.sizes)}I", *event.sizes)
+        return [_PREVIEW + _WALL.pack(event.wall_ns) + _COUNT.pack(len(event.sizes)) + sizes + source, *event.frames]
+    return [_JSON, dumps(event).encode("utf-8")]
+
+
+def unpack_event(msg: List[bytes]) -> Optional[Event]:
+    head = msg[0] if msg else b""
+    if head[:1] == _BUS and len(head) >= 1 + _WALL.size:
+        (wall_ns,) = _WALL.unpack_from(head, 1)
+        return BusEvent(head[1 + _WALL.size :].decode("utf-8", errors="replace"), msg[1:], wall_ns=wall_ns)
+    if head[:1] == _PREVIEW and len(head) >= 1 + _WALL.size + _COUNT.size:
+        (wall_ns,) = _WALL.unpack_from(head, 1)
+        pos = 1 + _WALL.size
+        (n,) = _COUNT.unpack_from(head, pos)
+        pos += _COUNT.size
+        sizes = list(struct.unpack_from(f"<{n}I", head, pos))  # struct.error is a ValueError
+        source = head[pos + 4 * n :].decode("utf-8", errors="replace")
+        return BusEvent(source, msg[1:], wall_ns=wall_ns, sizes=sizes)
+    if head == _JSON and len(msg) == 2:
+        event: Dict[str, Any] = json.loads(msg[1])
+        event.pop("seq", None)  # each worker numbers its own stream
+        return event
+    return None
+
+
+class FanoutSink:
+    """
+    Core side: stands in for the EventBus that Proxy, Publisher and the monitors
+    publish to, and forwards every event to the workers over a PUB socket. Several
+    threads publish, so sends are serialized; PUB never blocks, and a worker that
+    falls behind loses events at `core_fanout_hwm`.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._ctx: zmq.Context | None = None
+        self._sock: zmq.Socket | None = None
+        self.sent = 0
+        self.dropped = 0
+        self.tracer = None  # stage tracing runs in the workers' buses
+
+    def start(self) -> None:
+        self._ctx = zmq.Context(io_threads=1)
+        sock = self._ctx.socket(zmq.PUB)
+        sock.set_hwm(self.settings.core_fanout_hwm)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.bind(self.settings.core_fanout_endpoint)
+        self._sock = sock
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close(0)
+                self._sock = None
+        if self._ctx is not None:
+            self._ctx.term()
+            self._ctx = None
+
+    def wants(self, topic: bytes) -> bool:
+        # Each worker filters for its own viewers
+        return True
+
+    def account(self, topic: bytes, nbytes: int) -> None:
+        # Each worker counts the messages it receives
+        pass
+
+    def publish_threadsafe(self, event: Event) -> None:
+        msg = pack_event(event)
+        with self._lock:
+            if self._sock is None:
+                return
+            try:
+                self._sock.send_multipart(msg, flags=zmq.NOBLOCK)
+                self.sent += 1
+            except zmq.Again:
+                self.dropped += 1
+
+
+class FanoutRelay:
+    """Worker side: receive events from the core process and feed them to the local EventBus."""
+
+    def __init__(self, settings: Settings, bus: EventBus) -> None:
+        self.settings = settings
+        self.bus = bus
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.received = 0
+        # Mirrored from the core's subscription events (counts are absolute)
+        self.subscriptions = SubscriptionTable()
+        self.connections = ConnectionTable(settings.monitor_recent)
+        self.topic_stats: Optional[Dict[str, Any]] = None  # the core's latest stats event
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="zmqhub-fanout-relay", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        self._thread = None
+
+    def _run(self) -> None:
+        ctx = zmq.Context(io_threads=1)
+        sock = ctx.socket(zmq.SUB)
+        sock.set_hwm(self.settings.core_fanout_hwm)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.setsockopt(zmq.SUBSCRIBE, b"")
+        sock.connect(self.settings.core_fanout_endpoint)
+        log.info("Worker attached to core at %s", self.settings.core_fanout_endpoint)
+        try:
+            while not self._stop.is_set():
+                if not sock.poll(100):
+                    continue
+                while True:
+                    try:
+                        msg = sock.recv_multipart(flags=zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    try:
+                        event = unpack_event(msg)
+                    except ValueError:
+                        event = None
+                    if event is None:
+                        log.warning("Ignoring malformed fan-out message")
+                        continue
+                    MSGS_IN.inc()
+                    self.received += 1
+                    if isinstance(event, BusEvent):
+                        if event.frames:
+                            self.bus.account(event.frames[0], event.nbytes)
+                        if event.frames and not self.bus.wants(event.frames[0]):
+                            CAPTURE_SKIPPED.inc()
+                            continue
+                    elif event.get("kind") == "subscription":
+                        self._mirror(event)
+                    elif event.get("kind") == "monitor":
+                        self.connections.apply(event)
+                    elif event.get("kind") == "stats":
+                        self.topic_stats = event.get("meta")
+                    self.bus.publish_threadsafe(event)
+        finally:
+            sock.close(0)
+            ctx.term()
+
+    def _mirror(self, event: Dict[str, Any]) -> None:
+        meta = event.get("meta") or {}
+        topic = event.get("topic") or ""
+        try:
+            prefix = base64.b64decode(topic) if meta.get("topic_encoding") == "base64" else topic.encode("utf-8")
+        except ValueError:
+            return
+        self.subscriptions.set(prefix, int(meta.get("count") or 0))
+
+
+class InjectClient:
+    """
+    Worker side: hand UI publishes to the core's single injector over PUSH. Used from
+    the event loop only; never blocks, so a stalled core costs a dropped publish.
+    """
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self._ctx: zmq.Context | None = None
+        self._sock: zmq.Socket | None = None
+
+    def start(self) -> None:
+        self._ctx = zmq.Context(io_threads=1)
+        sock = self._ctx.socket(zmq.PUSH)
+        sock.set_hwm(1000)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(self.settings.core_inject_endpoint)
+        self._sock = sock
+
+    def stop(self) -> None:
+        if self._sock is not None:
+            self._sock.close(0)
+            self._sock = None
+        if self._ctx is not None:
+            self._ctx.term()
+            self._ctx = None
+
+    def publish_batch(self, batch: List[List[bytes]], echo: bool = False) -> Tuple[int, int]:
+        """Same contract as Publisher.publish_batch: (accepted, rejected tail)."""
+        if self._sock is None:
+            return 0, len(batch)
+        PUBLISH_REQUESTS.inc(len(batch))
+        head = INJECT_ECHO if echo else INJECT_PLAIN
+        sent = 0
+        try:
+            for frames in batch:
+                self._sock.send_multipart([head, *frames], flags=zmq.NOBLOCK)
+                sent += 1
+        except zmq.Again:
+            pass
+        return sent, len(batch) - sent
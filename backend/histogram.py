@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from typing import Dict, List
+
+# Log-linear histograms as {bucket: count} dicts, shared by topic sizes (bytes) and
+# stage latencies (microseconds).
+
+
+def bucket(n: int) -> int:
+    # Exact below 8, then 4 buckets per power of two (at most 25% wide)
+    if n < 8:
+        return n
+    shift = n.bit_length() - 3
+    return (shift << 2) + (n >> shift)
+
+
+def bucket_value(b: int) -> int:
+    """Midpoint of a bucket."""
+    if b < 8:
+        return b
+    shift = (b >> 2) - 1
+    lo = (b - (shift << 2)) << shift
+    return lo + (1 << shift) // 2
+
+
+def quantiles(hist: Dict[int, int], qs: tuple) -> List[int]:
+    """The midpoint of the bucket holding each quantile in `qs` (0 for an empty histogram)."""
+    total = sum(hist.values())
+    out: List[int] = []
+    if not total:
+        return [0] * len(qs)
+    buckets = sorted(hist.items())
+    for q in qs:
+        rank = q * total
+        acc = 0
+        for b, n in buckets:
+            acc += n
+            if acc >= rank:
+                out.append(bucket_value(b))
+                break
+    return out
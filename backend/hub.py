@@ -1,53 +1,239 @@
 from __future__ import annotations
 
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+from .bridge import Bridge
+from .capture_log import CaptureWriter
+from .capture_replay import CaptureReplayer
 from .config import Settings
 from .events import EventBus
+from .fanout import FanoutRelay, InjectClient
+from . import metrics
 from .publisher import Publisher
+from .subscriptions import SubscriptionTable
+from .zmq_monitor import ConnectionTable
 from .zmq_proxy import Proxy
 
 log = logging.getLogger("zmqhub.hub")
 
 
 class Hub:
+    """
+    Everything one web process needs. With hub_role=embedded it runs the proxy,
+    capture log and injector itself; with hub_role=worker it only relays events from
+    the core process into its own EventBus and forwards publishes to the core.
+    """
+
     def __init__(self, settings: Settings, bus: EventBus) -> None:
         self.settings = settings
         self.bus = bus
-        self._proxy = Proxy(settings, bus)
-        self._publisher = Publisher(settings, bus)
+        self.worker = settings.hub_role == "worker"
+        # Workers read the same capture directory the core writes
+        self.capture_log = CaptureWriter(settings) if settings.capture_dir and not self.worker else None
+        self.replayer = CaptureReplayer(settings) if settings.capture_dir else None
+        self._proxy: Optional[Proxy] = None
+        self._publisher: Optional[Publisher] = None
+        self._bridge: Optional[Bridge] = None
+        self._relay: Optional[FanoutRelay] = None
+        self._inject: Optional[InjectClient] = None
+        if self.worker:
+            self._relay = FanoutRelay(settings, bus)
+            self._inject = InjectClient(settings)
+        else:
+            self._proxy = Proxy(settings, bus, capture_log=self.capture_log)
+            self._publisher = Publisher(settings, bus)
+            if settings.bridge_bind or settings.bridge_links:
+                self._bridge = Bridge(settings, self._proxy)
         self._started = False
 
     def start(self) -> None:
         if self._started:
             return
-        self._proxy.start()
-        self._publisher.start()
+        if self.capture_log is not None:
+            self.capture_log.start()
+        for part in (self._proxy, self._relay, self._inject):
+            if part is not None:
+                part.start()
+        if self._publisher is not None and self._proxy is not None:
+            self._publisher.start(context=self._proxy.context)
+        if self.replayer is not None and self._proxy is not None:
+            self.replayer.attach(self._proxy.context)
+        if self._bridge is not None:
+            self._bridge.start()
         self._started = True
-        log.info("Hub started")
+        log.info("Hub started (%s)", self.settings.hub_role)
 
     def stop(self) -> None:
         if not self._started:
             return
-        self._proxy.stop()
-        self._publisher.stop()
+        if self.replayer is not None:
+            self.replayer.stop()
+        # The publisher's, bridge's and replayer's sockets live on the proxy's context, so close them first
+        for part in (self._publisher, self._bridge, self._proxy, self._relay, self._inject):
+            if part is not None:
+                part.stop()
+        if self.capture_log is not None:
+            self.capture_log.stop()
         self._started = False
         log.info("Hub stopped")
 
-    def publish(self, *, topic: str, payload: Optional[str], encoding: str, multipart: Optional[list[str]]) -> None:
-        self._publisher.publish(topic=topic, payload=payload, encoding=encoding, multipart=multipart)
+    @property
+    def subscriptions(self) -> SubscriptionTable:
+        part = self._relay if self._relay is not None else self._proxy
+        return part.subscriptions  # type: ignore[union-attr]
+
+    @property
+    def connections(self) -> ConnectionTable:
+        if self._relay is not None:
+            return self._relay.connections
+        return self._proxy.monitor.connections  # type: ignore[union-attr]
+
+    def topics(self, limit: int = 100, prefix: str = "", topic: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Topic directory from the proxy's streaming statistics (None when disabled);
+        `topic` looks up one topic instead. Workers only have the core's latest stats event, so they serve
+        its top topics_push entries and cannot look up untracked topics.
+        """
+        if self._relay is not None:
+            snap = self._relay.topic_stats or {"topics": [], "prefixes": {}}
+            if topic:
+                tracked = next((t for t in snap.get("topics", []) if t["topic"] == topic), None)
+                return {"topic": topic, "estimate": None, "tracked": tracked}
+            end = limit if limit > 0 else None
+            topics = [t for t in snap.get("topics", []) if t["topic"].startswith(prefix)]
+            prefixes = {
+                level: [p for p in entries if p["prefix"].startswith(prefix)][:end]
+                for level, entries in (snap.get("prefixes") or {}).items()
+            }
+            return {**snap, "topics": topics[:end], "prefixes": prefixes}
+        stats = self._proxy.topics if self._proxy is not None else None
+        if stats is None:
+            return None
+        return stats.lookup(topic) if topic else stats.snapshot(limit, prefix)
+
+    def publish_frames(self, frames: List[bytes]) -> bool:
+        """Publish one already built message and echo it as an inject event; False on pushback."""
+        if self._inject is not None:
+            return self._inject.publish_batch([frames], echo=True)[0] == 1
+        if self._publisher is not None:
+            return self._publisher.publish_frames(frames, echo=True)
+        return False
+
+    def publish_batch(self, batch: List[List[bytes]]) -> Tuple[int, int]:
+        """Publish frame lists in order without blocking: (accepted, rejected tail)."""
+        part = self._inject if self._inject is not None else self._publisher
+        if part is None:
+            return 0, len(batch)
+        return part.publish_batch(batch)
+
+    def metrics_text(self) -> str:
+        """Prometheus text exposition: hot-path metrics plus bus, topic and client state."""
+        stats = self.bus.stats
+        lines: List[str] = []
+        for name, kind, help, value in (
+            ("zmqhub_bus_published_total", "counter", "Events fanned out by the bus.", stats.published),
+            ("zmqhub_msgs_out_total", "counter", "Events queued for WebSocket clients.", stats.delivered),
+            ("zmqhub_dropped_ws_total", "counter", "Events dropped from full client queues.", stats.dropped_ws),
+            ("zmqhub_dropped_queue_total", "counter", "Events dropped from the capture-to-loop ring.", stats.dropped_queue),
+            ("zmqhub_dropped_conflated_total", "counter", "Queued events replaced by a newer one on the same topic.", stats.dropped_conflated),
+            ("zmqhub_clients_disconnected_slow_total", "counter", "Clients disconnected by their slow-consumer policy.", stats.disconnected_slow),
+            ("zmqhub_decoded_total", "counter", "Payloads decoded by topic decoders.", stats.decoded),
+            ("zmqhub_decode_errors_total", "counter", "Payloads a topic decoder failed on.", stats.decode_errors),
+            ("zmqhub_decode_skipped_total", "counter", "Payloads sent undecoded because the decoder backlog was full.", stats.decode_skipped),
+            ("zmqhub_decode_timeouts_total", "counter", "Payloads sent undecoded after decoder_timeout_ms.", stats.decode_timeouts),
+            ("zmqhub_bus_pending", "gauge", "Events waiting in the capture-to-loop ring.", stats.pending),
+            ("zmqhub_clients_connected", "gauge", "Connected /ws/events clients.", stats.subscribers),
+        ):
+            lines += metrics.header(name, kind, help) + [metrics.sample(name, value)]
+
+        topics = self.bus.topics.items()
+        lines += metrics.header("zmqhub_topic_messages_total", "counter", "Messages per topic prefix (top-K prefixes).")
+        lines += [metrics.sample("zmqhub_topic_messages_total", n, {"prefix": k}) for k, n, _ in topics]
+        lines += metrics.header("zmqhub_topic_bytes_total", "counter", "Payload bytes per topic prefix (top-K prefixes).")
+        lines += [metrics.sample("zmqhub_topic_bytes_total", b, {"prefix": k}) for k, _, b in topics]
+
+        subs = self.bus.subscribers()
+        lines += metrics.header("zmqhub_client_queue_depth", "gauge", "Queued events per /ws/events client.")
+        lines += [metrics.sample("zmqhub_client_queue_depth", s.queue.qsize(), {"client": s.id}) for s in subs]
+        lines += metrics.header("zmqhub_client_queue_bytes", "gauge", "Queued encoded bytes per /ws/events client.")
+        lines += [metrics.sample("zmqhub_client_queue_bytes", s.queue.nbytes, {"client": s.id}) for s in subs]
+        lines += metrics.header("zmqhub_client_dropped_total", "counter", "Dropped events per /ws/events client and reason.")
+        lines += [
+            metrics.sample("zmqhub_client_dropped_total", n, {"client": s.id, "reason": reason})
+            for s in subs
+            for reason, n in s.drops.items()
+        ]
+
+        sinks = self.bus.sinks
+        lines += metrics.header("zmqhub_sink_sent_total", "counter", "Events delivered per export sink.")
+        lines += [metrics.sample("zmqhub_sink_sent_total", k.sent, {"sink": k.name}) for k in sinks]
+        lines += metrics.header("zmqhub_sink_retries_total", "counter", "Batch retries per export sink.")
+        lines += [metrics.sample("zmqhub_sink_retries_total", k.retries, {"sink": k.name}) for k in sinks]
+        lines += metrics.header("zmqhub_sink_dropped_total", "counter", "Dropped events per export sink and reason.")
+        lines += [
+            metrics.sample("zmqhub_sink_dropped_total", n, {"sink": k.name, "reason": reason})
+            for k in sinks
+            for reason, n in k.dropped.items()
+        ]
+        lines += metrics.header("zmqhub_sink_queued", "gauge", "Buffered events per export sink.")
+        lines += [metrics.sample("zmqhub_sink_queued", k.queued, {"sink": k.name}) for k in sinks]
+        lines += metrics.header("zmqhub_sink_queued_bytes", "gauge", "Buffered NDJSON bytes per export sink.")
+        lines += [metrics.sample("zmqhub_sink_queued_bytes", k.queued_bytes, {"sink": k.name}) for k in sinks]
+        return metrics.render(lines)
 
     def health(self) -> Dict[str, Any]:
         stats = self.bus.stats
-        return {
+        health: Dict[str, Any] = {
+            "role": self.settings.hub_role,
             "status": "ok" if self._started else "starting",
             "xsub_bind": self.settings.xsub_bind,
             "xpub_bind": self.settings.xpub_bind,
-            "inject_connect": self.settings.inject_connect,
             "bus": {
                 "published": stats.published,
                 "dropped_ws": stats.dropped_ws,
+                "dropped_queue": stats.dropped_queue,
+                "dropped_rate": stats.dropped_rate,
+                "dropped_sampled": stats.dropped_sampled,
+                "dropped_conflated": stats.dropped_conflated,
+                "disconnected_slow": stats.disconnected_slow,
                 "subscribers": stats.subscribers,
+                "pending": stats.pending,
+                "batches": stats.batches,
+                "batch_avg": stats.batch_avg,
+                "batch_max": stats.batch_max,
+                "flush_latency_ms_last": stats.flush_latency_ms_last,
+                "flush_latency_ms_max": stats.flush_latency_ms_max,
+                "last_seq": self.bus.last_seq,
+                "decoded": stats.decoded,
+                "decode_errors": stats.decode_errors,
+                "decode_skipped": stats.decode_skipped,
+                "decode_timeouts": stats.decode_timeouts,
+                "decoding": stats.decoding,
+            },
+            "clients": {
+                s.id: {"queued": s.queue.qsize(), "queued_bytes": s.queue.nbytes, "drops": dict(s.drops), "limits": s.limits()}
+                for s in self.bus.subscribers()
             },
         }
+        if self._proxy is not None and self._proxy.lvc is not None:
+            health["lvc"] = self._proxy.lvc.stats()
+        if self._proxy is not None and self._proxy.topics is not None:
+            health["topics"] = self._proxy.topics.stats()
+        if self._proxy is not None:
+            health["monitor"] = {**self._proxy.monitor.stats(), "connections": len(self.connections)}
+        if self._publisher is not None:
+            health["inject"] = self._publisher.stats()
+        if self._bridge is not None:
+            health["bridge"] = self._bridge.stats()
+        if self._relay is not None:
+            health["relay"] = {"endpoint": self.settings.core_fanout_endpoint, "received": self._relay.received}
+        if self.bus.sinks:
+            health["sinks"] = {sink.name: sink.stats() for sink in self.bus.sinks}
+        if self.bus.replay is not None:
+            health["replay"] = self.bus.replay.stats()
+        if self.capture_log is not None:
+            health["capture_log"] = self.capture_log.stats()
+        if self.replayer is not None:
+            health["capture_replay"] = self.replayer.status()
+        return health
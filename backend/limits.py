@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Outcomes of TopicSampler.check()
+PASS, DROP, HOLD = 0, 1, 2
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens/s, holding at most `burst`. Loop-thread only."""
+
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float = 0.0) -> None:
+        self.rate = rate
+        self.burst = burst if burst > 0 else max(1.0, rate)
+        self.tokens = self.burst
+        self.stamp: Optional[float] = None
+
+    def take(self, now: float) -> bool:
+        if self.stamp is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+def _number(data: Dict[str, Any], key: str) -> float:
+    value = data.get(key, 0)
+    if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+        raise ValueError(f"{key} must be a non-negative number")
+    return float(value)
+
+
+@dataclass(frozen=True)
+class SamplingRule:
+    """
+    Sampling for topics starting with `prefix`; exactly one mode is set:
+    every=N passes 1 in N messages, max_rate=K passes at most K/s, and
+    interval_ms=T passes the latest message once per T ms.
+    """
+
+    prefix: str = ""
+    every: int = 0
+    max_rate: float = 0.0
+    interval_ms: float = 0.0
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "SamplingRule":
+        if not isinstance(data, dict):
+            raise ValueError("sampling rules must be objects")
+        prefix = data.get("prefix") or ""
+        if not isinstance(prefix, str):
+            raise ValueError("prefix must be a string")
+        every = data.get("every", 0)
+        if not isinstance(every, int) or isinstance(every, bool) or every < 0:
+            raise ValueError("every must be a non-negative integer")
+        rule = cls(prefix=prefix, every=every, max_rate=_number(data, "max_rate"), interval_ms=_number(data, "interval_ms"))
+        if sum(1 for v in (rule.every, rule.max_rate, rule.interval_ms) if v) != 1:
+            raise ValueError("a sampling rule needs exactly one of every, max_rate, interval_ms")
+        return rule
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"prefix": self.prefix}
+        if self.every:
+            out["every"] = self.every
+        elif self.max_rate:
+            out["max_rate"] = self.max_rate
+        else:
+            out["interval_ms"] = self.interval_ms
+        return out
+
+
+def parse_rules(data: Any) -> Tuple[SamplingRule, ...]:
+    if data is None:
+        return ()
+    if not isinstance(data, list):
+        raise ValueError("sampling must be an array of rules")
+    return tuple(SamplingRule.from_dict(d) for d in data)
+
+
+class TopicSampler:
+    """
+    Per-client sampling state, kept per topic so a chatty topic is thinned on its own
+    without starving quiet ones. The longest matching rule prefix wins. For
+    interval rules the caller holds the newest message of a topic until `due()`
+    says its interval is over. Topic state is bounded and reset when full.
+    """
+
+    _MAX_TOPICS = 10000
+
+    def __init__(self, rules: Sequence[SamplingRule]) -> None:
+        self.rules = tuple(sorted(rules, key=lambda r: len(r.prefix), reverse=True))
+        self._state: Dict[str, Any] = {}
+        self.held: Dict[str, Any] = {}
+
+    def rule_for(self, topic: str) -> Optional[SamplingRule]:
+        for rule in self.rules:
+            if topic.startswith(rule.prefix):
+                return rule
+        return None
+
+    def check(self, topic: str, now: float) -> int:
+        rule = self.rule_for(topic)
+        if rule is None:
+            return PASS
+        state = self._state.get(topic)
+        if state is None:
+            if len(self._state) >= self._MAX_TOPICS:
+                self._state.clear()
+            if rule.every:
+                state = [0]
+            elif rule.max_rate:
+                state = TokenBucket(rule.max_rate)
+            else:
+                state = [0.0]  # when the next message may pass
+            self._state[topic] = state
+        if rule.every:
+            state[0] += 1
+            return PASS if state[0] % rule.every == 1 or rule.every == 1 else DROP
+        if rule.max_rate:
+            return PASS if state.take(now) else DROP
+        if now >= state[0]:
+            state[0] = now + rule.interval_ms / 1000.0
+            return PASS
+        return HOLD
+
+    def hold(self, topic: str, event: Any) -> Tuple[bool, float]:
+        """Keep `event` as the newest held for `topic`: (replaced an older one, due time)."""
+        replaced = topic in self.held
+        self.held[topic] = event
+        return replaced, self._state[topic][0]
+
+    def due(self, now: float) -> Tuple[List[Any], Optional[float]]:
+        """Held messages whose interval is over, and when the next one will be."""
+        out: List[Any] = []
+        next_at: Optional[float] = None
+        for topic in list(self.held):
+            state = self._state.get(topic)
+            rule = self.rule_for(topic)
+            if state is None or rule is None or now >= state[0]:
+                out.append(self.held.pop(topic))
+                if state is not None and rule is not None:
+                    state[0] = now + rule.interval_ms / 1000.0
+            elif next_at is None or state[0] < next_at:
+                next_at = state[0]
+        return out, next_at
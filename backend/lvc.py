@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import zmq
+
+# Snapshot replies on the lvc_snapshot_bind ROUTER, after the requester's identity:
+# [VALUE, *cached frames] per cached topic, oldest update first, then [END, count]
+SNAPSHOT_VALUE = b"V"
+SNAPSHOT_END = b"E"
+
+
+class LastValueCache:
+    """
+    Latest message per topic frame, for subscribers that join after it was published.
+    Updates move a topic to the end, so the newest entries are last.
+    LRU-bounded by topic count and total message bytes; `prefixes` limits which topics
+    are kept (empty = all). Messages are kept as the received zmq.Frames, so caching
+    copies nothing. Proxy thread only; stats are read without a lock.
+    """
+
+    def __init__(self, max_topics: int, max_bytes: int, prefixes: Sequence[str] = ()) -> None:
+        self.max_topics = max(1, max_topics)
+        self.max_bytes = max_bytes
+        self.prefixes = tuple(p.encode("utf-8") for p in prefixes)
+        self._values: "OrderedDict[bytes, List[zmq.Frame]]" = OrderedDict()
+        self.nbytes = 0
+        self.evicted = 0
+        self.sent = 0
+        self.snapshots = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def update(self, topic: bytes, msg: List[zmq.Frame]) -> None:
+        if self.prefixes and not topic.startswith(self.prefixes):
+            return
+        values = self._values
+        old = values.pop(topic, None)
+        if old is not None:
+            self.nbytes -= sum(map(len, old))
+        size = sum(map(len, msg))
+        if self.max_bytes > 0 and size > self.max_bytes:
+            return
+        values[topic] = msg
+        self.nbytes += size
+        while len(values) > self.max_topics or (self.max_bytes > 0 and self.nbytes > self.max_bytes):
+            _, dropped = values.popitem(last=False)
+            self.nbytes -= sum(map(len, dropped))
+            self.evicted += 1
+
+    def latest(self, prefix: bytes) -> Optional[List[zmq.Frame]]:
+        """
+        The cached message for a new subscription to `prefix`: the topic equal to it,
+        else the most recently updated topic starting with it.
+        """
+        msg = self._values.get(prefix)
+        if msg is None:
+            msg = next((m for topic, m in reversed(self._values.items()) if topic.startswith(prefix)), None)
+        if msg is not None:
+            self.sent += 1
+        return msg
+
+    def matching(self, prefix: bytes) -> List[List[zmq.Frame]]:
+        """Every cached message whose topic starts with `prefix`, oldest update first."""
+        self.snapshots += 1
+        return [m for topic, m in self._values.items() if topic.startswith(prefix)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "topics": len(self._values),
+            "bytes": self.nbytes,
+            "evicted": self.evicted,
+            "sent": self.sent,
+            "snapshots": self.snapshots,
+        }
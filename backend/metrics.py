@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Hot-path metrics keep one cell per writing thread, so updates never take a lock or
+# contend; scrapes sum the cells. Values read mid-update may be a few increments stale.
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(int(v)) if float(v).is_integer() else repr(v)
+
+
+def _labels(labels: Optional[Dict[str, str]]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def sample(name: str, value: float, labels: Optional[Dict[str, str]] = None) -> str:
+    return f"{name}{_labels(labels)} {_fmt(value)}"
+
+
+def header(name: str, kind: str, help: str) -> List[str]:
+    return [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+
+
+class _Sharded:
+    def __init__(self, width: int) -> None:
+        self._width = width
+        self._local = threading.local()
+        self._cells: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def _cell(self) -> List[float]:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = [0] * self._width
+            with self._lock:
+                self._cells.append(cell)
+            self._local.cell = cell
+            return cell
+
+    def _sum(self) -> List[float]:
+        with self._lock:
+            cells = list(self._cells)
+        total = [0] * self._width
+        for cell in cells:
+            for i, v in enumerate(cell):
+                total[i] += v
+        return total
+
+
+class Counter(_Sharded):
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__(1)
+        self.name = name
+        self.help = help
+
+    def inc(self, n: float = 1) -> None:
+        self._cell()[0] += n
+
+    @property
+    def value(self) -> float:
+        return self._sum()[0]
+
+    def render(self) -> List[str]:
+        return header(self.name, "counter", self.help) + [sample(self.name, self.value)]
+
+
+class Histogram(_Sharded):
+    """Cumulative histogram with fixed upper bounds, in seconds by convention."""
+
+    DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self._bounds = tuple(buckets)
+        # one slot per bucket, +Inf, then sum and count
+        super().__init__(len(self._bounds) + 3)
+        self.name = name
+        self.help = help
+
+    def observe(self, v: float) -> None:
+        cell = self._cell()
+        cell[bisect_left(self._bounds, v)] += 1
+        cell[-2] += v
+        cell[-1] += 1
+
+    def render(self) -> List[str]:
+        total = self._sum()
+        lines = header(self.name, "histogram", self.help)
+        acc = 0.0
+        for bound, n in zip(self._bounds + (float("inf"),), total):
+            acc += n
+            lines.append(sample(self.name + "_bucket", acc, {"le": _fmt(bound)}))
+        lines.append(sample(self.name + "_sum", total[-2]))
+        lines.append(sample(self.name + "_count", total[-1]))
+        return lines
+
+
+class TopK:
+    """
+    Bounded set of heavy keys (Misra-Gries admission) with exact message/byte totals
+    counted since each key was admitted. Single-writer: update() from one thread only.
+    Eviction passes cost O(k) but happen at most once per k updates, so updates are
+    amortized O(1) regardless of key cardinality.
+    """
+
+    def __init__(self, k: int) -> None:
+        self.k = max(1, k)
+        # key -> [admission weight, messages, bytes]
+        self._items: Dict[str, List[int]] = {}
+
+    def update(self, key: str, nbytes: int) -> None:
+        item = self._items.get(key)
+        if item is not None:
+            item[0] += 1
+            item[1] += 1
+            item[2] += nbytes
+            return
+        if len(self._items) < self.k:
+            self._items[key] = [1, 1, nbytes]
+            return
+        # Full: age everyone instead of admitting; drop keys that reach zero
+        for k in [k for k, it in self._items.items() if it[0] <= 1]:
+            del self._items[k]
+        for it in self._items.values():
+            it[0] -= 1
+
+    def items(self) -> List[Tuple[str, int, int]]:
+        return [(k, it[1], it[2]) for k, it in list(self._items.items())]
+
+
+def topic_prefix(topic: str, depth: int) -> str:
+    if depth <= 0:
+        return topic
+    parts = topic.split("/", depth)
+    return "/".join(parts[:depth]) if len(parts) > depth else topic
+
+
+MSGS_IN = Counter("zmqhub_msgs_in_total", "Messages captured from the proxy.")
+PUBLISH_REQUESTS = Counter("zmqhub_publish_requests_total", "Publish requests from the UI/control channel.")
+CAPTURE_SKIPPED = Counter(
+    "zmqhub_capture_skipped_total", "Captured messages no WebSocket viewer wanted, skipped before decoding."
+)
+CAPTURE_TO_LOOP = Histogram(
+    "zmqhub_capture_to_loop_seconds", "Time from capture on a ZMQ thread to fan-out on the event loop."
+)
+LOOP_TO_SEND = Histogram(
+    "zmqhub_loop_to_send_seconds", "Time from fan-out to a completed WebSocket send (oldest event per frame)."
+)
+
+HOT_PATH: Tuple[Any, ...] = (MSGS_IN, CAPTURE_SKIPPED, PUBLISH_REQUESTS, CAPTURE_TO_LOOP, LOOP_TO_SEND)
+
+
+def render(extra: Iterable[str] = ()) -> str:
+    lines: List[str] = []
+    for m in HOT_PATH:
+        lines.extend(m.render())
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
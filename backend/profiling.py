@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from .histogram import bucket, quantiles
+
+# Stages of a bus message, in order. forward: poll-mode proxy loop, from receipt on
+# XSUB to capture; capture: building the event and handing it to the bus ring;
+# ring: waiting in the ring for the loop; decode: held for the decoder pool;
+# fanout: from the start of its fan-out batch until queued for every client;
+# total: receipt to queued. Per frame on each WebSocket: queue (queued until its
+# send starts) and send. loop_lag: how late the event loop wakes from a sleep.
+STAGES = ("forward", "capture", "ring", "decode", "fanout", "total", "queue", "send", "loop_lag")
+
+_HIST, _COUNT, _SUM, _MAX = range(4)
+
+
+class StageTracer:
+    """
+    Latency distributions per stage, in log-linear microsecond buckets (as topic
+    sizes). Only built with profiling_enabled; everywhere else the hot paths test
+    for None once per message or batch. Each stage has a single writing thread, and
+    readers only copy.
+    """
+
+    QUANTILES = (0.5, 0.9, 0.99, 0.999)
+    _NAMES = ("p50_ms", "p90_ms", "p99_ms", "p999_ms")
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self._stages: Dict[str, List[Any]] = {s: [{}, 0, 0, 0] for s in STAGES}
+        self.since = time.time()
+
+    def observe(self, stage: str, ns: int) -> None:
+        st = self._stages[stage]
+        hist = st[_HIST]
+        b = bucket(max(0, ns) // 1000)
+        hist[b] = hist.get(b, 0) + 1
+        st[_COUNT] += 1
+        st[_SUM] += ns
+        if ns > st[_MAX]:
+            st[_MAX] = ns
+
+    def snapshot(self) -> Dict[str, Any]:
+        stages: Dict[str, Any] = {}
+        for name, (hist, count, total, peak) in self._stages.items():
+            if not count:
+                continue
+            entry: Dict[str, Any] = {"count": count, "mean_ms": round(total / count / 1e6, 4)}
+            # Bucket midpoints, in microseconds, capped by the exact maximum
+            for key, us in zip(self._NAMES, quantiles(dict(hist), self.QUANTILES)):
+                entry[key] = round(min(us * 1000, peak) / 1e6, 4)
+            entry["max_ms"] = round(peak / 1e6, 4)
+            stages[name] = entry
+        return {"since": self.since, "stages": stages}
+
+
+async def watch_loop_lag(tracer: StageTracer, interval_s: float) -> None:
+    """Sleep `interval_s` at a time on the event loop and record how late each wake-up is."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval_s)
+        tracer.observe("loop_lag", int(max(0.0, loop.time() - start - interval_s) * 1e9))
+
+
+_profiling = threading.Lock()
+
+
+def _label(code: Any) -> str:
+    path = code.co_filename
+    short = os.path.join(os.path.basename(os.path.dirname(path)), os.path.basename(path))
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, hz: float) -> Tuple[str, int]:
+    """
+    Sample the Python stack of every other thread `hz` times a second for `seconds`.
+    Returns collapsed stacks, one "thread;outermost;...;innermost count" line per
+    distinct stack (flamegraph.pl, speedscope, inferno), and the number of samples.
+    Threads inside native code (libzmq, select) show the Python frame that called in.
+    One profile at a time; RuntimeError if another is running.
+    """
+    if not _profiling.acquire(blocking=False):
+        raise RuntimeError("a profile is already running")
+    try:
+        me = threading.get_ident()
+        # Samples only collect code objects, innermost first; labels are built once at the end
+        counts: Counter[Tuple[str, Tuple[Any, ...]]] = Counter()
+        names: Dict[int, str] = {}
+        interval = 1.0 / hz
+        deadline = time.monotonic() + seconds
+        next_at = time.monotonic()
+        samples = 0
+        while next_at < deadline:
+            frames = sys._current_frames()
+            if not frames.keys() <= names.keys():
+                names = {t.ident: t.name for t in threading.enumerate() if t.ident is not None}
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack: List[Any] = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                counts[(names.get(ident) or f"thread-{ident}", tuple(stack))] += 1
+            frames = {}
+            samples += 1
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+    finally:
+        _profiling.release()
+    labels: Dict[Any, str] = {}
+    lines: List[str] = []
+    for (thread, stack), n in counts.most_common():
+        parts = [thread]
+        for code in reversed(stack):
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = _label(code)
+            parts.append(label)
+        lines.append(f"{';'.join(parts)} {n}\n")
+    return "".join(lines), samples
@@ -1,16 +1,16 @@
 from __future__ import annotations
 
 import base64
+import binascii
 import logging
-import queue
-import threading
-import time
-from typing import List, Optional, Sequence
+import struct
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import zmq
 
 from .config import Settings
 from .events import EventBus, now_iso
+from .metrics import PUBLISH_REQUESTS
 
 log = logging.getLogger("zmqhub.publisher")
 
@@ -36,85 +36,169 @@ def _build_frames(topic: str, payload: Optional[str], encoding: str, multipart:
     return frames
 
 
+def frames_from_message(data: Any) -> List[bytes]:
+    """Validate one {"topic","payload","encoding","multipart"} publish message into ZMQ frames."""
+    if not isinstance(data, dict):
+        raise ValueError("message must be an object")
+    topic = data.get("topic") or ""
+    payload = data.get("payload")
+    encoding = (data.get("encoding") or "utf8").lower()
+    multipart = data.get("multipart")
+    if not isinstance(topic, str) or not topic:
+        raise ValueError("topic must be a non-empty string")
+    if encoding not in ("utf8", "base64"):
+        raise ValueError("encoding must be 'utf8' or 'base64'")
+    if payload is not None and not isinstance(payload, str):
+        raise ValueError("payload must be a string")
+    if multipart is not None and not (isinstance(multipart, list) and all(isinstance(x, str) for x in multipart)):
+        raise ValueError("multipart must be an array of base64 strings")
+    try:
+        return _build_frames(topic=topic, payload=payload, encoding=encoding, multipart=multipart)
+    except binascii.Error as e:
+        raise ValueError(f"invalid base64: {e}") from None
+
+
+# Length-prefixed binary publish stream: per message u16 nframes, then per frame
+# u32 size and the frame bytes (little-endian).
+_NFRAMES = struct.Struct("<H")
+_FRAME_SIZE = struct.Struct("<I")
+
+
+class BinaryMessageReader:
+    """Incrementally split a length-prefixed binary publish stream into frame lists."""
+
+    def __init__(self) -> None:
+        self._buf = bytearray()
+
+    def feed(self, chunk: bytes) -> Iterator[List[bytes]]:
+        buf = self._buf
+        buf += chunk
+        off = 0
+        while True:
+            if off + _NFRAMES.size > len(buf):
+                break
+            (n,) = _NFRAMES.unpack_from(buf, off)
+            pos = off + _NFRAMES.size
+            frames: List[bytes] = []
+            for _ in range(n):
+                if pos + _FRAME_SIZE.size > len(buf):
+                    break
+                (size,) = _FRAME_SIZE.unpack_from(buf, pos)
+                pos += _FRAME_SIZE.size
+                if pos + size > len(buf):
+                    break
+                frames.append(bytes(buf[pos : pos + size]))
+                pos += size
+            if len(frames) < n:
+                break  # message continues in the next chunk
+            off = pos
+            yield frames
+        del buf[:off]
+
+    @property
+    def pending(self) -> int:
+        return len(self._buf)
+
+
 class Publisher:
-    """Background thread that holds a PUB socket to inject UI-originated messages into the hub via XSUB."""
+    """
+    Injects UI-originated messages into the hub through an inproc XPUB connected to
+    the proxy's XSUB on the shared context: no TCP loopback, no thread and no queue.
+    Owned by one thread (the event loop, or the core's inject thread). XPUB_NODROP
+    makes a full pipe refuse sends instead of silently dropping, and that refusal is
+    reported back to the caller as backpressure.
+    """
 
-    def __init__(self, settings: Settings, bus: EventBus) -> None:
+    def __init__(self, settings: Settings, bus: EventBus, context: Optional[zmq.Context] = None) -> None:
         self.settings = settings
         self.bus = bus
-        self._ctx: zmq.Context | None = None
+        self._ctx = context
         self._sock: zmq.Socket | None = None
-        self._q: queue.Queue[List[bytes]] = queue.Queue(maxsize=1000)
-        self._stop = threading.Event()
-        self._thread: threading.Thread | None = None
+        self.sent = 0
+        self.refused = 0
 
-    def start(self) -> None:
-        if self._thread and self._thread.is_alive():
+    def start(self, context: Optional[zmq.Context] = None) -> None:
+        if self._sock is not None:
             return
-        self._stop.clear()
-        self._thread = threading.Thread(target=self._run, name="zmqhub-publisher", daemon=True)
-        self._thread.start()
+        ctx = context or self._ctx or zmq.Context.instance()
+        self._ctx = ctx
+        sock = ctx.socket(zmq.XPUB)
+        sock.setsockopt(zmq.XPUB_NODROP, 1)
+        sock.setsockopt(zmq.LINGER, self.settings.linger_ms)
+        sock.set_hwm(self.settings.inject_hwm)
+        # Subscriptions from downstream reach us through the XSUB as soon as we
+        # attach, so unlike a TCP PUB there is no join delay to sleep out.
+        sock.connect(self.settings.inject_endpoint)
+        self._sock = sock
+        log.info("Publisher connected to %s", self.settings.inject_endpoint)
 
     def stop(self) -> None:
-        self._stop.set()
-        if self._thread:
-            self._thread.join(timeout=2.0)
-        self._thread = None
-        try:
-            if self._sock is not None:
-                self._sock.close(0)
-        finally:
-            self._sock = None
-            if self._ctx is not None:
-                try:
-                    self._ctx.term()
-                except Exception:
-                    pass
-                self._ctx = None
-
-    def publish(self, *, topic: str, payload: Optional[str] = None, encoding: str = "utf8", multipart: Optional[Sequence[str]] = None) -> None:
+        # The context belongs to the proxy, which terminates it
+        if self._sock is not None:
+            try:
+                self._sock.close(self.settings.linger_ms)
+            finally:
+                self._sock = None
+
+    def publish(self, *, topic: str, payload: Optional[str] = None, encoding: str = "utf8", multipart: Optional[Sequence[str]] = None) -> bool:
+        """Publish one message and echo it on the bus; False if the hub pushed back."""
         frames = _build_frames(topic=topic, payload=payload, encoding=encoding, multipart=multipart)
-        try:
-            self._q.put(frames, timeout=1.0)
-        except queue.Full:
-            log.warning("Publisher queue full; dropping message")
+        return self.publish_frames(frames, echo=True)
 
-    def _run(self) -> None:
-        self._ctx = zmq.Context(io_threads=1)
-        sock = self._ctx.socket(zmq.PUB)
-        self._sock = sock
-        sock.setsockopt(zmq.LINGER, self.settings.linger_ms)
-        sock.set_hwm(10000)
-        sock.connect(self.settings.inject_connect)
-        log.info("Publisher connected to %s", self.settings.inject_connect)
-        time.sleep(0.2)
+    def publish_frames(self, frames: List[bytes], echo: bool = False) -> bool:
+        if self.publish_batch([frames])[0] != 1:
+            return False
+        if echo:
+            self.bus.publish_threadsafe(
+                {
+                    "ts": now_iso(),
+                    "kind": "bus",
+                    "source": "inject",
+                    "topic": frames[0].decode("utf-8", errors="replace"),
+                    "payload": None if len(frames) <= 1 else (frames[1].decode("utf-8", errors="ignore") if len(frames) == 2 else ["<bytes>"] * (len(frames) - 1)),
+                    "meta": {"ui_originated": True, "parts": len(frames), "sizes": [len(x) for x in frames]},
+                }
+            )
+        return True
+
+    def publish_batch(self, batch: Iterable[List[bytes]]) -> Tuple[int, int]:
+        """
+        Send messages in order until the hub pushes back; returns (accepted, rejected),
+        where the rejected ones are the unsent tail. Batches are not echoed as
+        individual inject events; the messages show up as captured bus traffic.
+        """
+        batch = list(batch)
+        sock = self._sock
+        if sock is None:
+            return 0, len(batch)
+        PUBLISH_REQUESTS.inc(len(batch))
+        self._drain()
+        sent = 0
         try:
-            while not self._stop.is_set():
-                try:
-                    frames = self._q.get(timeout=0.1)
-                except queue.Empty:
-                    continue
-                try:
-                    sock.send_multipart(frames, flags=0)
-                    topic = frames[0].decode("utf-8", errors="ignore")
-                    self.bus.publish_threadsafe(
-                        {
-                            "ts": now_iso(),
-                            "kind": "bus",
-                            "source": "inject",
-                            "topic": topic,
-                            "payload": None if len(frames) <= 1 else (frames[1].decode("utf-8", errors="ignore") if len(frames) == 2 else ["<bytes>"] * (len(frames) - 1)),
-                            "meta": {"ui_originated": True, "parts": len(frames), "sizes": [len(x) for x in frames]},
-                        }
-                    )
-                except Exception:
-                    log.exception("Failed to send injected message")
-        finally:
-            try:
-                sock.close(self.settings.linger_ms)
-            except Exception:
-                pass
+            for frames in batch:
+                sock.send_multipart(frames, flags=zmq.NOBLOCK)
+                sent += 1
+        except zmq.Again:
+            pass
+        except zmq.ZMQError:
+            log.exception("Failed to send injected message")
+        self.sent += sent
+        if sent < len(batch):
+            self.refused += 1
+        return sent, len(batch) - sent
+
+    def wait_writable(self, timeout_ms: int) -> bool:
+        """Block the owning thread until the injector has room again."""
+        return self._sock is not None and bool(self._sock.poll(timeout_ms, zmq.POLLOUT))
+
+    def _drain(self) -> None:
+        # XPUB queues the subscription messages it sees; we have no use for them
+        sock = self._sock
+        while sock is not None:
             try:
-                self._ctx.term()
-            except Exception:
-                pass
+                sock.recv(flags=zmq.NOBLOCK)
+            except zmq.Again:
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        return {"endpoint": self.settings.inject_endpoint, "sent": self.sent, "refused": self.refused}
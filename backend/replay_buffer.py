@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+from collections import deque
+from itertools import islice
+from typing import Any, Deque, Dict, List, Optional
+
+
+class _Entry:
+    __slots__ = ("seq", "topic", "event", "size")
+
+    def __init__(self, seq: int, topic: Optional[str], event: Any, size: int) -> None:
+        self.seq = seq
+        self.topic = topic
+        self.event = event
+        self.size = size
+
+
+class ReplayBuffer:
+    """
+    Fixed-capacity ring of recent events, bounded by count and by their approximate
+    size in bytes, which the caller supplies.
+    Events arrive in bus sequence order but need not be consecutive: the bus leaves
+    out topics it does not keep. Entries are addressed by their arrival position
+    (slot = position % capacity), so "everything after seq S" is a binary search
+    and a slice; a per-topic deque of positions answers "last N on topic X" without
+    scanning. An event larger than the whole byte budget is not kept; its seq is
+    remembered as skipped, so a reader resuming from before it is told of the gap.
+    Loop-thread only.
+    """
+
+    def __init__(self, max_events: int, max_bytes: int) -> None:
+        self._cap = max(1, max_events)
+        self._max_bytes = max_bytes
+        self._slots: List[Optional[_Entry]] = [None] * self._cap
+        self._head = 0  # position of the oldest entry
+        self._tail = 0  # position of the next entry
+        self._first = 1  # every kept event from this seq on is still here
+        self._last = 0  # seq of the latest event offered
+        self._bytes = 0
+        self._topics: Dict[str, Deque[int]] = {}
+        self._skipped: Deque[int] = deque()  # seqs > _first that were too large to keep
+
+    @property
+    def first_seq(self) -> int:
+        return self._first
+
+    @property
+    def last_seq(self) -> int:
+        return self._last
+
+    def __len__(self) -> int:
+        return self._tail - self._head
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "events": len(self),
+            "bytes": self._bytes,
+            "topics": len(self._topics),
+            "first_seq": self._first,
+            "last_seq": self.last_seq,
+            "skipped": len(self._skipped),
+        }
+
+    def gap(self, seq: int) -> bool:
+        """Whether some event after `seq` is missing: evicted, or skipped as too large."""
+        return seq + 1 < self._first or (bool(self._skipped) and self._skipped[-1] > seq)
+
+    def append(self, seq: int, topic: Optional[str], event: Any, size: int) -> None:
+        if seq <= self._last:
+            # Sequence went back (e.g. a new bus); start over from here
+            self.clear(seq)
+        self._last = seq
+        if size > self._max_bytes:
+            self._skip(seq)
+            return
+        while len(self) >= self._cap or (len(self) and self._bytes + size > self._max_bytes):
+            self._evict()
+        pos = self._tail
+        self._slots[pos % self._cap] = _Entry(seq, topic, event, size)
+        self._tail = pos + 1
+        self._bytes += size
+        if topic is not None:
+            positions = self._topics.get(topic)
+            if positions is None:
+                positions = self._topics[topic] = deque()
+            positions.append(pos)
+
+    def _skip(self, seq: int) -> None:
+        if len(self._skipped) >= self._cap:
+            # Forget the oldest skip by moving the window past it
+            oldest = self._skipped.popleft()
+            while len(self) and self._entry(self._head).seq < oldest:
+                self._evict()
+            self._advance(oldest + 1)
+        self._skipped.append(seq)
+        self._advance(self._first)
+
+    def _advance(self, first: int) -> None:
+        # Skips at the start of the window are just more missing history
+        first = max(self._first, first)
+        while self._skipped and self._skipped[0] <= first:
+            first = max(first, self._skipped.popleft() + 1)
+        self._first = first
+
+    def _evict(self) -> None:
+        idx = self._head % self._cap
+        entry = self._slots[idx]
+        self._slots[idx] = None
+        self._head += 1
+        if entry is None:
+            return
+        self._advance(entry.seq + 1)
+        self._bytes -= entry.size
+        if entry.topic is not None:
+            positions = self._topics[entry.topic]
+            positions.popleft()
+            if not positions:
+                del self._topics[entry.topic]
+
+    def clear(self, next_seq: int) -> None:
+        self._slots = [None] * self._cap
+        self._topics.clear()
+        self._skipped.clear()
+        self._bytes = 0
+        self._head = self._tail = 0
+        self._first = next_seq
+        self._last = next_seq - 1
+
+    def _entry(self, pos: int) -> _Entry:
+        return self._slots[pos % self._cap]  # type: ignore[return-value]
+
+    def since(self, seq: int, limit: Optional[int] = None) -> List[Any]:
+        """Events with sequence number > seq, oldest first."""
+        lo, hi = self._head, self._tail
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid).seq <= seq:
+                lo = mid + 1
+            else:
+                hi = mid
+        stop = self._tail if limit is None else min(self._tail, lo + limit)
+        return [self._entry(p).event for p in range(lo, stop)]
+
+    def last(self, n: int, topic: Optional[str] = None) -> List[Any]:
+        """The last n events, overall or on one topic, oldest first."""
+        if n <= 0:
+            return []
+        if topic is None:
+            return [self._entry(p).event for p in range(max(self._head, self._tail - n), self._tail)]
+        positions = self._topics.get(topic)
+        if not positions:
+            return []
+        picked = list(islice(reversed(positions), n))
+        picked.reverse()
+        return [self._entry(p).event for p in picked]
@@ -0,0 +1,421 @@
+from __future__ import annotations
+
+import glob
+import gzip
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.request
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .events import Event, EventFilter, encode_event
+
+log = logging.getLogger("zmqhub.sinks")
+
+TYPES = ("file", "http", "tcp")
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+ON_FULL = (DROP_OLDEST, DROP_NEWEST)
+
+
+def _number(data: Dict[str, Any], key: str, default: float, minimum: float = 0) -> float:
+    value = data.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < minimum:
+        raise ValueError(f"{key} must be a number >= {minimum}")
+    return value
+
+
+def _string(data: Dict[str, Any], key: str) -> str:
+    value = data.get(key) or ""
+    if not isinstance(value, str):
+        raise ValueError(f"{key} must be a string")
+    return value
+
+
+@dataclass(frozen=True)
+class SinkSpec:
+    """
+    One export sink: `type` file (rotating NDJSON under the `path` prefix, optionally
+    gzipped), http (NDJSON batches POSTed to `url`) or tcp (NDJSON batches written to
+    `address`, host:port), the events it takes (a filter as in set_filter), its buffer
+    and batching, and how often a failed batch is retried before it is dropped.
+    """
+
+    type: str
+    name: str = ""
+    filter: EventFilter = field(default_factory=EventFilter)
+    queue_size: int = 10000
+    queue_bytes: int = 16 * 1024 * 1024  # of buffered NDJSON (0 = count only)
+    on_full: str = DROP_OLDEST
+    batch_max: int = 1000
+    batch_ms: float = 1000.0
+    batch_bytes: int = 1024 * 1024
+    retries: int = 3
+    retry_backoff_ms: float = 500.0  # doubles on every retry of the same batch
+    timeout_ms: float = 5000.0
+    path: str = ""
+    gzip: bool = False
+    rotate_bytes: int = 64 * 1024 * 1024
+    rotate_s: float = 3600.0
+    keep: int = 0  # files kept per file sink (0 = all)
+    url: str = ""
+    headers: Tuple[Tuple[str, str], ...] = ()
+    address: str = ""
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "SinkSpec":
+        if not isinstance(data, dict):
+            raise ValueError("sinks must be objects")
+        kind = data.get("type")
+        if kind not in TYPES:
+            raise ValueError(f"sink type must be one of {', '.join(TYPES)}")
+        on_full = data.get("on_full", DROP_OLDEST)
+        if on_full not in ON_FULL:
+            raise ValueError(f"on_full must be one of {', '.join(ON_FULL)}")
+        headers = data.get("headers") or {}
+        if not (isinstance(headers, dict) and all(isinstance(k, str) and isinstance(v, str) for k, v in headers.items())):
+            raise ValueError("headers must be an object of strings")
+        spec = cls(
+            type=kind,
+            name=_string(data, "name") or kind,
+            filter=EventFilter.from_dict(data),
+            queue_size=int(_number(data, "queue_size", 10000, 1)),
+            queue_bytes=int(_number(data, "queue_bytes", 16 * 1024 * 1024)),
+            on_full=on_full,
+            batch_max=int(_number(data, "batch_max", 1000, 1)),
+            batch_ms=float(_number(data, "batch_ms", 1000.0)),
+            batch_bytes=int(_number(data, "batch_bytes", 1024 * 1024, 1)),
+            retries=int(_number(data, "retries", 3)),
+            retry_backoff_ms=float(_number(data, "retry_backoff_ms", 500.0)),
+            timeout_ms=float(_number(data, "timeout_ms", 5000.0, 1)),
+            path=_string(data, "path"),
+            gzip=bool(data.get("gzip", False)),
+            rotate_bytes=int(_number(data, "rotate_bytes", 64 * 1024 * 1024)),
+            rotate_s=float(_number(data, "rotate_s", 3600.0)),
+            keep=int(_number(data, "keep", 0)),
+            url=_string(data, "url"),
+            headers=tuple(sorted(headers.items())),
+            address=_string(data, "address"),
+        )
+        if kind == "file" and not spec.path:
+            raise ValueError("file sinks need a path")
+        if kind == "http" and not spec.url.startswith(("http://", "https://")):
+            raise ValueError("http sinks need an http(s) url")
+        if kind == "tcp":
+            _split_address(spec.address)
+        return spec
+
+    @property
+    def target(self) -> str:
+        return self.path or self.url or self.address
+
+
+def _split_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.removeprefix("tcp://").rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError("tcp sinks need an address as host:port")
+    return host.strip("[]"), int(port)
+
+
+def parse_sinks(data: Any) -> Tuple[SinkSpec, ...]:
+    if data is None:
+        return ()
+    if not isinstance(data, list):
+        raise ValueError("sinks must be an array")
+    specs = tuple(SinkSpec.from_dict(d) for d in data)
+    names = [s.name for s in specs]
+    if len(set(names)) != len(names):
+        raise ValueError("sink names must be unique")
+    return specs
+
+
+class Sink:
+    """
+    Base export sink. The bus hands it matching events on the loop thread, which
+    costs a filter check, the event's JSON (usually already built for clients) and a
+    deque append; batching, I/O and retries with backoff run on the sink's own
+    thread, which only ever sees encoded lines. The buffer holds at most
+    `queue_size` events and `queue_bytes` of NDJSON and, when full, drops the oldest
+    or the newest, so a slow or dead sink loses its own events and never holds up
+    clients or the proxy.
+    A batch closes at batch_max events, batch_bytes of NDJSON or batch_ms after the
+    previous one; one that still fails after `retries` retries is dropped.
+    Subclasses implement send() and close().
+    """
+
+    def __init__(self, spec: SinkSpec) -> None:
+        self.spec = spec
+        self.name = spec.name
+        self.filter = spec.filter
+        self._buf: Deque[bytes] = deque()
+        # Buffered bytes are added by the loop and taken by the sink thread; each side
+        # writes only its own counters, so neither needs a lock
+        self._bytes_in = 0
+        self._bytes_evicted = 0
+        self._bytes_out = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.accepted = 0
+        self.sent = 0
+        self.sent_bytes = 0
+        self.batches = 0
+        self.retries = 0
+        self.errors = 0
+        self.dropped = {"queue_full": 0, "send_failed": 0}
+        self.last_error: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+        self.last_sent_at: Optional[float] = None
+        self.failing = False
+
+    @property
+    def queued(self) -> int:
+        return len(self._buf)
+
+    @property
+    def queued_bytes(self) -> int:
+        return self._bytes_in - self._bytes_evicted - self._bytes_out
+
+    def wants(self, event: Event) -> bool:
+        flt = self.filter
+        if flt.include:
+            topic = event.get("topic")
+            if isinstance(topic, str) and not topic.startswith(flt.include):
+                return False
+        return flt.is_open or flt.accepts(event)
+
+    def offer(self, event: Event) -> None:
+        """Loop thread: buffer one event, dropping per on_full when the buffer is full."""
+        # Encoded here: bus events cache their JSON, and only the loop may fill it
+        line = encode_event(event).encode("utf-8")
+        size = len(line) + 1
+        buf = self._buf
+        spec = self.spec
+        while buf and (len(buf) >= spec.queue_size or (spec.queue_bytes > 0 and self.queued_bytes + size > spec.queue_bytes)):
+            self.dropped["queue_full"] += 1
+            if spec.on_full == DROP_NEWEST:
+                return
+            try:
+                self._bytes_evicted += len(buf.popleft()) + 1
+            except IndexError:
+                break  # the sink thread took the rest
+        buf.append(line)
+        self._bytes_in += size
+        self.accepted += 1
+        if len(buf) >= self.spec.batch_max and not self._wake.is_set():
+            self._wake.set()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"zmqhub-sink-{self.name}", daemon=True)
+        self._thread.start()
+        log.info("Export sink %s (%s) -> %s", self.name, self.spec.type, self.spec.target)
+
+    def stop(self) -> None:
+        """Send what is buffered (one attempt per batch), then close."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=self.spec.timeout_ms / 1000.0 + 2.0)
+        self._thread = None
+
+    def _run(self) -> None:
+        wait = self.spec.batch_ms / 1000.0
+        try:
+            while True:
+                stopping = self._stop.is_set()
+                if not stopping and len(self._buf) < self.spec.batch_max:
+                    self._wake.wait(wait)
+                    self._wake.clear()
+                data, n = self._take()
+                if n:
+                    self._deliver(data, n)
+                elif stopping:
+                    break
+        finally:
+            try:
+                self.close()
+            except Exception:
+                log.exception("Failed to close sink %s", self.name)
+
+    def _take(self) -> Tuple[bytes, int]:
+        buf = self._buf
+        lines: List[bytes] = []
+        size = 0
+        while len(lines) < self.spec.batch_max and size < self.spec.batch_bytes:
+            try:
+                line = buf.popleft()
+            except IndexError:
+                break
+            lines.append(line)
+            size += len(line) + 1
+        self._bytes_out += size
+        if not lines:
+            return b"", 0
+        lines.append(b"")
+        return b"\n".join(lines), len(lines) - 1
+
+    def _deliver(self, data: bytes, n: int) -> None:
+        delay = self.spec.retry_backoff_ms / 1000.0
+        for attempt in range(self.spec.retries + 1):
+            try:
+                self.send(data, n)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                self.last_error_at = time.time()
+                if not self.failing:
+                    log.warning("Export sink %s failing: %s", self.name, self.last_error)
+                    self.failing = True
+                # Shutting down: one attempt only
+                if attempt == self.spec.retries or self._stop.wait(delay):
+                    break
+                self.retries += 1
+                delay *= 2
+                continue
+            self.sent += n
+            self.sent_bytes += len(data)
+            self.batches += 1
+            self.last_sent_at = time.time()
+            if self.failing:
+                log.info("Export sink %s recovered", self.name)
+                self.failing = False
+            return
+        self.dropped["send_failed"] += n
+
+    def send(self, data: bytes, count: int) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "type": self.spec.type,
+            "target": self.spec.target,
+            "queued": self.queued,
+            "queue_size": self.spec.queue_size,
+            "queued_bytes": self.queued_bytes,
+            "queue_bytes": self.spec.queue_bytes,
+            "accepted": self.accepted,
+            "sent": self.sent,
+            "sent_bytes": self.sent_bytes,
+            "batches": self.batches,
+            "retries": self.retries,
+            "errors": self.errors,
+            "dropped": dict(self.dropped),
+            "failing": self.failing,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+            "last_sent_at": self.last_sent_at,
+        }
+
+
+class FileSink(Sink):
+    """
+    NDJSON files named <path>-<UTC time>-<n>.ndjson[.gz], rotated after rotate_bytes of
+    NDJSON or rotate_s seconds; the newest `keep` files are kept (0 = all). Every
+    batch is flushed, so a gzip file is readable up to the last batch.
+    """
+
+    def __init__(self, spec: SinkSpec) -> None:
+        super().__init__(spec)
+        self._suffix = ".ndjson.gz" if spec.gzip else ".ndjson"
+        directory = os.path.dirname(spec.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Timestamped names sort by age, files from earlier runs included
+        self._files = sorted(glob.glob(glob.escape(spec.path) + "-*" + self._suffix))
+        self._file: Any = None
+        self._opened = 0.0
+        self._written = 0
+        self._n = 0
+
+    def _rotate(self) -> None:
+        self.close()
+        self._n += 1
+        name = f"{self.spec.path}-{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}-{self._n:04d}{self._suffix}"
+        self._file = gzip.open(name, "ab") if self.spec.gzip else open(name, "ab")
+        self._opened = time.monotonic()
+        self._written = 0
+        self._files.append(name)
+        keep = self.spec.keep
+        while keep > 0 and len(self._files) > keep:
+            old = self._files.pop(0)
+            try:
+                os.remove(old)
+            except OSError as e:
+                log.warning("Failed to remove %s: %s", old, e)
+
+    def send(self, data: bytes, count: int) -> None:
+        spec = self.spec
+        if (
+            self._file is None
+            or (spec.rotate_bytes > 0 and self._written >= spec.rotate_bytes)
+            or (spec.rotate_s > 0 and time.monotonic() - self._opened >= spec.rotate_s)
+        ):
+            self._rotate()
+        try:
+            self._file.write(data)
+            self._file.flush()
+        except OSError:
+            self.close()  # a retry starts a new file
+            raise
+        self._written += len(data)
+
+    def close(self) -> None:
+        f, self._file = self._file, None
+        if f is not None:
+            f.close()
+
+
+class HttpSink(Sink):
+    """POSTs each batch to `url` as application/x-ndjson (gzip-encoded with gzip: true)."""
+
+    def send(self, data: bytes, count: int) -> None:
+        spec = self.spec
+        headers = {"Content-Type": "application/x-ndjson", "X-Zmqhub-Events": str(count), **dict(spec.headers)}
+        if spec.gzip:
+            data = gzip.compress(data)
+            headers["Content-Encoding"] = "gzip"
+        request = urllib.request.Request(spec.url, data=data, headers=headers, method="POST")
+        # Non-2xx answers raise HTTPError
+        with urllib.request.urlopen(request, timeout=spec.timeout_ms / 1000.0) as response:
+            response.read()
+
+
+class TcpSink(Sink):
+    """Writes NDJSON batches to one TCP connection, reconnecting after errors."""
+
+    def __init__(self, spec: SinkSpec) -> None:
+        super().__init__(spec)
+        self._address = _split_address(spec.address)
+        self._sock: Optional[socket.socket] = None
+
+    def send(self, data: bytes, count: int) -> None:
+        if self._sock is None:
+            self._sock = socket.create_connection(self._address, timeout=self.spec.timeout_ms / 1000.0)
+        try:
+            self._sock.sendall(data)
+        except OSError:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
+
+
+def build_sink(spec: SinkSpec) -> Sink:
+    if spec.type == "file":
+        return FileSink(spec)
+    if spec.type == "http":
+        return HttpSink(spec)
+    return TcpSink(spec)
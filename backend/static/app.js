@@ -9,9 +9,150 @@
   const encodingEl = document.getElementById('encoding');
   const pubResultEl = document.getElementById('pub-result');
   const clearBtn = document.getElementById('clear');
+  const filterForm = document.getElementById('filter-form');
+  const filterIncludeEl = document.getElementById('filter-include');
+  const filterKindsEl = document.getElementById('filter-kinds');
+  const filterTextEl = document.getElementById('filter-text');
 
+  const MAX_ROWS = 1000;
   let total = 0;
   let dropped = 0;
+  let pending = [];
+  let renderScheduled = false;
+
+  // Binary /ws/events records (see pack_binary in backend/events.py). Parts stay as
+  // views into the received buffer and are only decoded when a row is rendered.
+  const BIN_VERSION = 1;
+  const BIN_FLAG_JSON = 0x01;
+  const BIN_FLAG_TRUNCATED = 0x02;
+  const utf8 = new TextDecoder('utf-8');
+  const utf8Strict = new TextDecoder('utf-8', { fatal: true });
+
+  function decodePart(bytes) {
+    try {
+      return utf8Strict.decode(bytes);
+    } catch (e) {
+      let s = '';
+      for (let i = 0; i < bytes.length; i += 0x8000) {
+        s += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+      }
+      return btoa(s);
+    }
+  }
+
+  class BinaryEvent {
+    constructor(seq, tsMs, kind, source, parts, sizes) {
+      this.seq = seq;
+      this.tsMs = tsMs;
+      this.kind = kind;
+      this.source = source;
+      this.parts = parts;
+      // Original frame sizes when the parts are capture previews, otherwise null
+      this.sizes = sizes;
+    }
+
+    get meta() {
+      return this.sizes ? { truncated: true, sizes: this.sizes } : {};
+    }
+
+    get ts() {
+      return new Date(this.tsMs).toISOString();
+    }
+
+    get topic() {
+      return this.parts.length ? decodePart(this.parts[0]) : '';
+    }
+
+    get payload() {
+      const rest = this.parts.slice(1);
+      if (!rest.length) return null;
+      return rest.length === 1 ? decodePart(rest[0]) : rest.map(decodePart);
+    }
+  }
+
+  function decodeBinary(buf) {
+    const view = new DataView(buf);
+    const out = [];
+    let off = 0;
+    while (off + 4 <= buf.byteLength) {
+      const end = off + 4 + view.getUint32(off, true);
+      if (view.getUint8(off + 4) !== BIN_VERSION) {
+        console.error('unsupported binary event version');
+        break;
+      }
+      const flags = view.getUint8(off + 5);
+      const nparts = view.getUint16(off + 6, true);
+      const seq = Number(view.getBigUint64(off + 8, true));
+      const tsMs = view.getFloat64(off + 16, true);
+      const kindLen = view.getUint8(off + 24);
+      const sourceLen = view.getUint8(off + 25);
+      let pos = off + 26;
+      const kind = utf8.decode(new Uint8Array(buf, pos, kindLen));
+      pos += kindLen;
+      const source = utf8.decode(new Uint8Array(buf, pos, sourceLen));
+      pos += sourceLen;
+      let data = pos + 4 * nparts;
+      const parts = [];
+      for (let i = 0; i < nparts; i++) {
+        const n = view.getUint32(pos + 4 * i, true);
+        parts.push(new Uint8Array(buf, data, n));
+        data += n;
+      }
+      let sizes = null;
+      if (flags & BIN_FLAG_TRUNCATED) {
+        sizes = [];
+        for (let i = 0; i < nparts; i++) sizes.push(view.getUint32(data + 4 * i, true));
+      }
+      out.push(flags & BIN_FLAG_JSON ? JSON.parse(utf8.decode(parts[0])) : new BinaryEvent(seq, tsMs, kind, source, parts, sizes));
+      off = end;
+    }
+    return out;
+  }
+
+  function buildRow(data) {
+    const tr = document.createElement('tr');
+    tr.className = `kind-${data.kind || 'unknown'}`;
+
+    const tdTs = document.createElement('td');
+    tdTs.textContent = data.ts || '';
+    const tdKind = document.createElement('td');
+    tdKind.textContent = data.kind || '';
+    const tdSource = document.createElement('td');
+    tdSource.textContent = data.source || '';
+    const tdTopic = document.createElement('td');
+    tdTopic.textContent = typeof data.topic === 'string' ? data.topic : (data.topic == null ? '' : String(data.topic));
+    const tdPayload = document.createElement('td');
+    const p = data.payload;
+    tdPayload.textContent = p !== null && typeof p === 'object' ? JSON.stringify(p) : (p == null ? '' : String(p));
+    const meta = data.meta;
+    if (meta && meta.truncated) {
+      const total = meta.sizes.slice(1).reduce((a, b) => a + b, 0);
+      tdPayload.textContent += ` … (${total} bytes)`;
+    }
+
+    tr.appendChild(tdTs);
+    tr.appendChild(tdKind);
+    tr.appendChild(tdSource);
+    tr.appendChild(tdTopic);
+    tr.appendChild(tdPayload);
+    return tr;
+  }
+
+  // One DOM update per animation frame, however many events arrived since the last one
+  function render() {
+    renderScheduled = false;
+    const batch = pending;
+    pending = [];
+    const frag = document.createDocumentFragment();
+    for (let i = batch.length - 1; i >= 0; i--) {
+      frag.appendChild(buildRow(batch[i]));
+    }
+    eventsBody.insertBefore(frag, eventsBody.firstChild);
+    while (eventsBody.childNodes.length > MAX_ROWS) {
+      eventsBody.removeChild(eventsBody.lastChild);
+    }
+    countTotalEl.textContent = String(total);
+  }
 
   function wsUrl(path) {
     const proto = location.protocol === 'https:' ? 'wss' : 'ws';
@@ -20,9 +161,16 @@
 
   let eventsWs;
   let controlWs;
+  let clientId = null;
+  let lastSeq = null;
 
   function connect() {
-    eventsWs = new WebSocket(wsUrl('/ws/events'));
+    // batch=1&binary=1: the server sends binary frames of concatenated raw-frame
+    // records, coalesced per flush window; only the hello stays JSON text.
+    // since=: after a reconnect, resume right after the last event we saw.
+    const resume = lastSeq == null ? '' : `&since=${lastSeq}`;
+    eventsWs = new WebSocket(wsUrl(`/ws/events?batch=1&binary=1${resume}`));
+    eventsWs.binaryType = 'arraybuffer';
     eventsWs.onopen = () => {
       statusEl.textContent = 'Connected';
     };
@@ -31,44 +179,37 @@
       setTimeout(connect, 1000);
     };
     eventsWs.onmessage = (ev) => {
+      let data;
       try {
-        const data = JSON.parse(ev.data);
-        total += 1;
-        countTotalEl.textContent = String(total);
-
-        const tr = document.createElement('tr');
-        tr.className = `kind-${data.kind || 'unknown'}`;
-
-        const tdTs = document.createElement('td');
-        tdTs.textContent = data.ts || '';
-        const tdKind = document.createElement('td');
-        tdKind.textContent = data.kind || '';
-        const tdSource = document.createElement('td');
-        tdSource.textContent = data.source || '';
-        const tdTopic = document.createElement('td');
-        tdTopic.textContent = typeof data.topic === 'string' ? data.topic : (data.topic == null ? '' : String(data.topic));
-        const tdPayload = document.createElement('td');
-        const p = data.payload;
-        tdPayload.textContent = Array.isArray(p) ? JSON.stringify(p) : (p == null ? '' : String(p));
-
-        tr.appendChild(tdTs);
-        tr.appendChild(tdKind);
-        tr.appendChild(tdSource);
-        tr.appendChild(tdTopic);
-        tr.appendChild(tdPayload);
-
-        eventsBody.insertBefore(tr, eventsBody.firstChild);
-        while (eventsBody.childNodes.length > 1000) {
-          eventsBody.removeChild(eventsBody.lastChild);
-        }
+        data = typeof ev.data === 'string' ? JSON.parse(ev.data) : decodeBinary(ev.data);
       } catch (e) {
         console.error('bad event', e);
+        return;
+      }
+      const batch = Array.isArray(data) ? data : [data];
+      for (const item of batch) {
+        if (item.kind === 'hello') {
+          clientId = item.meta && item.meta.client_id;
+          sendFilter();
+          continue;
+        }
+        if (item.seq != null) lastSeq = item.seq;
+        pending.push(item);
+        total += 1;
+      }
+      if (pending.length > MAX_ROWS) {
+        pending.splice(0, pending.length - MAX_ROWS);
+      }
+      if (!renderScheduled) {
+        renderScheduled = true;
+        requestAnimationFrame(render);
       }
     };
 
     controlWs = new WebSocket(wsUrl('/ws/control'));
     controlWs.onopen = () => {
       console.log('control connected');
+      sendFilter();
     };
     controlWs.onclose = () => {
       console.log('control disconnected');
@@ -82,7 +223,7 @@
         }
         if (data.ok === false) {
           pubResultEl.textContent = 'Error: ' + (data.error || 'unknown');
-        } else if (data.ok === true) {
+        } else if (data.ok === true && !data.action) {
           pubResultEl.textContent = 'Published';
           setTimeout(() => (pubResultEl.textContent = ''), 1000);
         }
@@ -90,6 +231,20 @@
     };
   }
 
+  // Filters are enforced server-side; re-sent after every reconnect (new client id)
+  function sendFilter() {
+    if (!clientId || !controlWs || controlWs.readyState !== WebSocket.OPEN) return;
+    const include = filterIncludeEl.value.split(',').map((s) => s.trim()).filter(Boolean);
+    const kinds = filterKindsEl.value ? [filterKindsEl.value] : [];
+    const text = filterTextEl.value;
+    controlWs.send(JSON.stringify({ action: 'set_filter', client_id: clientId, include, kinds, text }));
+  }
+
+  filterForm.addEventListener('submit', function (e) {
+    e.preventDefault();
+    sendFilter();
+  });
+
   pubForm.addEventListener('submit', function (e) {
     e.preventDefault();
     const topic = topicEl.value.trim();
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .events import _decode_part
+
+
+class SubscriptionTable:
+    """
+    Live XPUB subscriptions, prefix -> number of downstream subscribers, kept from the
+    0x01 (subscribe) / 0x00 (unsubscribe) frames the XPUB socket reports with
+    XPUB_VERBOSER. Updated from the proxy thread, read from the event loop.
+    """
+
+    def __init__(self) -> None:
+        self._counts: Dict[bytes, int] = {}
+        self._lock = threading.Lock()
+        self.version = 0  # bumped on every change, for readers that poll
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def update(self, frame: bytes) -> Optional[Tuple[str, bytes, int]]:
+        """Apply one subscription frame; returns (action, prefix, new count)."""
+        if not frame or frame[0] not in (0, 1):
+            return None
+        subscribe = frame[0] == 1
+        prefix = frame[1:]
+        with self._lock:
+            n = self._counts.get(prefix, 0) + (1 if subscribe else -1)
+            if n > 0:
+                self._counts[prefix] = n
+            else:
+                self._counts.pop(prefix, None)
+                n = 0
+            self.version += 1
+        return ("subscribe" if subscribe else "unsubscribe"), prefix, n
+
+    def set(self, prefix: bytes, count: int) -> None:
+        """Mirror an absolute count, e.g. from a relayed subscription event."""
+        with self._lock:
+            if count > 0:
+                self._counts[prefix] = count
+            else:
+                self._counts.pop(prefix, None)
+            self.version += 1
+
+    def count(self, prefix: bytes) -> int:
+        with self._lock:
+            return self._counts.get(prefix, 0)
+
+    def counts(self) -> Dict[bytes, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = sorted(self._counts.items())
+        out = []
+        for prefix, n in items:
+            text, enc = _decode_part(prefix)
+            out.append({"prefix": text, "encoding": enc, "count": n})
+        return out
+
+
+def subscription_event(action: str, prefix: bytes, count: int, ts: str) -> Dict[str, Any]:
+    topic, enc = _decode_part(prefix)
+    return {
+        "ts": ts,
+        "kind": "subscription",
+        "source": "xpub",
+        "topic": topic,
+        "payload": None,
+        "meta": {"action": action, "count": count, "topic_encoding": enc},
+    }
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional
+
+from .histogram import bucket, quantiles
+
+# Entry slots. Topic and prefix entries share the layout; prefixes leave the size
+# slots unused, and only topics cache their prefix keys.
+_W, _MSGS, _BYTES, _FIRST, _LAST, _MIN, _MAX, _SIZES, _PREV_MSGS, _PREV_BYTES, _PREV_TS, _RATE, _BYTE_RATE, _KEYS = range(14)
+
+_SEP = b"/"
+
+
+def _prefixes(topic: bytes, depth: int) -> List[bytes]:
+    """The topic cut after its first 1..depth segments (the whole topic once it runs out)."""
+    out: List[bytes] = []
+    pos = -1
+    for _ in range(depth):
+        if pos < len(topic):
+            pos = topic.find(_SEP, pos + 1)
+            if pos < 0:
+                pos = len(topic)
+        out.append(topic[:pos])
+    return out
+
+
+def _name(key: bytes) -> str:
+    return key.decode("utf-8", errors="replace")
+
+
+def stats_event(snapshot: Dict[str, Any], ts: str) -> Dict[str, Any]:
+    return {"ts": ts, "kind": "stats", "source": "topics", "topic": None, "payload": None, "meta": snapshot}
+
+
+class TopicStats:
+    """
+    Fixed-memory streaming summaries of every captured message, whatever the topic
+    cardinality:
+
+    - a count-min sketch of messages and payload bytes per topic, so any topic's
+      totals can be estimated (never under-counted), tracked or not;
+    - per level (the whole topic, then its first 1..depth "/" segments) the
+      `capacity` heaviest keys by Misra-Gries admission, as in metrics.TopK, with
+      exact counts since admission, first/last seen and message/byte rates;
+    - for tracked topics, payload-size quantiles from log-bucketed histograms.
+
+    Single writer (the capture thread); tick() and the readers run on other threads
+    and only copy containers, which the GIL keeps consistent.
+    """
+
+    QUANTILES = (0.5, 0.9, 0.99)
+    _FOLD = 1024  # distinct topics batched before they are added to the sketch
+
+    def __init__(self, capacity: int = 1000, depth: int = 2, width: int = 4096, rows: int = 4) -> None:
+        self.capacity = max(1, capacity)
+        self.depth = max(0, depth)
+        width = 1 << max(4, (max(1, width) - 1).bit_length())
+        self._mask = width - 1
+        self._rows = max(1, rows)
+        self._offsets = [i * width for i in range(self._rows)]
+        self._cms_msgs = [0] * (width * self._rows)
+        self._cms_bytes = [0] * (width * self._rows)
+        self._pending: Dict[bytes, List[int]] = {}
+        # level 0 is the topic itself, 1..depth its prefixes
+        self._levels: List[Dict[bytes, List[Any]]] = [{} for _ in range(self.depth + 1)]
+        self._prefix_levels = self._levels[1:]
+        self.messages = 0
+        self.bytes = 0
+        self.started = time.time()
+        self._prev = (0, 0, self.started)
+        self.rate = 0.0
+        self.byte_rate = 0.0
+
+    def update(self, topic: bytes, nbytes: int) -> None:
+        now = time.time()
+        self.messages += 1
+        self.bytes += nbytes
+        # Sketch updates are batched per distinct topic, so a hot topic costs one dict
+        # update per message and one sketch update per fold
+        pending = self._pending.get(topic)
+        if pending is None:
+            if len(self._pending) >= self._FOLD:
+                self._fold()
+            self._pending[topic] = [1, nbytes]
+        else:
+            pending[0] += 1
+            pending[1] += nbytes
+
+        levels = self._levels
+        entry = levels[0].get(topic)
+        if entry is None:
+            entry = self._admit(levels[0], topic, now)
+            if entry is not None:
+                entry[_KEYS] = _prefixes(topic, self.depth)
+        keys = None
+        if entry is not None:
+            keys = entry[_KEYS]
+            entry[_W] += 1
+            entry[_MSGS] += 1
+            entry[_BYTES] += nbytes
+            entry[_LAST] = now
+            if nbytes < entry[_MIN]:
+                entry[_MIN] = nbytes
+            if nbytes > entry[_MAX]:
+                entry[_MAX] = nbytes
+            hist = entry[_SIZES]
+            b = bucket(nbytes)
+            hist[b] = hist.get(b, 0) + 1
+
+        if keys is None:
+            keys = _prefixes(topic, self.depth)
+        for table, key in zip(self._prefix_levels, keys):
+            entry = table.get(key)
+            if entry is None:
+                entry = self._admit(table, key, now)
+                if entry is None:
+                    continue
+            entry[_W] += 1
+            entry[_MSGS] += 1
+            entry[_BYTES] += nbytes
+            entry[_LAST] = now
+
+    def _cells(self, topic: bytes) -> List[int]:
+        h = hash(topic)
+        step = (h >> 16) | 1
+        mask = self._mask
+        return [off + ((h + i * step) & mask) for i, off in enumerate(self._offsets)]
+
+    def _fold(self) -> None:
+        pending, self._pending = self._pending, {}
+        msgs, byts = self._cms_msgs, self._cms_bytes
+        for topic, (m, b) in pending.items():
+            for j in self._cells(topic):
+                msgs[j] += m
+                byts[j] += b
+
+    def _admit(self, table: Dict[bytes, List[Any]], key: bytes, now: float) -> Optional[List[Any]]:
+        if len(table) < self.capacity:
+            entry = table[key] = [0, 0, 0, now, now, 1 << 62, 0, {}, 0, 0, now, 0.0, 0.0, None]
+            return entry
+        # Full: age everyone instead of admitting; O(capacity) at most once per
+        # `capacity` misses, so amortized O(1)
+        for k in [k for k, e in table.items() if e[_W] <= 1]:
+            del table[k]
+        for e in table.values():
+            e[_W] -= 1
+        return None
+
+    def tick(self) -> None:
+        """Recompute rates over the time since the previous tick."""
+        now = time.time()
+        msgs, byts, ts = self._prev
+        dt = now - ts
+        if dt <= 0:
+            return
+        self.rate = (self.messages - msgs) / dt
+        self.byte_rate = (self.bytes - byts) / dt
+        self._prev = (self.messages, self.bytes, now)
+        for table in self._levels:
+            for e in list(table.values()):
+                m, b = e[_MSGS], e[_BYTES]
+                # Entries admitted since the last tick are rated over their own lifetime
+                span = now - max(e[_PREV_TS], e[_FIRST])
+                if span > 0:
+                    e[_RATE] = (m - e[_PREV_MSGS]) / span
+                    e[_BYTE_RATE] = (b - e[_PREV_BYTES]) / span
+                e[_PREV_MSGS], e[_PREV_BYTES], e[_PREV_TS] = m, b, now
+
+    def estimate(self, topic: bytes) -> Dict[str, int]:
+        """
+        Count-min estimate of a topic's totals since start: upper bounds, except
+        that a read racing a fold can briefly miss the batch being folded.
+        """
+        cells = self._cells(topic)
+        m, b = self._pending.get(topic) or (0, 0)
+        return {"messages": min(self._cms_msgs[j] for j in cells) + m, "bytes": min(self._cms_bytes[j] for j in cells) + b}
+
+    def _topic(self, key: bytes, e: List[Any]) -> Dict[str, Any]:
+        lo, hi = (e[_MIN], e[_MAX]) if e[_MSGS] else (0, 0)
+        p50, p90, p99 = (min(max(q, lo), hi) for q in quantiles(dict(e[_SIZES]), self.QUANTILES))
+        return {
+            "topic": _name(key),
+            "messages": e[_MSGS],
+            "bytes": e[_BYTES],
+            "rate": round(e[_RATE], 3),
+            "byte_rate": round(e[_BYTE_RATE], 3),
+            "first_seen": e[_FIRST],
+            "last_seen": e[_LAST],
+            "size": {"min": lo, "p50": p50, "p90": p90, "p99": p99, "max": hi},
+        }
+
+    def _prefix(self, key: bytes, e: List[Any]) -> Dict[str, Any]:
+        return {
+            "prefix": _name(key),
+            "messages": e[_MSGS],
+            "bytes": e[_BYTES],
+            "rate": round(e[_RATE], 3),
+            "byte_rate": round(e[_BYTE_RATE], 3),
+            "first_seen": e[_FIRST],
+            "last_seen": e[_LAST],
+        }
+
+    @staticmethod
+    def _heaviest(table: Dict[bytes, List[Any]], limit: int, prefix: bytes = b"") -> List[tuple]:
+        items = [(k, e) for k, e in list(table.items()) if k.startswith(prefix)]
+        items.sort(key=lambda it: (it[1][_RATE], it[1][_MSGS]), reverse=True)
+        return items[:limit] if limit > 0 else items
+
+    def snapshot(self, limit: int = 100, prefix: str = "") -> Dict[str, Any]:
+        """
+        The heaviest tracked topics and prefixes per level, by current rate then
+        messages since admission, optionally only those starting with `prefix`.
+        """
+        p = prefix.encode("utf-8")
+        return {
+            "ts": time.time(),
+            "since": self.started,
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "rate": round(self.rate, 3),
+            "byte_rate": round(self.byte_rate, 3),
+            "capacity": self.capacity,
+            "tracked": len(self._levels[0]),
+            "topics": [self._topic(k, e) for k, e in self._heaviest(self._levels[0], limit, p)],
+            "prefixes": {
+                str(level): [self._prefix(k, e) for k, e in self._heaviest(self._levels[level], limit, p)]
+                for level in range(1, self.depth + 1)
+            },
+        }
+
+    def lookup(self, topic: str) -> Dict[str, Any]:
+        """One topic: its tracked entry if it is a heavy hitter, and its sketch estimate."""
+        key = topic.encode("utf-8")
+        entry = self._levels[0].get(key)
+        return {
+            "topic": topic,
+            "estimate": self.estimate(key),
+            "tracked": self._topic(key, entry) if entry is not None else None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "messages": self.messages,
+            "tracked": len(self._levels[0]),
+            "capacity": self.capacity,
+            "rate": round(self.rate, 3),
+        }
@@ -1,19 +1,29 @@
 from __future__ import annotations
 
 import base64
+import heapq
 import logging
+import os
+import socket
 import threading
-from typing import Any, Dict
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
 import zmq
-from zmq.utils.monitor import recv_monitor_message
+from zmq.utils.monitor import parse_monitor_message
 
+from .config import Settings
 from .events import EventBus, now_iso
 
 log = logging.getLogger("zmqhub.monitor")
 
 EVENT_NAMES = {getattr(zmq, name): name for name in dir(zmq) if name.startswith("EVENT_")}
 
+# Events that open or close one connection; `value` is the connection's fd
+_OPENED = ("EVENT_ACCEPTED", "EVENT_CONNECTED")
+_CLOSED = ("EVENT_DISCONNECTED", "EVENT_CLOSED")
+
 
 def _endpoint_to_str(ep: Any) -> str:
     if isinstance(ep, bytes):
@@ -24,41 +34,279 @@ def _endpoint_to_str(ep: Any) -> str:
     return str(ep)
 
 
-def monitor_loop(monitor_sock: zmq.Socket, source: str, bus: EventBus, stop: threading.Event) -> None:
-    """Run in a thread: read monitor events and push to bus."""
+def _endpoint_port(endpoint: str) -> Optional[int]:
+    port = endpoint.rpartition(":")[2]
+    return int(port) if port.isdigit() else None
+
+
+def _peer_name(fd: Any, endpoint: str) -> Optional[str]:
+    """
+    Best-effort remote address of a TCP connection libzmq just opened. Monitor events
+    only carry the fd and ZMTP has no peer address for it, so it is read from a dup of
+    the fd. By then the connection may have closed and its number been reused, so the
+    answer only counts if the fd is still a TCP socket on the event's port (our end for
+    accepted connections, theirs for connected ones).
+    """
+    port = _endpoint_port(endpoint)
+    if not isinstance(fd, int) or fd < 0 or port is None:
+        return None
     try:
-        while not stop.is_set():
-            try:
-                evt = recv_monitor_message(monitor_sock, flags=zmq.NOBLOCK)
-            except zmq.Again:
-                if stop.wait(0.05):
-                    break
-                continue
-            except zmq.ZMQError as e:
-                if e.errno == zmq.ETERM:
-                    break
-                log.exception("Monitor socket error")
-                break
-            if not evt:
-                continue
-            ev_code = evt.get("event")
-            ev_name = EVENT_NAMES.get(ev_code, str(ev_code))
-            payload: Dict[str, Any] = {
-                "ts": now_iso(),
-                "kind": "monitor",
-                "source": source,
-                "topic": None,
-                "payload": None,
-                "meta": {
-                    "event": ev_name,
-                    "value": evt.get("value"),
-                    "endpoint": _endpoint_to_str(evt.get("endpoint")),
-                    "errno": evt.get("error"),
-                },
+        with socket.socket(fileno=os.dup(fd)) as s:
+            if s.family not in (socket.AF_INET, socket.AF_INET6) or s.type != socket.SOCK_STREAM:
+                return None
+            local, addr = s.getsockname(), s.getpeername()
+    except OSError:
+        return None
+    if port not in (local[1], addr[1]):
+        return None
+    host = addr[0]
+    return f"[{host}]:{addr[1]}" if ":" in host else f"{host}:{addr[1]}"
+
+
+def monitor_event(source: str, evt: Dict[str, Any], ts: str) -> Dict[str, Any]:
+    name = EVENT_NAMES.get(evt.get("event"), str(evt.get("event")))
+    meta: Dict[str, Any] = {
+        "event": name,
+        "value": evt.get("value"),
+        "endpoint": _endpoint_to_str(evt.get("endpoint")),
+        "errno": evt.get("error"),
+    }
+    if name in _OPENED and meta["endpoint"].startswith("tcp://"):
+        meta["peer"] = _peer_name(meta["value"], meta["endpoint"])
+    return {"ts": ts, "kind": "monitor", "source": source, "topic": None, "payload": None, "meta": meta}
+
+
+class ConnectionTable:
+    """
+    Per-peer view built from monitor events: open connections keyed by (socket, fd),
+    the most recently closed ones, and per-endpoint event counts (retries, failures).
+    Applied from the monitor thread, or mirrored from relayed events in a worker;
+    read from the event loop.
+    """
+
+    _MAX_ENDPOINTS = 1000
+
+    def __init__(self, recent: int = 100) -> None:
+        self._open: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=max(0, recent))
+        self._endpoints: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def apply(self, event: Dict[str, Any]) -> None:
+        meta = event.get("meta") or {}
+        source = event.get("source") or ""
+        name = meta.get("event") or ""
+        endpoint = meta.get("endpoint") or ""
+        fd = meta.get("value")
+        count = int(meta.get("count") or 1)
+        ts = event.get("ts")
+        with self._lock:
+            key = (source, endpoint)
+            stats = self._endpoints.get(key)
+            if stats is None:
+                if len(self._endpoints) >= self._MAX_ENDPOINTS:
+                    self._endpoints.pop(next(iter(self._endpoints)))
+                stats = self._endpoints[key] = {"source": source, "endpoint": endpoint, "events": {}}
+            stats["events"][name] = stats["events"].get(name, 0) + count
+            stats["last_event"] = name
+            stats["last_ts"] = ts
+            if not isinstance(fd, int):
+                return
+            if name in _OPENED:
+                self._open[(source, fd)] = {
+                    "source": source,
+                    "endpoint": endpoint,
+                    "peer": meta.get("peer"),
+                    "fd": fd,
+                    "since": ts,
+                }
+            elif name in _CLOSED:
+                conn = self._open.pop((source, fd), None)
+                if conn is not None:
+                    self._recent.append({**conn, "closed": ts, "event": name, "errno": meta.get("errno")})
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "connections": sorted(self._open.values(), key=lambda c: (c["source"], c["fd"])),
+                "recent": list(reversed(self._recent)),
+                "endpoints": [{**s, "events": dict(s["events"])} for s in self._endpoints.values()],
             }
-            bus.publish_threadsafe(payload)
-    finally:
+
+
+class MonitorService:
+    """
+    One thread for every monitor socket: a blocking zmq.Poller over the monitor PAIRs
+    plus an inproc wake pipe, so events are published as they happen and an idle hub
+    does not wake up at all. Sockets are handed over with watch() from whichever
+    thread owns them.
+
+    Noisy events (settings.monitor_aggregate, e.g. a peer stuck in CONNECT_RETRIED)
+    pass individually only `monitor_burst` times per (socket, event, endpoint) and
+    `monitor_window_ms`; the rest of the window is published as one summary event
+    with meta.count and meta.summary set.
+    """
+
+    _MAX_WINDOWS = 10000
+
+    def __init__(self, settings: Settings, bus: EventBus) -> None:
+        self.settings = settings
+        self.bus = bus
+        self.connections = ConnectionTable(settings.monitor_recent)
+        self._aggregate = frozenset(settings.monitor_aggregate)
+        self._pending: List[Tuple[zmq.Socket, str]] = []
+        self._lock = threading.Lock()
+        self._pipe: zmq.Socket | None = None
+        self._endpoint = f"inproc://zmqhub-monitor-{id(self):x}"
+        self._thread: threading.Thread | None = None
+        # (source, event, endpoint) -> [window end, passed, suppressed, last meta]
+        self._windows: Dict[Tuple[str, str, str], List[Any]] = {}
+        # (window end, key) per window, soonest first; entries of replaced windows are skipped
+        self._ends: List[Tuple[float, Tuple[str, str, str]]] = []
+        self.events = 0
+        self.suppressed = 0
+        self.summaries = 0
+
+    def start(self, context: zmq.Context) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        inner = context.socket(zmq.PAIR)
+        inner.setsockopt(zmq.LINGER, 0)
+        inner.bind(self._endpoint)
+        pipe = context.socket(zmq.PAIR)
+        pipe.setsockopt(zmq.LINGER, 0)
+        pipe.connect(self._endpoint)
+        self._pipe = pipe
+        self._thread = threading.Thread(target=self._run, args=(inner,), name="zmqhub-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._signal(b"STOP")
+        if self._thread:
+            self._thread.join(timeout=2.0)
+        self._thread = None
+        with self._lock:
+            if self._pipe is not None:
+                self._pipe.close(0)
+                self._pipe = None
+            for sock, _ in self._pending:
+                sock.close(0)
+            self._pending.clear()
+
+    def watch(self, monitor_sock: zmq.Socket, source: str) -> None:
+        """Hand a socket's monitor PAIR (from get_monitor_socket()) to the service thread."""
+        with self._lock:
+            self._pending.append((monitor_sock, source))
+        self._signal(b"WATCH")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"events": self.events, "suppressed": self.suppressed, "summaries": self.summaries}
+
+    def _signal(self, command: bytes) -> None:
+        with self._lock:
+            if self._pipe is None:
+                return
+            try:
+                self._pipe.send(command, flags=zmq.NOBLOCK)
+            except zmq.ZMQError:
+                log.warning("Failed to signal monitor service: %s", command.decode())
+
+    def _run(self, pipe: zmq.Socket) -> None:
+        poller = zmq.Poller()
+        poller.register(pipe, zmq.POLLIN)
+        sources: Dict[zmq.Socket, str] = {}
         try:
-            monitor_sock.close(0)
-        except Exception:
-            pass
+            while True:
+                timeout = self._flush(time.monotonic())
+                try:
+                    ready = poller.poll(timeout)
+                except zmq.ZMQError as e:
+                    if e.errno == zmq.ETERM:
+                        break
+                    raise
+                for sock, _ in ready:
+                    if sock is pipe:
+                        if pipe.recv() == b"STOP":
+                            return
+                        with self._lock:
+                            pending, self._pending = self._pending, []
+                        for mon, source in pending:
+                            poller.register(mon, zmq.POLLIN)
+                            sources[mon] = source
+                        continue
+                    try:
+                        msg = sock.recv_multipart(flags=zmq.NOBLOCK)
+                    except zmq.Again:
+                        continue
+                    evt = parse_monitor_message(msg)
+                    if evt.get("event") == zmq.EVENT_MONITOR_STOPPED:
+                        poller.unregister(sock)
+                        sources.pop(sock, None)
+                        sock.close(0)
+                        continue
+                    self._on_event(sources.get(sock, ""), evt)
+        finally:
+            self._flush(float("inf"))
+            for sock in sources:
+                sock.close(0)
+            pipe.close(0)
+
+    def _on_event(self, source: str, evt: Dict[str, Any]) -> None:
+        self.events += 1
+        event = monitor_event(source, evt, now_iso())
+        meta = event["meta"]
+        if meta["event"] in self._aggregate:
+            now = time.monotonic()
+            key = (source, meta["event"], meta["endpoint"])
+            window = self._windows.get(key)
+            if window is None or now >= window[0]:
+                if window is not None:
+                    self._summarize(key, window)
+                elif len(self._windows) >= self._MAX_WINDOWS:
+                    self._evict()
+                end = now + self.settings.monitor_window_ms / 1000.0
+                window = self._windows[key] = [end, 0, 0, None]
+                heapq.heappush(self._ends, (end, key))
+            if window[1] >= self.settings.monitor_burst:
+                window[2] += 1
+                window[3] = meta
+                self.suppressed += 1
+                return
+            window[1] += 1
+        self._emit(event)
+
+    def _flush(self, now: float) -> Optional[int]:
+        """Summarize windows that are over; returns the poll timeout (ms) until the next one ends."""
+        ends = self._ends
+        while ends and now >= ends[0][0]:
+            end, key = heapq.heappop(ends)
+            window = self._windows.get(key)
+            if window is not None and window[0] == end:
+                self._summarize(key, self._windows.pop(key))
+        if not ends:
+            return None
+        return max(1, int((ends[0][0] - now) * 1000.0) + 1)
+
+    def _evict(self) -> None:
+        """Close the window that would end first, to make room for a new one."""
+        ends = self._ends
+        while ends:
+            end, key = heapq.heappop(ends)
+            window = self._windows.get(key)
+            if window is not None and window[0] == end:
+                self._summarize(key, self._windows.pop(key))
+                return
+
+    def _summarize(self, key: Tuple[str, str, str], window: List[Any]) -> None:
+        if not window[2]:
+            return
+        self.summaries += 1
+        meta = dict(window[3], count=window[2], summary=True, window_ms=self.settings.monitor_window_ms)
+        self._emit({"ts": now_iso(), "kind": "monitor", "source": key[0], "topic": None, "payload": None, "meta": meta})
+
+    def _emit(self, event: Dict[str, Any]) -> None:
+        self.connections.apply(event)
+        self.bus.publish_threadsafe(event)
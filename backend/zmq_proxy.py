@@ -1,128 +1,469 @@
 from __future__ import annotations
 
-import base64
 import logging
 import threading
-from typing import Any, Dict, List
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
 
 import zmq
 
+from .capture_log import CaptureWriter
 from .config import Settings
-from .events import EventBus, now_iso
-from .zmq_monitor import monitor_loop
+from .events import BusEvent, EventBus, now_iso
+from .lvc import SNAPSHOT_END, SNAPSHOT_VALUE, LastValueCache
+from .metrics import CAPTURE_SKIPPED, MSGS_IN
+from .subscriptions import SubscriptionTable, subscription_event
+from .topic_stats import TopicStats, stats_event
+from .zmq_monitor import MonitorService
 
 log = logging.getLogger("zmqhub.proxy")
 
 
-def _encode_part(b: bytes) -> tuple[str, str]:
-    try:
-        s = b.decode("utf-8")
-        return s, "utf8"
-    except UnicodeDecodeError:
-        return base64.b64encode(b).decode("ascii"), "base64"
-
-
-def _build_bus_event(source: str, frames: List[bytes]) -> Dict[str, Any]:
-    topic_b, topic_enc = _encode_part(frames[0] if frames else b"")
-    parts_enc: List[str] = []
-    payload: Any
-    if len(frames) <= 1:
-        payload = None
-    elif len(frames) == 2:
-        s, enc = _encode_part(frames[1])
-        payload = s
-        parts_enc = [enc]
-    else:
-        payload_list: List[str] = []
-        for p in frames[1:]:
-            s, enc = _encode_part(p)
-            payload_list.append(s)
-            parts_enc.append(enc)
-        payload = payload_list
-    ev: Dict[str, Any] = {
-        "ts": now_iso(),
-        "kind": "bus",
-        "source": source,
-        "topic": topic_b,
-        "payload": payload,
-        "meta": {
-            "topic_encoding": topic_enc,
-            "payload_encodings": parts_enc,
-            "parts": len(frames),
-            "sizes": [len(x) for x in frames],
-        },
-    }
-    return ev
+def _is_subscription(frames: List[bytes]) -> bool:
+    # XPUB subscription updates are single frames starting with 0x00/0x01. A published
+    # single frame can look the same, so on the steerable mirror this is only a hint.
+    return len(frames) == 1 and frames[0][:1] in (b"\x00", b"\x01")
+
+
+class _Taps:
+    """
+    The capture thread's view of what the proxy forwarded: an XPUB on the inject
+    endpoint, to which XSUB passes every subscription and an unsubscription once a
+    prefix's last subscriber leaves, and a SUB on XPUB for published messages that
+    start with 0x00. Each sees a message just after the mirror does.
+    """
+
+    SUBSCRIBE = b"\x01\x00"  # the SUB tap's own subscription, not a subscriber's
+
+    def __init__(self, ctx: zmq.Context, settings: Settings) -> None:
+        self.subs = ctx.socket(zmq.XPUB)
+        self.subs.setsockopt(zmq.XPUB_VERBOSER, 1)
+        self.subs.setsockopt(zmq.RCVHWM, 0)
+        self.subs.setsockopt(zmq.LINGER, 0)
+        self.subs.connect(settings.inject_endpoint)
+        self.data = ctx.socket(zmq.SUB)
+        self.data.setsockopt(zmq.RCVHWM, 0)
+        self.data.setsockopt(zmq.LINGER, 0)
+        self.data.setsockopt(zmq.SUBSCRIBE, b"\x00")
+        self.data.connect(settings.tap_endpoint)
+        self.forwarded: Deque[bytes] = deque()
+        # Multipart messages are never mistaken for subscriptions; single frames whose
+        # mirror copy was lost are dropped once this many arrived after them
+        self.published: Deque[bytes] = deque(maxlen=max(1, settings.capture_hwm))
+        self.subscribed = False
+
+    def drain(self) -> None:
+        while True:
+            try:
+                self.forwarded.append(self.subs.recv(flags=zmq.NOBLOCK))
+            except zmq.Again:
+                break
+        while True:
+            try:
+                msg = self.data.recv_multipart(flags=zmq.NOBLOCK)
+            except zmq.Again:
+                return
+            if len(msg) == 1:
+                self.published.append(msg[0])
+
+    def seen(self, frame: bytes) -> bool:
+        return frame in self.published or frame in self.forwarded
+
+    def close(self) -> None:
+        self.subs.close(0)
+        self.data.close(0)
 
 
 class Proxy:
-    def __init__(self, settings: Settings, bus: EventBus) -> None:
+    def __init__(self, settings: Settings, bus: EventBus, capture_log: Optional[CaptureWriter] = None) -> None:
         self.settings = settings
         self.bus = bus
+        self.capture_log = capture_log
+        self.subscriptions = SubscriptionTable()
+        self.monitor = MonitorService(settings, bus)
+        self.lvc = (
+            LastValueCache(settings.lvc_max_topics, settings.lvc_max_bytes, settings.lvc_prefixes) if settings.lvc_enabled else None
+        )
+        self.topics = (
+            TopicStats(settings.topics_capacity, settings.topics_depth, settings.topics_sketch_width)
+            if settings.topics_enabled
+            else None
+        )
         self._stop = threading.Event()
         self._thread: threading.Thread | None = None
-        self._mon_threads: list[threading.Thread] = []
+        self._stats_thread: threading.Thread | None = None
+        self._capture_thread: threading.Thread | None = None
         self._context: zmq.Context | None = None
+        self._ctrl: zmq.Socket | None = None
+        self._ctrl_lock = threading.Lock()
+
+    @property
+    def context(self) -> zmq.Context | None:
+        return self._context
+
+    @property
+    def steerable(self) -> bool:
+        # The last-value cache has to answer subscriptions on XPUB itself, which only
+        # the poll loop can do
+        return self.settings.proxy_mode == "steerable" and self.lvc is None
 
     def start(self) -> None:
         if self._thread and self._thread.is_alive():
             return
         self._stop.clear()
-        self._thread = threading.Thread(target=self._run, name="zmqhub-proxy", daemon=True)
+        if self.settings.proxy_mode == "steerable" and self.lvc is not None:
+            log.warning("The last-value cache answers subscriptions from the poll loop; running proxy_mode=poll")
+        self._context = zmq.Context(io_threads=1)
+        self.monitor.start(self._context)
+        if self.steerable:
+            ctrl = self._context.socket(zmq.PAIR)
+            ctrl.setsockopt(zmq.LINGER, 0)
+            ctrl.connect(self.settings.control_endpoint)
+            self._ctrl = ctrl
+            self._capture_thread = threading.Thread(
+                target=self._capture_loop, args=(self._context,), name="zmqhub-capture", daemon=True
+            )
+            self._capture_thread.start()
+            target = self._run_steerable
+        else:
+            target = self._run
+        self._thread = threading.Thread(target=target, args=(self._context,), name="zmqhub-proxy", daemon=True)
         self._thread.start()
+        if self.topics is not None:
+            self._stats_thread = threading.Thread(target=self._stats_loop, name="zmqhub-topic-stats", daemon=True)
+            self._stats_thread.start()
 
     def stop(self) -> None:
         self._stop.set()
+        self._control(b"TERMINATE")
         if self._thread:
             self._thread.join(timeout=2.0)
         self._thread = None
-        for t in self._mon_threads:
-            t.join(timeout=1.0)
-        self._mon_threads.clear()
+        if self._stats_thread:
+            self._stats_thread.join(timeout=1.0)
+        self._stats_thread = None
+        self.monitor.stop()
+        with self._ctrl_lock:
+            if self._ctrl is not None:
+                self._ctrl.close(0)
+                self._ctrl = None
         if self._context is not None:
+            # Unblocks the capture thread with ETERM
             try:
                 self._context.term()
             except Exception:
                 pass
             self._context = None
+        if self._capture_thread:
+            self._capture_thread.join(timeout=1.0)
+        self._capture_thread = None
 
-    def _run(self) -> None:
-        ctx = zmq.Context(io_threads=1)
-        self._context = ctx
+    def pause(self) -> None:
+        self._control(b"PAUSE")
 
+    def resume(self) -> None:
+        self._control(b"RESUME")
+
+    def _control(self, command: bytes) -> None:
+        with self._ctrl_lock:
+            if self._ctrl is None:
+                return
+            try:
+                self._ctrl.send(command, flags=zmq.NOBLOCK)
+            except zmq.ZMQError:
+                log.warning("Failed to send %s to proxy control socket", command.decode())
+
+    def _bind_sockets(self, ctx: zmq.Context) -> tuple[zmq.Socket, zmq.Socket]:
         xsub = ctx.socket(zmq.XSUB)
         xsub.set_hwm(self.settings.xsub_rcvhwm)
         xsub.setsockopt(zmq.LINGER, self.settings.linger_ms)
         xsub.bind(self.settings.xsub_bind)
+        xsub.bind(self.settings.inject_endpoint)
 
         xpub = ctx.socket(zmq.XPUB)
         xpub.set_hwm(self.settings.xpub_sndhwm)
-        xpub.setsockopt(zmq.XPUB_VERBOSE, 1)
+        # VERBOSER reports every subscribe and unsubscribe, so the table can keep counts
+        xpub.setsockopt(zmq.XPUB_VERBOSER, 1)
+        if self.lvc is not None:
+            # The poll loop applies each subscription itself, so that it can send the
+            # cached value to that subscriber alone (_apply_subscription)
+            xpub.setsockopt(zmq.XPUB_MANUAL, 1)
         xpub.setsockopt(zmq.LINGER, self.settings.linger_ms)
         xpub.bind(self.settings.xpub_bind)
+        if self.settings.bridge_bind or self.settings.bridge_links:
+            xpub.bind(self.settings.bridge_local_endpoint)
+        if self.steerable:
+            xpub.bind(self.settings.tap_endpoint)
+        return xsub, xpub
 
-        # Monitors
+    def _start_monitors(self, xsub: zmq.Socket, xpub: zmq.Socket) -> None:
         try:
-            xsub_mon = xsub.get_monitor_socket()
-            xpub_mon = xpub.get_monitor_socket()
-            t1 = threading.Thread(
-                target=monitor_loop, args=(xsub_mon, "xsub", self.bus, self._stop), daemon=True, name="zmqhub-mon-xsub"
-            )
-            t2 = threading.Thread(
-                target=monitor_loop, args=(xpub_mon, "xpub", self.bus, self._stop), daemon=True, name="zmqhub-mon-xpub"
-            )
-            t1.start()
-            t2.start()
-            self._mon_threads.extend([t1, t2])
+            self.monitor.watch(xsub.get_monitor_socket(), "xsub")
+            self.monitor.watch(xpub.get_monitor_socket(), "xpub")
         except Exception:
             log.exception("Failed to start monitor sockets")
 
+    def _close_sockets(self, *socks: zmq.Socket) -> None:
+        # No disable_monitor(): it blocks sending MONITOR_STOPPED once the monitor
+        # service has closed its end; closing the socket tears the monitor down.
+        for sock in socks:
+            try:
+                sock.close(self.settings.linger_ms)
+            except Exception:
+                pass
+
+    def _run_steerable(self, ctx: zmq.Context) -> None:
+        xsub, xpub = self._bind_sockets(ctx)
+        self._start_monitors(xsub, xpub)
+
+        # PUB never blocks the proxy: a lagging capture reader loses frames at the HWM
+        capture = ctx.socket(zmq.PUB)
+        capture.set_hwm(self.settings.capture_hwm)
+        capture.setsockopt(zmq.LINGER, 0)
+        capture.bind(self.settings.capture_endpoint)
+
+        control = ctx.socket(zmq.PAIR)
+        control.setsockopt(zmq.LINGER, 0)
+        control.bind(self.settings.control_endpoint)
+
+        log.info("Proxy running (steerable): XSUB %s <-> XPUB %s", self.settings.xsub_bind, self.settings.xpub_bind)
+        try:
+            zmq.proxy_steerable(xsub, xpub, capture, control)
+        except zmq.ZMQError as e:
+            if e.errno != zmq.ETERM:
+                log.exception("Proxy failed")
+        finally:
+            self._close_sockets(xsub, xpub)
+            capture.close(0)
+            control.close(0)
+
+    def _on_capture(self, msg: List[zmq.Frame], received_ns: int = 0) -> None:
+        """
+        Record one forwarded message, received with copy=False. The capture log gets
+        the frames as memoryviews (its writer thread does the one copy), and the bus a
+        copy of at most capture_max_bytes of each payload frame plus the real sizes.
+        With profiling on, the poll loop passes when it read the message off XSUB.
+        """
+        tracer = self.bus.tracer
+        if tracer is not None:
+            start = time.monotonic_ns()
+            if received_ns:
+                tracer.observe("forward", start - received_ns)
+        MSGS_IN.inc()
+        if self.capture_log is not None:
+            self.capture_log.append([f.buffer for f in msg])
+        topic = msg[0].bytes if msg else b""
+        if self.topics is not None:
+            self.topics.update(topic, sum(map(len, msg[1:])))
+        self.bus.account(topic, sum(map(len, msg)))
+        if msg and not self.bus.wants(topic):
+            CAPTURE_SKIPPED.inc()
+            return
+        limit = self.settings.capture_max_bytes
+        sizes = None
+        if limit > 0 and any(len(f) > limit for f in msg[1:]):
+            sizes = [len(f) for f in msg]
+            frames = [topic, *(f.buffer[:limit].tobytes() if len(f) > limit else f.bytes for f in msg[1:])]
+        else:
+            frames = [topic, *(f.bytes for f in msg[1:])] if msg else []
+        event = BusEvent("xsub", frames, sizes=sizes)
+        if tracer is None:
+            self.bus.publish_threadsafe(event)
+            return
+        event.trace = [received_ns or start, 0]
+        self.bus.publish_threadsafe(event)
+        tracer.observe("capture", time.monotonic_ns() - start)
+
+    def _stats_loop(self) -> None:
+        """Roll topic rates over every topics_interval_ms and push them as a stats event."""
+        topics = self.topics
+        interval = max(0.1, self.settings.topics_interval_ms / 1000.0)
+        while topics is not None and not self._stop.wait(interval):
+            topics.tick()
+            if self.settings.topics_push > 0:
+                self.bus.publish_threadsafe(stats_event(topics.snapshot(self.settings.topics_push), ts=now_iso()))
+
+    def _on_subscription(self, frame: bytes) -> None:
+        change = self.subscriptions.update(frame)
+        if change is not None:
+            self.bus.publish_threadsafe(subscription_event(*change, ts=now_iso()))
+
+    def _capture_loop(self, ctx: zmq.Context) -> None:
+        """
+        Decode mirrored frames off the forwarding thread and push them to the bus. The
+        mirror carries both directions, so a frame shaped like a subscription waits
+        until the taps tell which it was (_settle), as they do moments later. A frame
+        neither tap will see is known for one once the proxy is past it: the next
+        mirrored message arrives, or the proxy answers a STATISTICS request, whose
+        reply is polled for, never waited on.
+        """
+        sock = ctx.socket(zmq.SUB)
+        sock.set_hwm(self.settings.capture_hwm)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.setsockopt(zmq.SUBSCRIBE, b"")
+        sock.connect(self.settings.capture_endpoint)
+        taps = _Taps(ctx, self.settings)
+        poller = zmq.Poller()
+        for s in (sock, taps.subs, taps.data):
+            poller.register(s, zmq.POLLIN)
+        seen = 0  # mirrored messages received
+        pending: Deque[Tuple[int, List[zmq.Frame]]] = deque()
+        barrier: Optional[int] = None  # `seen` when the outstanding STATISTICS went out
+        try:
+            while True:
+                try:
+                    events = dict(poller.poll(1 if pending else None))
+                    if events.get(sock) is None:
+                        taps.drain()
+                        while pending and taps.seen(pending[0][1][0].bytes):
+                            self._settle(pending.popleft()[1], taps)
+                        if pending and barrier is not None and self._answered():
+                            while pending and pending[0][0] <= barrier:
+                                self._settle(pending.popleft()[1], taps)
+                            barrier = None
+                        if pending and barrier is None and self._control_nowait(b"STATISTICS"):
+                            barrier = seen
+                        continue
+                    msg = sock.recv_multipart(copy=False)
+                except zmq.ZMQError as e:
+                    if e.errno == zmq.ETERM:
+                        break
+                    raise
+                seen += 1
+                # The proxy has forwarded everything it mirrored before this message
+                while pending:
+                    self._settle(pending.popleft()[1], taps)
+                if len(msg) == 1 and _is_subscription([msg[0].bytes]):
+                    pending.append((seen, msg))
+                    continue
+                self._on_capture(msg)
+        finally:
+            sock.close(0)
+            taps.close()
+
+    def _settle(self, msg: List[zmq.Frame], taps: _Taps) -> None:
+        """
+        Apply or publish a subscription-shaped mirrored frame, once the proxy has
+        forwarded it. A frame XPUB delivered to the 0x00 tap was published; one XSUB
+        passed upstream was a subscription. Neither is an unsubscription XSUB kept to
+        itself because others still share the prefix, or else a published 0x01 frame.
+        """
+        frame = msg[0].bytes
+        taps.drain()
+        if frame in taps.published:
+            while taps.published.popleft() != frame:
+                pass  # its mirror copy was lost at the capture HWM
+            self._on_capture(msg)
+        elif frame in taps.forwarded:
+            while True:
+                head = taps.forwarded.popleft()
+                if head == frame:
+                    break
+                self._forwarded(head, taps)  # its mirror copy was lost at the capture HWM
+            self._forwarded(frame, taps)
+        elif frame[0] == 0 and self.subscriptions.count(frame[1:]) >= 2:
+            self._on_subscription(frame)
+        else:
+            self._on_capture(msg)
+
+    def _forwarded(self, frame: bytes, taps: _Taps) -> None:
+        if frame == _Taps.SUBSCRIBE and not taps.subscribed:
+            taps.subscribed = True  # the 0x00 tap's own subscription
+            return
+        self._on_subscription(frame)
+
+    def _control_nowait(self, command: bytes) -> bool:
+        with self._ctrl_lock:
+            if self._ctrl is None:
+                return False
+            try:
+                self._ctrl.send(command, flags=zmq.NOBLOCK)
+            except zmq.ZMQError:
+                return False
+            return True
+
+    def _answered(self) -> bool:
+        """Take a STATISTICS reply off the control socket if one has arrived."""
+        with self._ctrl_lock:
+            if self._ctrl is None or not self._ctrl.poll(0):
+                return False
+            self._ctrl.recv_multipart()
+            return True
+
+    def _apply_subscription(self, xpub: zmq.Socket, sub: bytes, lvc: LastValueCache) -> None:
+        """
+        Manual XPUB: apply a (un)subscription for the peer that sent it, then send that
+        peer alone the cached value for a subscription. libzmq addresses only the first
+        message after a subscription to its subscriber, so one value goes out per
+        subscription (see LastValueCache.latest); every value under a prefix needs
+        the snapshot socket (_serve_snapshot).
+        """
+        prefix = sub[1:]
+        if sub[0] == 0:
+            xpub.setsockopt(zmq.UNSUBSCRIBE, prefix)
+            return
+        xpub.setsockopt(zmq.SUBSCRIBE, prefix)
+        cached = lvc.latest(prefix)
+        if cached is None:
+            return
+        # Only around this send: left on, the next live message after any received
+        # (un)subscription would go to that one peer
+        xpub.setsockopt(zmq.XPUB_MANUAL_LAST_VALUE, 1)
+        try:
+            xpub.send_multipart(cached, copy=False)
+        finally:
+            xpub.setsockopt(zmq.XPUB_MANUAL_LAST_VALUE, 0)  # also clears manual mode
+            xpub.setsockopt(zmq.XPUB_MANUAL, 1)
+
+    def _serve_snapshot(self, sock: zmq.Socket, lvc: LastValueCache) -> None:
+        """
+        Answer one snapshot request, [prefix] from a DEALER, with every cached message
+        under the prefix and an end marker, all addressed to the requester alone.
+        Replies are queued without a HWM; the cache bounds what one snapshot holds.
+        """
+        try:
+            request = sock.recv_multipart(flags=zmq.NOBLOCK)
+        except zmq.Again:
+            return
+        identity, prefix = request[0], request[-1] if len(request) > 1 else b""
+        values = lvc.matching(prefix)
+        try:
+            for msg in values:
+                sock.send_multipart([identity, SNAPSHOT_VALUE, *msg], copy=False)
+            sock.send_multipart([identity, SNAPSHOT_END, str(len(values)).encode("ascii")])
+        except zmq.ZMQError as e:
+            log.warning("Failed to send a last-value snapshot: %s", e)
+
+    def _run(self, ctx: zmq.Context) -> None:
+        xsub, xpub = self._bind_sockets(ctx)
+        self._start_monitors(xsub, xpub)
+
         poller = zmq.Poller()
         poller.register(xsub, zmq.POLLIN)
         poller.register(xpub, zmq.POLLIN)
+        lvc = self.lvc
+        snapshot: Optional[zmq.Socket] = None
+        if lvc is not None and self.settings.lvc_snapshot_bind:
+            snapshot = ctx.socket(zmq.ROUTER)
+            snapshot.set_hwm(0)
+            snapshot.setsockopt(zmq.LINGER, 0)
+            snapshot.bind(self.settings.lvc_snapshot_bind)
+            poller.register(snapshot, zmq.POLLIN)
 
-        log.info("Proxy running: XSUB %s <-> XPUB %s", self.settings.xsub_bind, self.settings.xpub_bind)
+        log.info(
+            "Proxy running (poll%s): XSUB %s <-> XPUB %s",
+            ", last-value cache" if self.lvc is not None else "",
+            self.settings.xsub_bind,
+            self.settings.xpub_bind,
+        )
         try:
+            tracer = self.bus.tracer
+            if lvc is not None:
+                # Publishers only send what someone subscribed to; the cache needs its
+                # topics whether or not a subscriber is connected right now
+                for prefix in lvc.prefixes or (b"",):
+                    xsub.send(b"\x01" + prefix)
             while not self._stop.is_set():
                 try:
                     events = dict(poller.poll(timeout=100))
@@ -133,14 +474,18 @@ class Proxy:
 
                 if xsub in events and events[xsub] & zmq.POLLIN:
                     try:
-                        msg = xsub.recv_multipart(flags=zmq.NOBLOCK)
+                        # Frames stay in libzmq's buffers: forwarding, caching and
+                        # capture previews copy nothing but the topic
+                        msg = xsub.recv_multipart(flags=zmq.NOBLOCK, copy=False)
                     except zmq.Again:
                         msg = None
                     if msg:
+                        received = time.monotonic_ns() if tracer is not None else 0
                         # forward publish frames from publishers -> subscribers
-                        xpub.send_multipart(msg)
-                        # capture -> bus
-                        self.bus.publish_threadsafe(_build_bus_event("xsub", msg))
+                        xpub.send_multipart(msg, copy=False)
+                        if lvc is not None:
+                            lvc.update(msg[0].bytes, msg)
+                        self._on_capture(msg, received)
 
                 if xpub in events and events[xpub] & zmq.POLLIN:
                     try:
@@ -150,24 +495,14 @@ class Proxy:
                         sub_msg = None
                     if sub_msg:
                         xsub.send_multipart(sub_msg)
+                        if _is_subscription(sub_msg):
+                            self._on_subscription(sub_msg[0])
+                            if lvc is not None:
+                                self._apply_subscription(xpub, sub_msg[0], lvc)
+
+                if snapshot is not None and snapshot in events:
+                    self._serve_snapshot(snapshot, lvc)  # type: ignore[arg-type]
         finally:
-            try:
-                xsub.disable_monitor()
-            except Exception:
-                pass
-            try:
-                xpub.disable_monitor()
-            except Exception:
-                pass
-            try:
-                xsub.close(self.settings.linger_ms)
-            except Exception:
-                pass
-            try:
-                xpub.close(self.settings.linger_ms)
-            except Exception:
-                pass
-            try:
-                ctx.term()
-            except Exception:
-                pass
+            self._close_sockets(xsub, xpub)
+            if snapshot is not None:
+                snapshot.close(0)
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Localhost throughput/latency benchmark for the hub.
+
+Runs the full app (proxy + EventBus + /ws/events) in this process under uvicorn and
+drives it from separate processes: N ZMQ publishers, M ZMQ subscribers and K WebSocket
+clients. Every payload starts with "<publisher>:<seq>:<monotonic ns>:" so each
+observation point reports end-to-end latency from the publish call, and sequence
+gaps or missing messages are counted as drops:
+
+  xsub_to_xpub    ZMQ subscribers on the XPUB side
+  capture_to_bus  an in-process EventBus subscriber (disable with --no-bus-probe;
+                  it shares the event loop with the hub)
+  bus_to_ws       WebSocket clients on /ws/events
+
+Results are printed (or written with --out) as JSON so runs can be compared.
+
+    python -m benchmarks.bench_hub --publishers 2 --subscribers 2 --ws-clients 4 \\
+        --size 256 --rate 5000 --duration 10
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import struct
+import sys
+import time
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+import zmq
+
+TOPIC_PREFIX = b"bench/"
+
+
+def _payload(pub_id: int, seq: int, size: int) -> bytes:
+    head = b"%d:%d:%d:" % (pub_id, seq, time.monotonic_ns())
+    return head + b"x" * max(0, size - len(head))
+
+
+class _Recorder:
+    """Latency samples, byte counts and per-publisher sequence gaps for one observer."""
+
+    def __init__(self) -> None:
+        self.latencies: List[int] = []
+        self.bytes = 0
+        self.gaps = 0
+        self._last: Dict[int, int] = {}
+
+    def record(self, payload: bytes, now_ns: int, size: int) -> None:
+        pub, seq, ts, _ = payload.split(b":", 3)
+        self.latencies.append(now_ns - int(ts))
+        self.bytes += size
+        p, s = int(pub), int(seq)
+        prev = self._last.get(p)
+        if prev is not None and s > prev + 1:
+            self.gaps += s - prev - 1
+        self._last[p] = s
+
+    def result(self) -> Dict[str, Any]:
+        return {"latencies": self.latencies, "bytes": self.bytes, "gaps": self.gaps}
+
+
+def run_publisher(pub_id: int, cfg: Dict[str, Any], start_at: float, out: "mp.Queue[Any]") -> None:
+    ctx = zmq.Context()
+    sock = ctx.socket(zmq.PUB)
+    sock.set_hwm(cfg["hwm"])
+    sock.connect(f"tcp://127.0.0.1:{cfg['xsub_port']}")
+    topic = TOPIC_PREFIX + str(pub_id).encode()
+    rate, size = cfg["rate"], cfg["size"]
+    time.sleep(max(0.0, start_at - time.time()))
+    t0 = time.monotonic()
+    end = t0 + cfg["duration"]
+    seq = 0
+    while True:
+        now = time.monotonic()
+        if now >= end:
+            break
+        if rate > 0:
+            ahead = t0 + seq / rate - now
+            if ahead > 0.001:
+                time.sleep(ahead)
+        sock.send_multipart([topic, _payload(pub_id, seq, size)])
+        seq += 1
+    out.put(("publisher", pub_id, {"sent": seq, "elapsed": time.monotonic() - t0}))
+    sock.close(linger=1000)
+    ctx.term()
+
+
+def run_subscriber(sub_id: int, cfg: Dict[str, Any], stop_at: float, out: "mp.Queue[Any]") -> None:
+    ctx = zmq.Context()
+    sock = ctx.socket(zmq.SUB)
+    sock.set_hwm(cfg["hwm"])
+    sock.setsockopt(zmq.SUBSCRIBE, TOPIC_PREFIX)
+    sock.connect(f"tcp://127.0.0.1:{cfg['xpub_port']}")
+    rec = _Recorder()
+    while time.time() < stop_at:
+        if not sock.poll(100):
+            continue
+        while True:
+            try:
+                frames = sock.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            rec.record(frames[1], time.monotonic_ns(), len(frames[0]) + len(frames[1]))
+    out.put(("subscriber", sub_id, rec.result()))
+    sock.close(0)
+    ctx.term()
+
+
+_BIN_HEAD = struct.Struct("<IBBHQdBB")
+
+
+def _binary_payloads(frame: bytes) -> List[bytes]:
+    """Second ZMQ frame of every bus record in a binary /ws/events frame."""
+    out = []
+    off = 0
+    while off < len(frame):
+        length, _, flags, nparts, _, _, kind_len, source_len = _BIN_HEAD.unpack_from(frame, off)
+        pos = off + _BIN_HEAD.size + kind_len + source_len
+        sizes = struct.unpack_from(f"<{nparts}I", frame, pos)
+        if not flags & 0x01 and nparts >= 2:  # skip JSON (non-bus) records
+            start = pos + 4 * nparts + sizes[0]
+            out.append(frame[start : start + sizes[1]])
+        off += 4 + length
+    return out
+
+
+def run_ws_client(client_id: int, cfg: Dict[str, Any], stop_at: float, out: "mp.Queue[Any]") -> None:
+    asyncio.run(_ws_client(client_id, cfg, stop_at, out))
+
+
+async def _ws_client(client_id: int, cfg: Dict[str, Any], stop_at: float, out: "mp.Queue[Any]") -> None:
+    import websockets
+
+    base = f"ws://127.0.0.1:{cfg['http_port']}"
+    rec = _Recorder()
+    query = "&".join(q for q, on in (("batch=1", cfg["ws_batch"]), ("binary=1", cfg["ws_binary"])) if on)
+    query = "?" + query if query else ""
+    async with websockets.connect(base + "/ws/events" + query, max_size=None) as ev, websockets.connect(
+        base + "/ws/control"
+    ) as ctl:
+        hello = json.loads(await ev.recv())
+        await ctl.send(
+            json.dumps(
+                {"action": "set_filter", "client_id": hello["meta"]["client_id"], "include": [TOPIC_PREFIX.decode()], "kinds": ["bus"]}
+            )
+        )
+        await ctl.recv()
+        while time.time() < stop_at:
+            try:
+                frame = await asyncio.wait_for(ev.recv(), timeout=0.2)
+            except asyncio.TimeoutError:
+                continue
+            now = time.monotonic_ns()
+            if isinstance(frame, bytes):
+                payloads = _binary_payloads(frame)
+                for payload in payloads:
+                    rec.record(payload, now, len(frame) // len(payloads))
+                continue
+            data = json.loads(frame)
+            for event in data if isinstance(data, list) else [data]:
+                payload = event.get("payload")
+                if isinstance(payload, str):
+                    rec.record(payload.encode(), now, len(frame) // (len(data) if isinstance(data, list) else 1))
+    out.put(("ws", client_id, rec.result()))
+
+
+def _percentiles(samples: List[int]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"p50": None, "p99": None, "p999": None, "max": None}
+    s = sorted(samples)
+
+    def pick(q: float) -> float:
+        return round(s[min(len(s) - 1, int(q * len(s)))] / 1000.0, 1)
+
+    return {"p50": pick(0.50), "p99": pick(0.99), "p999": pick(0.999), "max": round(s[-1] / 1000.0, 1)}
+
+
+def _stage(results: List[Dict[str, Any]], expected: int, duration: float) -> Dict[str, Any]:
+    latencies = [x for r in results for x in r["latencies"]]
+    received = len(latencies)
+    total_bytes = sum(r["bytes"] for r in results)
+    return {
+        "observers": len(results),
+        "messages": received,
+        "bytes": total_bytes,
+        "msgs_per_s": round(received / duration, 1),
+        "bytes_per_s": round(total_bytes / duration, 1),
+        "latency_us": _percentiles(latencies),
+        "dropped": max(0, expected - received),
+        "seq_gaps": sum(r["gaps"] for r in results),
+    }
+
+
+async def _bus_probe(bus: Any, stop_at: float) -> Dict[str, Any]:
+    from backend.events import EventFilter
+
+    sub, _ = await bus.subscribe()
+    await bus.set_filter(sub.id, EventFilter(include=(TOPIC_PREFIX.decode(),), kinds=frozenset({"bus"})))
+    rec = _Recorder()
+    try:
+        while time.time() < stop_at:
+            try:
+                data, _ = await asyncio.wait_for(sub.queue.get(), timeout=0.2)
+            except asyncio.TimeoutError:
+                continue
+            payload = json.loads(data).get("payload")
+            if isinstance(payload, str):
+                rec.record(payload.encode(), time.monotonic_ns(), len(data))
+    finally:
+        await bus.unsubscribe(sub)
+    return rec.result()
+
+
+async def run(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    import uvicorn
+
+    os.environ.update(
+        {
+            "ZMQHUB_XSUB_BIND": f"tcp://127.0.0.1:{cfg['xsub_port']}",
+            "ZMQHUB_XPUB_BIND": f"tcp://127.0.0.1:{cfg['xpub_port']}",
+            "ZMQHUB_PROXY_MODE": cfg["proxy_mode"],
+            "ZMQHUB_LOG_LEVEL": "WARNING",
+        }
+    )
+    from backend.app import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=cfg["http_port"], log_level="warning"))
+    serve = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    mpctx = mp.get_context("spawn")
+    out: "mp.Queue[Any]" = mpctx.Queue()
+    warmup, drain = 2.0, 2.0
+    start_at = time.time() + warmup
+    stop_at = start_at + cfg["duration"] + drain
+    procs = [mpctx.Process(target=run_subscriber, args=(i, cfg, stop_at, out)) for i in range(cfg["subscribers"])]
+    procs += [mpctx.Process(target=run_ws_client, args=(i, cfg, stop_at, out)) for i in range(cfg["ws_clients"])]
+    procs += [mpctx.Process(target=run_publisher, args=(i, cfg, start_at, out)) for i in range(cfg["publishers"])]
+    for p in procs:
+        p.start()
+    probe = asyncio.create_task(_bus_probe(app.state.bus, stop_at)) if cfg["bus_probe"] else None
+
+    collected: Dict[str, List[Dict[str, Any]]] = {"publisher": [], "subscriber": [], "ws": []}
+    for _ in procs:
+        kind, _id, result = await asyncio.to_thread(out.get)
+        collected[kind].append(result)
+    for p in procs:
+        await asyncio.to_thread(p.join)
+    bus_result = await probe if probe is not None else None
+
+    health = json.loads(
+        await asyncio.to_thread(lambda: urllib.request.urlopen(f"http://127.0.0.1:{cfg['http_port']}/healthz").read())
+    )
+    server.should_exit = True
+    await serve
+
+    sent = sum(r["sent"] for r in collected["publisher"])
+    duration = cfg["duration"]
+    stages = {"xsub_to_xpub": _stage(collected["subscriber"], sent * cfg["subscribers"], duration)}
+    if bus_result is not None:
+        stages["capture_to_bus"] = _stage([bus_result], sent, duration)
+    stages["bus_to_ws"] = _stage(collected["ws"], sent * cfg["ws_clients"], duration)
+    return {
+        "config": cfg,
+        "sent": {"messages": sent, "msgs_per_s": round(sent / duration, 1)},
+        "stages": stages,
+        "hub": health,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--publishers", type=int, default=1)
+    ap.add_argument("--subscribers", type=int, default=1)
+    ap.add_argument("--ws-clients", type=int, default=1)
+    ap.add_argument("--size", type=int, default=128, help="payload bytes")
+    ap.add_argument("--rate", type=float, default=1000.0, help="msgs/s per publisher; 0 = as fast as possible")
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds of publishing")
+    ap.add_argument("--proxy-mode", choices=["steerable", "poll"], default="steerable")
+    ap.add_argument("--ws-batch", action="store_true", help="use batched /ws/events framing")
+    ap.add_argument("--ws-binary", action="store_true", help="use the binary /ws/events protocol")
+    ap.add_argument("--no-bus-probe", dest="bus_probe", action="store_false")
+    ap.add_argument("--hwm", type=int, default=100000)
+    ap.add_argument("--xsub-port", type=int, default=25551)
+    ap.add_argument("--xpub-port", type=int, default=25552)
+    ap.add_argument("--http-port", type=int, default=28080)
+    ap.add_argument("--out", help="write JSON results to this file instead of stdout")
+    args = ap.parse_args()
+    cfg = {k: v for k, v in vars(args).items() if k != "out"}
+    result = asyncio.run(run(cfg))
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
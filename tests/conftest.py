@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+import socket
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+import pytest
+
+from backend.config import Settings
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(cond: Callable[[], Any], timeout: float = 5.0, interval: float = 0.01) -> Any:
+    deadline = time.monotonic() + timeout
+    while True:
+        value = cond()
+        if value or time.monotonic() >= deadline:
+            return value
+        time.sleep(interval)
+
+
+@pytest.fixture
+def make_settings(tmp_path: Path) -> Callable[..., Settings]:
+    """Settings isolated from the environment: loopback ports and per-test ipc/inproc endpoints."""
+    counter = [0]
+
+    def make(**overrides: Any) -> Settings:
+        counter[0] += 1
+        n = counter[0]
+        values: dict = {
+            "xsub_bind": f"tcp://127.0.0.1:{free_port()}",
+            "xpub_bind": f"tcp://127.0.0.1:{free_port()}",
+            "capture_endpoint": f"inproc://test-capture-{id(tmp_path)}-{n}",
+            "control_endpoint": f"inproc://test-control-{id(tmp_path)}-{n}",
+            "inject_endpoint": f"inproc://test-inject-{id(tmp_path)}-{n}",
+            "tap_endpoint": f"inproc://test-tap-{id(tmp_path)}-{n}",
+            "bridge_local_endpoint": f"inproc://test-bridge-{id(tmp_path)}-{n}",
+            "core_fanout_endpoint": f"ipc://{tmp_path}/fanout-{n}",
+            "core_inject_endpoint": f"ipc://{tmp_path}/inject-{n}",
+            "replay_max_events": 0,
+        }
+        values.update(overrides)
+        return Settings(_env_file=None, **values)
+
+    return make
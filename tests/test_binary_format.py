@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import json
+import struct
+from typing import Any, Dict, List
+
+from backend.events import (
+    BIN_FLAG_JSON,
+    BIN_FLAG_TRUNCATED,
+    BIN_VERSION,
+    BusEvent,
+    encode_event_binary,
+    pack_binary,
+)
+
+
+def _parse(buf: bytes) -> List[Dict[str, Any]]:
+    """Read a batch as a client would, from the documented layout alone."""
+    out = []
+    pos = 0
+    while pos < len(buf):
+        (length,) = struct.unpack_from("<I", buf, pos)
+        end = pos + 4 + length
+        version, flags, nparts, seq, ts_ms, klen, slen = struct.unpack_from("<BBHQdBB", buf, pos + 4)
+        pos += 4 + 22
+        kind, source = buf[pos : pos + klen].decode(), buf[pos + klen : pos + klen + slen].decode()
+        pos += klen + slen
+        sizes = list(struct.unpack_from("<%dI" % nparts, buf, pos))
+        pos += 4 * nparts
+        parts = []
+        for n in sizes:
+            parts.append(buf[pos : pos + n])
+            pos += n
+        full = None
+        if flags & BIN_FLAG_TRUNCATED:
+            full = list(struct.unpack_from("<%dI" % nparts, buf, pos))
+            pos += 4 * nparts
+        assert pos == end
+        out.append(
+            {"version": version, "flags": flags, "seq": seq, "ts_ms": ts_ms, "kind": kind, "source": source, "parts": parts, "full": full}
+        )
+    return out
+
+
+def test_pack_binary_layout_and_batches() -> None:
+    one = pack_binary(7, 1234.5, "bus", "xsub", [b"t/a", b"", b"\x00\xff payload"])
+    two = pack_binary(8, 1235.0, "bus", "xpub", [b"t/b"])
+    assert struct.unpack_from("<I", one)[0] == len(one) - 4
+    first, second = _parse(one + two)
+    assert first == {
+        "version": BIN_VERSION,
+        "flags": 0,
+        "seq": 7,
+        "ts_ms": 1234.5,
+        "kind": "bus",
+        "source": "xsub",
+        "parts": [b"t/a", b"", b"\x00\xff payload"],
+        "full": None,
+    }
+    assert (second["seq"], second["source"], second["parts"]) == (8, "xpub", [b"t/b"])
+
+
+def test_truncated_preview_carries_original_sizes() -> None:
+    event = BusEvent("xsub", [b"t/big", b"x" * 16], wall_ns=2_000_000_000, sizes=[5, 100_000])
+    event.seq = 3
+    (rec,) = _parse(event.encode_binary())
+    assert rec["flags"] == BIN_FLAG_TRUNCATED
+    assert rec["parts"] == [b"t/big", b"x" * 16]
+    assert rec["full"] == [5, 100_000]
+    assert (rec["seq"], rec["ts_ms"]) == (3, 2000.0)
+
+
+def test_decoded_and_non_bus_events_are_json_records() -> None:
+    event = BusEvent("xsub", [b"md/eq", b"\x01\x02"], wall_ns=1_000_000)
+    event.seq = 5
+    raw = event.encode_binary()
+    assert _parse(raw)[0]["flags"] == 0
+    # A decoder's result replaces the cached raw record with the event's JSON
+    event.set_decoded("demo", {"px": 1.5})
+    (rec,) = _parse(event.encode_binary())
+    assert rec["flags"] == BIN_FLAG_JSON and rec["seq"] == 5
+    doc = json.loads(rec["parts"][0])
+    assert doc["payload"] == {"px": 1.5} and doc["meta"]["decoder"] == "demo"
+    assert event.encode_binary() is event.encode_binary()
+
+    (rec,) = _parse(encode_event_binary({"kind": "monitor", "source": "zmq", "seq": 9, "payload": {"event": "x"}}))
+    assert (rec["flags"], rec["kind"], rec["source"], rec["seq"]) == (BIN_FLAG_JSON, "monitor", "zmq", 9)
+    assert json.loads(rec["parts"][0])["payload"] == {"event": "x"}
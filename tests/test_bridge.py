@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+from typing import Any, Dict, List, Tuple
+
+import zmq
+
+from backend.bridge import Bridge
+from backend.config import Settings
+from backend.fanout import FanoutSink
+from backend.zmq_proxy import Proxy
+
+from conftest import free_port, wait_for
+
+
+class _Node:
+    """One hub's proxy and bridge, as Hub runs them."""
+
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.sink = FanoutSink(settings)
+        self.sink.start()
+        self.proxy = Proxy(settings, self.sink)  # type: ignore[arg-type]
+        self.proxy.start()
+        self.bridge = Bridge(settings, self.proxy)
+        self.bridge.start()
+
+    def stop(self) -> None:
+        self.bridge.stop()
+        self.proxy.stop()
+        self.sink.stop()
+
+    def peers(self) -> List[str]:
+        return sorted(link["peer"] for link in self.bridge.stats()["links"] if link["connected"])
+
+
+def _recv_all(sock: zmq.Socket, wait_ms: int = 300) -> List[bytes]:
+    out = []
+    while sock.poll(wait_ms):
+        out.append(sock.recv_multipart()[1])
+        wait_ms = 100
+    return out
+
+
+def test_three_hubs_in_a_loop(make_settings: Any) -> None:
+    names = ("a", "b", "c")
+    binds = {n: f"tcp://127.0.0.1:{free_port()}" for n in names}
+    # a -> b -> c -> a: every hub has two links and every message two paths
+    links = {"a": [binds["b"]], "b": [binds["c"]], "c": [binds["a"]]}
+    settings: Dict[str, Settings] = {
+        n: make_settings(
+            bridge_id=n,
+            bridge_bind=binds[n],
+            bridge_links=links[n],
+            bridge_heartbeat_ms=100.0,
+            bridge_batch_ms=1.0,
+            topics_enabled=False,
+        )
+        for n in names
+    }
+    nodes = {n: _Node(settings[n]) for n in names}
+    ctx = zmq.Context()
+    socks: List[zmq.Socket] = []
+
+    def subscriber(node: str) -> zmq.Socket:
+        sock = ctx.socket(zmq.SUB)
+        sock.setsockopt(zmq.SUBSCRIBE, b"x/")
+        sock.connect(settings[node].xpub_bind)
+        socks.append(sock)
+        return sock
+
+    def reaches(*subs: zmq.Socket) -> bool:
+        pub.send_multipart([b"x/probe", b""])
+        return all(s.poll(20) for s in subs)
+
+    def publish(payloads: List[bytes]) -> Tuple[List[bytes], ...]:
+        for p in payloads:
+            pub.send_multipart([b"x/n", p])
+        return _recv_all(sub_b), _recv_all(sub_c)
+
+    try:
+        assert wait_for(lambda: all(len(node.peers()) == 2 for node in nodes.values()))
+        sub_b, sub_c = subscriber("b"), subscriber("c")
+        pub = ctx.socket(zmq.PUB)
+        pub.connect(settings["a"].xsub_bind)
+        socks.append(pub)
+        assert wait_for(lambda: reaches(sub_b, sub_c))
+        _recv_all(sub_b), _recv_all(sub_c)
+
+        # Only the subscribed prefix is advertised, and only it crosses the links
+        a = nodes["a"].bridge
+        assert {prefix for link in a._links for prefix, _ in link.interest} == {b"x/"}
+        assert a._subscribed == frozenset({b"x/"})
+        sent = sum(link["sent"] for link in a.stats()["links"])
+        pub.send_multipart([b"y/n", b"-"])
+        assert publish([b"1"]) == ([b"1"], [b"1"])
+        assert sum(link["sent"] for link in a.stats()["links"]) == sent + 2
+
+        # Both paths are up, yet every message arrives once
+        expected = [b"%d" % i for i in range(20)]
+        assert publish(expected) == (expected, expected)
+        assert a.duplicates + nodes["b"].bridge.duplicates + nodes["c"].bridge.duplicates == 0
+
+        # b goes away: a and c lose it and keep serving each other
+        nodes["b"].stop()
+        assert wait_for(lambda: nodes["a"].peers() == ["c"] and nodes["c"].peers() == ["a"])
+        for p in (b"lost-1", b"lost-2"):
+            pub.send_multipart([b"x/n", p])
+        assert _recv_all(sub_c) == [b"lost-1", b"lost-2"]
+
+        # b comes back on the same endpoints; both its links recover
+        nodes["b"] = _Node(settings["b"])
+        assert wait_for(lambda: all(len(node.peers()) == 2 for node in nodes.values()))
+        _recv_all(sub_b, 0)
+        assert wait_for(lambda: reaches(sub_b))
+        _recv_all(sub_b), _recv_all(sub_c)
+        got = publish([b"back-%d" % i for i in range(5)])
+        assert got == ([b"back-%d" % i for i in range(5)],) * 2
+    finally:
+        for sock in socks:
+            sock.close(0)
+        ctx.term()
+        for node in nodes.values():
+            node.stop()
+
+
+def test_middle_hub_relays_in_a_line(make_settings: Any) -> None:
+    binds = [f"tcp://127.0.0.1:{free_port()}" for _ in range(3)]
+    # a -> b -> c with no a-c link: only b can carry a's messages to c
+    settings = [
+        make_settings(bridge_id=n, bridge_bind=binds[i], bridge_links=binds[i + 1 : i + 2], bridge_heartbeat_ms=100.0, bridge_batch_ms=1.0)
+        for i, n in enumerate("abc")
+    ]
+    nodes = [_Node(s) for s in settings]
+    ctx = zmq.Context()
+    sub = ctx.socket(zmq.SUB)
+    sub.setsockopt(zmq.SUBSCRIBE, b"x/")
+    sub.connect(settings[2].xpub_bind)
+    pub = ctx.socket(zmq.PUB)
+    pub.connect(settings[0].xsub_bind)
+    try:
+        assert wait_for(lambda: pub.send_multipart([b"x/probe", b""]) or sub.poll(20))
+        _recv_all(sub)
+        for i in range(10):
+            pub.send_multipart([b"x/n", b"%d" % i])
+        assert _recv_all(sub) == [b"%d" % i for i in range(10)]
+        assert nodes[2].bridge.duplicates == 0
+    finally:
+        sub.close(0)
+        pub.close(0)
+        ctx.term()
+        for node in nodes:
+            node.stop()
+
+
+def test_injected_messages_are_recognised_when_they_come_back(make_settings: Any) -> None:
+    bridge = Bridge(make_settings(bridge_dedup=8), proxy=None)  # type: ignore[arg-type]
+    bridge._inject_sock = SimpleNamespace(send_multipart=lambda msg, **kw: None)  # type: ignore[assignment]
+    bridge._subscribed_prefixes = (b"x/",)
+
+    def frames(*parts: bytes) -> List[zmq.Frame]:
+        return [zmq.Frame(p) for p in parts]
+
+    for seq, (topic, payload) in enumerate([(b"x/a", b"1"), (b"x/a", b"2"), (b"y/a", b"3")], 1):
+        bridge._inject((b"peer", seq, 1, frames(topic, payload)))
+    assert list(bridge._echo) == [b"x/a"]  # only what our own subscription brings back
+    bridge._on_local(frames(b"x/a", b"3"))
+    bridge._on_local(frames(b"x/a", b"1"))
+    assert bridge.originated == 1
+    # A local publish identical to an injected one takes its echo's place: one copy goes on
+    bridge._on_local(frames(b"x/a", b"2"))
+    bridge._on_local(frames(b"x/a", b"2"))
+    assert bridge.originated == 2 and bridge._echo == {}
+    # An echo lost to a full pipe does not hold back the ones after it
+    for seq, payload in ((4, b"4"), (5, b"5")):
+        bridge._inject((b"peer", seq, 1, frames(b"x/b", payload)))
+    bridge._on_local(frames(b"x/b", b"5"))
+    bridge._on_local(frames(b"x/b", b"4"))
+    assert bridge.originated == 3 and bridge._echo == {}
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, List, Tuple
+
+from backend.capture_log import MAGIC, CaptureReader, CaptureWriter, pack_record
+
+
+def _write(writer: CaptureWriter, records: List[Tuple[int, List[bytes]]]) -> None:
+    # Group-commit with chosen timestamps, as the writer thread would
+    writer._pending.extend(records)
+    writer._commit()
+
+
+def _records(n: int, t0: int = 1_000_000) -> List[Tuple[int, List[bytes]]]:
+    return [(t0 + i * 10, [b"t/%d" % (i % 2), b"%04d" % i + b"x" * 40]) for i in range(n)]
+
+
+def test_index_bisects_to_the_start(make_settings: Any, tmp_path: Path) -> None:
+    settings = make_settings(capture_dir=str(tmp_path), capture_index_bytes=256)
+    writer = CaptureWriter(settings)
+    records = _records(200)
+    _write(writer, records)
+    writer._close_segment()
+    (seg,) = tmp_path.glob("*.seg")
+    assert seg.read_bytes().startswith(MAGIC)
+    assert seg.with_suffix(".idx").stat().st_size // 16 > 10
+
+    reader = CaptureReader(tmp_path)
+    start = records[150][0]
+    # The index lands on the record at or before the start, well past the segment head
+    assert len(MAGIC) < reader._seek(seg, start) < seg.stat().st_size
+    assert reader._seek(seg, 0) == len(MAGIC)
+
+    got = list(reader.query(start_ns=start, end_ns=records[160][0]))
+    assert got == records[150:161]
+    odd = list(reader.query(start_ns=start, topic_prefix=b"t/1", limit=3))
+    assert odd == [records[151], records[153], records[155]]
+    assert list(reader.query(start_ns=records[-1][0] + 1)) == []
+
+
+def test_rotation_retention_and_partial_tail(make_settings: Any, tmp_path: Path) -> None:
+    settings = make_settings(capture_dir=str(tmp_path), capture_segment_bytes=1024, capture_retention_bytes=10 * 1024)
+    writer = CaptureWriter(settings)
+    records = _records(400)
+    for i in range(0, len(records), 20):
+        _write(writer, records[i : i + 20])
+    segments = sorted(tmp_path.glob("*.seg"))
+    # Old segments were pruned down to the retention budget, newest kept
+    assert len(segments) > 2
+    assert sum(p.stat().st_size for p in segments) <= 10 * 1024 + 1024 + 20 * len(pack_record(0, records[0][1]))
+    assert int(segments[0].stem) > records[0][0]
+
+    # A record still being written at the end of the live segment is not returned
+    with open(segments[-1], "ab") as f:
+        f.write(pack_record(records[-1][0] + 10, [b"t/0", b"late"])[:-2])
+    got = list(CaptureReader(tmp_path).query())
+    first = next(i for i, r in enumerate(records) if r[0] == got[0][0])
+    assert got == records[first:]
+    assert got[0][0] == int(segments[0].stem)
+    writer._close_segment()
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, List
+
+import zmq
+
+from backend.capture_log import CaptureWriter
+from backend.events import EventBus
+from backend.hub import Hub
+from conftest import wait_for
+
+
+def _recv_all(sock: zmq.Socket, n: int, timeout_ms: int) -> List[List[bytes]]:
+    out: List[List[bytes]] = []
+    while len(out) < n and sock.poll(timeout_ms, zmq.POLLIN):
+        out.append(sock.recv_multipart())
+    return out
+
+
+def test_replay_reinjects_in_order(make_settings: Any, tmp_path: Any) -> None:
+    settings = make_settings(capture_dir=str(tmp_path / "capture"), capture_flush_ms=10.0, publish_batch_max=7)
+    writer = CaptureWriter(settings)
+    writer.start()
+    for i in range(50):
+        writer.append([b"rp/%d" % (i % 3), b"%d" % i])
+    writer.append([b"other/x", b"-"])
+    assert wait_for(lambda: writer.written == 51)
+    writer.stop()
+
+    ctx = zmq.Context()
+    sub = ctx.socket(zmq.SUB)
+    sub.setsockopt(zmq.SUBSCRIBE, b"")
+    sub.connect(settings.xpub_bind)
+
+    async def run() -> List[List[bytes]]:
+        bus = EventBus(asyncio.get_running_loop(), replay=None)
+        hub = Hub(settings, bus)
+        hub.start()
+        try:
+            assert hub.replayer is not None
+            # Probe until the subscription has reached the proxy
+            for _ in range(200):
+                hub.publish_frames([b"probe", b""])
+                if await asyncio.to_thread(_recv_all, sub, 1, 20):
+                    break
+            while await asyncio.to_thread(_recv_all, sub, 1, 50):
+                pass
+            hub.replayer.start(end_ns=time.time_ns(), topics=["rp/"], speed=0)
+            got = await asyncio.to_thread(_recv_all, sub, 50, 2000)
+            assert await asyncio.to_thread(wait_for, lambda: hub.replayer.status()["state"] == "finished")
+            status = hub.replayer.status()
+            assert status["sent"] == 50
+            assert not await asyncio.to_thread(_recv_all, sub, 1, 100)
+            return got
+        finally:
+            hub.stop()
+
+    try:
+        got = asyncio.run(run())
+    finally:
+        sub.close(0)
+        ctx.term()
+    assert got == [[b"rp/%d" % (i % 3), b"%d" % i] for i in range(50)]
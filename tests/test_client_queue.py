@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+from typing import List
+
+import pytest
+
+from backend.client_queue import CONFLATE, DISCONNECT, DROP_NEWEST, DROP_OLDEST, ClientClosed, ClientQueue
+
+
+def _drain(q: ClientQueue) -> List[bytes]:
+    out = []
+    while not q.empty():
+        out.append(q.get_nowait()[0])
+    return out
+
+
+def test_drop_oldest_and_drop_newest() -> None:
+    q = ClientQueue(3, policy=DROP_OLDEST)
+    assert [q.put((b"%d" % i, 0.0)) for i in range(5)] == [(0, 0)] * 3 + [(1, 0)] * 2
+    assert _drain(q) == [b"2", b"3", b"4"]
+    assert q.nbytes == 0
+
+    q = ClientQueue(3, policy=DROP_NEWEST)
+    assert [q.put((b"%d" % i, 0.0)) for i in range(5)] == [(0, 0)] * 3 + [(1, 0)] * 2
+    assert _drain(q) == [b"0", b"1", b"2"]
+    with pytest.raises(asyncio.QueueEmpty):
+        q.get_nowait()
+
+
+def test_byte_bound() -> None:
+    q = ClientQueue(100, max_bytes=10)
+    for frame in (b"aaaa", b"bbbb", b"cc"):
+        assert q.put((frame, 0.0)) == (0, 0)
+    assert q.nbytes == 10
+    # Makes room by evicting from the front until it fits
+    assert q.put((b"dddddd", 0.0)) == (2, 0)
+    assert q.nbytes == 8
+    # An empty queue takes any frame, however large
+    q = ClientQueue(100, max_bytes=10)
+    assert q.put((b"x" * 50, 0.0)) == (0, 0)
+    assert q.put((b"y", 0.0)) == (1, 0)
+    assert _drain(q) == [b"y"]
+
+
+def test_disconnect_when_full_or_lagging() -> None:
+    q = ClientQueue(2, policy=DISCONNECT)
+    q.put((b"a", 0.0))
+    q.put((b"b", 0.0))
+    assert q.put((b"c", 0.0)) == (1, 0)
+    assert q.closed and q.qsize() == 0 and q.nbytes == 0
+    assert q.put((b"d", 0.0)) == (1, 0)
+    with pytest.raises(ClientClosed):
+        q.get_nowait()
+
+    q = ClientQueue(100, policy=DISCONNECT, max_lag_ms=50.0)
+    q.put((b"a", 10.0))
+    assert q.put((b"b", 10.04)) == (0, 0)
+    assert not q.closed
+    # The oldest queued frame has now waited longer than max_lag_ms
+    assert q.put((b"c", 10.06)) == (1, 0)
+    assert q.closed
+
+
+def test_conflate_keeps_latest_per_key_in_place() -> None:
+    q = ClientQueue(3, policy=CONFLATE)
+    assert q.put((b"a1", 0.0), key=b"a") == (0, 0)
+    assert q.put((b"b1", 0.0), key=b"b") == (0, 0)
+    assert q.put((b"a2", 0.0), key=b"a") == (0, 1)
+    assert q.qsize() == 2 and q.nbytes == 4
+    assert q.put((b"k", 0.0)) == (0, 0)
+    # A new key on a full queue evicts the oldest entry
+    assert q.put((b"c1", 0.0), key=b"c") == (1, 0)
+    assert _drain(q) == [b"b1", b"k", b"c1"]
+
+
+def test_conflate_byte_bound_and_policy_switch() -> None:
+    q = ClientQueue(10, max_bytes=8, policy=CONFLATE)
+    q.put((b"aa", 0.0), key=b"a")
+    q.put((b"bb", 0.0), key=b"b")
+    # A bigger value for b pushes the total over the byte bound; older keys go first
+    assert q.put((b"bbbbbbb", 0.0), key=b"b") == (1, 1)
+    assert q.nbytes == 7
+
+    q = ClientQueue(10, policy=DROP_OLDEST)
+    for frame in (b"1", b"2"):
+        q.put((frame, 0.0))
+    q.set_policy(CONFLATE)
+    q.put((b"3", 0.0), key=b"t")
+    q.put((b"4", 0.0), key=b"t")
+    q.set_policy(DROP_NEWEST)
+    assert _drain(q) == [b"1", b"2", b"4"]
+    with pytest.raises(ValueError):
+        q.set_policy("bogus")
+
+
+def test_get_waits_for_put_and_close() -> None:
+    async def run() -> None:
+        q = ClientQueue(4)
+        waiter = asyncio.ensure_future(q.get())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        q.put((b"x", 0.0))
+        assert (await asyncio.wait_for(waiter, 1.0))[0] == b"x"
+
+        waiter = asyncio.ensure_future(q.get())
+        await asyncio.sleep(0)
+        q.close()
+        with pytest.raises(ClientClosed):
+            await asyncio.wait_for(waiter, 1.0)
+
+    asyncio.run(run())
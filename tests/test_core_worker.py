@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, List
+
+import pytest
+import zmq
+
+from backend.core import Core
+from backend.events import EventBus
+from backend.hub import Hub
+
+
+async def _bus_events(sub: Any, n: int, timeout: float) -> List[dict]:
+    out: List[dict] = []
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while len(out) < n and loop.time() < deadline:
+        try:
+            frame, _ = await asyncio.wait_for(sub.next_frame(), deadline - loop.time())
+        except asyncio.TimeoutError:
+            break
+        event = json.loads(frame)
+        if event["kind"] == "bus":
+            out.append(event)
+    return out
+
+
+@pytest.mark.parametrize("mode", ["steerable", "poll"])
+def test_core_forwards_to_every_worker(make_settings: Any, mode: str) -> None:
+    core_settings = make_settings(proxy_mode=mode)
+    worker_settings = core_settings.model_copy(update={"hub_role": "worker"})
+    core = Core(core_settings)
+    core.start()
+    ctx = zmq.Context()
+    sub = ctx.socket(zmq.SUB)
+    sub.setsockopt(zmq.SUBSCRIBE, b"")
+    sub.connect(core_settings.xpub_bind)
+    pub = ctx.socket(zmq.PUB)
+    pub.connect(core_settings.xsub_bind)
+
+    async def run() -> List[List[dict]]:
+        # Two workers, as uvicorn --workers 2 would run them, each with its own bus
+        buses = [EventBus(asyncio.get_running_loop(), replay=None) for _ in range(2)]
+        hubs = [Hub(worker_settings, bus) for bus in buses]
+        for hub in hubs:
+            hub.start()
+        try:
+            clients = [(await bus.subscribe())[0] for bus in buses]
+            # Probe until the publisher, the proxy and both workers' relays are connected
+            for _ in range(200):
+                pub.send_multipart([b"probe", b"{}"])
+                if all([await _bus_events(client, 1, 0.02) for client in clients]):
+                    break
+            await asyncio.sleep(0.1)
+            for client in clients:
+                while await _bus_events(client, 1, 0.05):
+                    pass
+            for i in range(3):
+                pub.send_multipart([b"t/%d" % i, json.dumps({"i": i}).encode()])
+            return [await _bus_events(client, 3, 5.0) for client in clients]
+        finally:
+            for hub in hubs:
+                hub.stop()
+
+    try:
+        got = asyncio.run(run())
+    finally:
+        pub.close(0)
+        sub.close(0)
+        ctx.term()
+        core.stop()
+    for events in got:
+        assert [e["topic"] for e in events] == ["t/0", "t/1", "t/2"]
+        assert [json.loads(e["payload"]) for e in events] == [{"i": 0}, {"i": 1}, {"i": 2}]
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from typing import Any, Dict, List
+
+import pytest
+
+from backend.decoders import DecoderPool, DecoderSpec, parse_decoders
+from backend.events import BusEvent, EventBus
+
+calls: List[bytes] = []
+gate = threading.Event()
+
+
+def count_calls(topic: bytes, frames: List[bytes]) -> Any:
+    calls.append(topic)
+    return {"n": int(frames[0])}
+
+
+def stuck(topic: bytes, frames: List[bytes]) -> Any:
+    calls.append(topic)
+    gate.wait(5.0)
+    return "late"
+
+
+def test_registry() -> None:
+    specs = parse_decoders(
+        [
+            {"prefix": "md/", "type": "json"},
+            {"prefix": "md/raw/", "type": "python", "callable": "test_decoders:count_calls"},
+        ]
+    )
+    assert [s.to_dict() for s in specs][0] == {"prefix": "md/", "type": "json"}
+    pool = DecoderPool(specs)
+    # The longest matching prefix wins
+    assert pool.name(pool.match(b"md/raw/x")) == "python"  # type: ignore[arg-type]
+    assert pool.name(pool.match(b"md/eq")) == "json"  # type: ignore[arg-type]
+    assert pool.match(b"other") is None
+    assert parse_decoders(None) == ()
+    for bad in (
+        {"prefix": "a", "type": "xml"},
+        {"prefix": "a", "type": "protobuf", "message": "M"},
+        {"prefix": "a", "type": "python", "callable": "nocolon"},
+        {"prefix": 1, "type": "json"},
+    ):
+        with pytest.raises(ValueError):
+            parse_decoders([bad])
+    # Unloadable callables fail when the pool is built, not on the first message
+    with pytest.raises(ValueError):
+        DecoderPool([DecoderSpec(prefix="a", type="python", callable="test_decoders:missing")])
+    with pytest.raises(ValueError):
+        DecoderPool([], pool="fork")
+
+
+def test_pool_runs_jobs_and_reports_errors() -> None:
+    pool = DecoderPool([DecoderSpec(prefix="", type="json")])
+    try:
+        results = pool.submit([(0, b"t", [b'{"a": 1}']), (0, b"t", [b"1", b"[2]"]), (0, b"t", [b"{bad"])]).result(5.0)
+    finally:
+        pool.close()
+    assert results[0] == ({"a": 1}, None)
+    assert results[1] == ([1, [2]], None)
+    assert results[2][0] is None and results[2][1].startswith("JSONDecodeError")
+
+
+def _drain(bus: EventBus, subs: List[Any]) -> List[List[Dict[str, Any]]]:
+    out = []
+    for sub in subs:
+        events = []
+        while not sub.queue.empty():
+            events.append(json.loads(sub.queue.get_nowait()[0]))
+        out.append(events)
+    return out
+
+
+def test_viewers_share_one_decode() -> None:
+    calls.clear()
+
+    async def run() -> List[List[Dict[str, Any]]]:
+        pool = DecoderPool([DecoderSpec(prefix="d/", type="python", callable="test_decoders:count_calls")])
+        bus = EventBus(asyncio.get_running_loop(), decoders=pool)
+        try:
+            subs = [(await bus.subscribe())[0] for _ in range(5)]
+            await bus.publish(BusEvent("xsub", [b"d/a", b"7"]))
+            for _ in range(200):
+                if all(not s.queue.empty() for s in subs):
+                    break
+                await asyncio.sleep(0.01)
+            return _drain(bus, subs)
+        finally:
+            pool.close()
+
+    got = asyncio.run(run())
+    assert calls == [b"d/a"]
+    assert [[(e["payload"], e["meta"]["decoder"]) for e in events] for events in got] == [[({"n": 7}, "python")]] * 5
+
+
+def test_stuck_decoder_times_out_and_delays_only_its_topics() -> None:
+    calls.clear()
+    gate.clear()
+
+    async def run() -> Dict[str, Any]:
+        pool = DecoderPool([DecoderSpec(prefix="slow/", type="python", callable="test_decoders:stuck")], workers=1)
+        bus = EventBus(asyncio.get_running_loop(), decoders=pool, decode_timeout_ms=200.0)
+        try:
+            sub, _ = await bus.subscribe()
+            loop = asyncio.get_running_loop()
+            t0 = loop.time()
+            bus.publish_threadsafe(BusEvent("xsub", [b"slow/a", b"1"]))
+            bus.publish_threadsafe(BusEvent("xsub", [b"fast/a", b"2"]))
+            await asyncio.sleep(0.01)
+            await bus.publish({"kind": "monitor", "source": "zmq", "topic": None, "payload": "up"})
+            await bus.publish(BusEvent("xsub", [b"slow/b", b"3"]))  # queued behind the stuck job
+            await asyncio.sleep(0.05)
+            early = [(e["kind"], e["topic"]) for e in _drain(bus, [sub])[0]]
+            while sub.queue.qsize() < 2 and loop.time() - t0 < 3.0:
+                await asyncio.sleep(0.01)
+            late = _drain(bus, [sub])[0]
+            elapsed = loop.time() - t0
+            gate.set()
+            await asyncio.sleep(0.1)
+            return {"early": early, "late": late, "elapsed": elapsed, "stats": bus.stats}
+        finally:
+            gate.set()
+            pool.close()
+
+    out = asyncio.run(run())
+    # Undecoded topics and other events went out while the decoder was stuck
+    assert out["early"] == [("bus", "fast/a"), ("monitor", None)]
+    assert [(e["topic"], e["payload"], e["meta"]["decode_error"]) for e in out["late"]] == [
+        ("slow/a", "1", "timeout"),
+        ("slow/b", "3", "timeout"),
+    ]
+    assert 0.15 < out["elapsed"] < 2.0
+    assert out["stats"].decode_timeouts == 2
+    # The queued job was cancelled at its deadline instead of running late
+    assert calls == [b"slow/a"]
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+from backend.client_queue import ClientQueue
+from backend.config import Settings
+from backend.events import BusEvent, EventBus, EventFilter, Subscriber
+from backend.replay_buffer import ReplayBuffer
+
+
+def test_batch_frame_keeps_events_when_batching_is_turned_off() -> None:
+    async def run() -> list:
+        sub = Subscriber(ClientQueue(100), batch=True, flush_ms=50.0)
+        for i in range(3):
+            sub.queue.put((json.dumps({"i": i}), 0.0))
+        frame = asyncio.ensure_future(sub.next_frame())
+        await asyncio.sleep(0.01)  # next_frame is inside its flush window
+        sub.set_protocol({"batch": False})
+        text, _ = await frame
+        return json.loads(text)
+
+    assert asyncio.run(run()) == [{"i": 0}, {"i": 1}, {"i": 2}]
+
+
+def test_unbatched_frames_are_single_events() -> None:
+    async def run() -> list:
+        sub = Subscriber(ClientQueue(100))
+        for i in range(2):
+            sub.queue.put((json.dumps({"i": i}), 0.0))
+        return [json.loads((await sub.next_frame())[0]) for _ in range(2)]
+
+    assert asyncio.run(run()) == [{"i": 0}, {"i": 1}]
+
+
+def test_capture_interest_follows_live_filters() -> None:
+    async def run() -> list:
+        bus = EventBus(asyncio.get_running_loop())
+        sub, _ = await bus.subscribe()
+        seen = [bus.wants(b"md/x")]
+        await bus.set_filter(sub.id, EventFilter.from_dict({"include": ["orders/"]}))
+        seen += [bus.wants(b"orders/1"), bus.wants(b"md/x")]
+        await bus.unsubscribe(sub)
+        seen.append(bus.wants(b"orders/1"))
+        # A replay buffer keeps everything, so nothing can be skipped
+        kept = EventBus(asyncio.get_running_loop(), replay=ReplayBuffer(10, 1 << 20))
+        return seen + [kept.wants(b"md/x")]
+
+    assert asyncio.run(run()) == [True, True, False, False, True]
+
+
+def test_replay_topics_bound_interest_and_backfill() -> None:
+    async def run() -> list:
+        loop = asyncio.get_running_loop()
+        everything = EventBus(loop, replay=ReplayBuffer(10, 1 << 20))
+        bus = EventBus(loop, replay=ReplayBuffer(10, 1 << 20), replay_topics=["state/"])
+        seen = [everything.wants(b"md/x"), bus.wants(b"state/a"), bus.wants(b"md/x")]
+        sub, _ = await bus.subscribe()
+        await bus.set_filter(sub.id, EventFilter.from_dict({"include": ["md/"]}))
+        seen += [bus.wants(b"md/x"), bus.wants(b"orders/1")]
+        for topic in (b"state/a", b"md/x"):
+            await bus.publish(BusEvent("xsub", [topic, b"1"]))
+        await bus.publish({"kind": "monitor", "source": "xsub", "topic": "tcp://x", "payload": None})
+        # Viewed but not listed: delivered live, not kept for backfill
+        kept = [e.get("kind") + ":" + str(e.get("topic")) for e in bus.replayed(since=0)]
+        return seen + [kept]
+
+    assert asyncio.run(run()) == [True, True, False, True, False, ["bus:state/a", "monitor:tcp://x"]]
+
+
+def test_replay_is_on_by_default() -> None:
+    settings = Settings(_env_file=None)
+    assert settings.replay_max_events > 0 and settings.replay_topics == []
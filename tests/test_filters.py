@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import pytest
+from fastapi import WebSocketDisconnect
+
+from backend.app import app, ws_control
+from backend.client_queue import ClientQueue
+from backend.events import BusEvent, EventBus, EventFilter, FilterIndex, Subscriber
+
+
+def _sub(**flt: Any) -> Subscriber:
+    sub = Subscriber(ClientQueue(10))
+    sub.filter = EventFilter.from_dict(flt)
+    return sub
+
+
+def _bus(topic: str, payload: Any = "x") -> Dict[str, Any]:
+    return {"kind": "bus", "source": "xsub", "topic": topic, "payload": payload}
+
+
+def test_index_matches_prefixes_kinds_and_text() -> None:
+    index = FilterIndex()
+    subs = {
+        "all": _sub(),
+        "md": _sub(include=["md/"]),
+        "md_no_fx": _sub(include=["md/"], exclude=["md/fx/"]),
+        "no_md": _sub(exclude=["md/"]),
+        "monitor": _sub(kinds=["monitor"]),
+        "eur": _sub(include=["md/", "orders/"], text="EUR"),
+    }
+    for sub in subs.values():
+        index.add(sub)
+    twin = _sub(include=["md/"])
+    index.add(twin)  # same filter, same group
+    assert len(index) == 7 and len(index.filters()) == 6
+
+    def names(event: Any) -> List[str]:
+        matched = index.match(event)
+        return sorted(name for name, sub in subs.items() if sub in matched)
+
+    assert names(_bus("md/eq/x")) == ["all", "md", "md_no_fx"]
+    assert names(_bus("md/fx/eurusd")) == ["all", "md"]
+    assert names(_bus("orders/1", "buy EUR")) == ["all", "eur", "no_md"]
+    assert names(_bus("md/fx/eur", ["bid", "EUR 1.1"])) == ["all", "eur", "md"]
+    assert names(_bus("m")) == ["all", "no_md"]
+    # Include prefixes only apply to events that carry a topic
+    assert names({"kind": "monitor", "source": "zmq", "topic": None, "payload": {}}) == [
+        "all", "md", "md_no_fx", "monitor", "no_md",
+    ]
+    assert names(BusEvent("xsub", [b"md/a", b"EUR"])) == ["all", "eur", "md", "md_no_fx"]
+
+    index.discard(subs["md_no_fx"])
+    assert names(_bus("md/eq/x")) == ["all", "md"]
+    # Lookups are memoized per topic until the filters change
+    assert "md/eq/x" in index._cache
+    # A group lives until its last subscriber goes
+    index.discard(subs["md"])
+    assert "md/eq/x" in index._cache and twin in index.match(_bus("md/eq/x"))
+    index.discard(twin)
+    assert "md/eq/x" not in index._cache and len(index.filters()) == 4
+
+
+def test_filter_validation() -> None:
+    assert EventFilter.from_dict({}).is_open
+    assert EventFilter.from_dict({"include": ["a"]}).to_dict()["include"] == ["a"]
+    for bad in ({"include": "a"}, {"kinds": [1]}, {"text": 3}):
+        with pytest.raises(ValueError):
+            EventFilter.from_dict(bad)
+
+
+def test_set_filter_replaces_the_previous_one() -> None:
+    async def run() -> List[Any]:
+        bus = EventBus(asyncio.get_running_loop())
+        sub, _ = await bus.subscribe()
+        await bus.set_filter(sub.id, EventFilter.from_dict({"include": ["md/"]}))
+        await bus.set_filter(sub.id, EventFilter.from_dict({"include": ["orders/"]}))
+        for topic in (b"md/a", b"orders/1"):
+            await bus.publish(BusEvent("xsub", [topic, b"1"]))
+        got = []
+        while not sub.queue.empty():
+            got.append(json.loads(sub.queue.get_nowait()[0])["topic"])
+        # Nothing of the old filter stays in the index
+        return [got, bus._index.filters(), await bus.set_filter("nope", EventFilter())]
+
+    got, filters, unknown = asyncio.run(run())
+    assert got == ["orders/1"]
+    assert filters == [EventFilter(include=("orders/",))]
+    assert unknown is False
+
+
+def test_interest_is_the_union_of_bus_filters() -> None:
+    async def run() -> List[Any]:
+        bus = EventBus(asyncio.get_running_loop())
+        a, _ = await bus.subscribe()
+        b, _ = await bus.subscribe()
+        await bus.set_filter(a.id, EventFilter.from_dict({"include": ["md/"]}))
+        # Filters that take no captured messages leave interest alone
+        await bus.set_filter(b.id, EventFilter.from_dict({"kinds": ["monitor"]}))
+        seen = [bus._interest, bus.wants(b"md/x"), bus.wants(b"orders/1")]
+        await bus.set_filter(b.id, EventFilter.from_dict({"sources": ["xpub"]}))
+        seen.append(bus._interest)
+        await bus.set_filter(b.id, EventFilter.from_dict({"include": ["orders/"], "kinds": ["bus"]}))
+        seen += [sorted(bus._interest), bus.wants(b"orders/1"), bus.wants(b"state/a")]
+        # An exclude-only filter takes any topic not excluded, so nothing can be skipped
+        await bus.set_filter(b.id, EventFilter.from_dict({"exclude": ["md/"]}))
+        seen += [bus._interest, bus.wants(b"state/a")]
+        # A topic that is not UTF-8 is matched in its base64 form by the bus
+        await bus.set_filter(b.id, EventFilter.from_dict({"include": ["md/"]}))
+        seen.append(bus.wants(b"\xff\xfe"))
+        return seen
+
+    assert asyncio.run(run()) == [
+        (b"md/",), True, False,
+        (b"md/",),
+        [b"md/", b"orders/"], True, False,
+        None, True,
+        True,
+    ]
+
+
+class _Socket:
+    """Plays a /ws/control client: sends `inbox`, then hangs up."""
+
+    def __init__(self, inbox: List[Dict[str, Any]]) -> None:
+        self.inbox = [json.dumps(m) for m in inbox]
+        self.sent: List[Dict[str, Any]] = []
+
+    async def accept(self) -> None:
+        pass
+
+    async def receive_text(self) -> str:
+        if not self.inbox:
+            raise WebSocketDisconnect()
+        return self.inbox.pop(0)
+
+    async def send_json(self, data: Dict[str, Any]) -> None:
+        self.sent.append(data)
+
+
+def test_ws_control_set_filter(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def run() -> List[Any]:
+        bus = EventBus(asyncio.get_running_loop())
+        monkeypatch.setattr(app.state, "bus", bus, raising=False)
+        monkeypatch.setattr(app.state, "hub", None, raising=False)
+        sub, _ = await bus.subscribe()
+        ws = _Socket(
+            [
+                {"action": "set_filter", "client_id": sub.id, "include": ["md/"], "exclude": ["md/fx/"], "text": "EUR"},
+                {"action": "subscribe", "client_id": sub.id, "topics": ["orders/"]},
+                {"action": "set_filter", "client_id": sub.id, "kinds": "bus"},
+                {"action": "set_filter", "client_id": "nope"},
+            ]
+        )
+        await ws_control(ws)  # type: ignore[arg-type]
+        return [ws.sent, sub.filter]
+
+    sent, flt = asyncio.run(run())
+    assert sent[0]["ok"] and sent[0]["filter"] == {
+        "include": ["md/"], "exclude": ["md/fx/"], "kinds": [], "sources": [], "text": "EUR",
+    }
+    # The subscribe hint swaps the prefixes and keeps the rest of the filter
+    assert sent[1]["filter"]["include"] == ["orders/"] and sent[1]["filter"]["text"] == "EUR"
+    assert sent[2] == {"ok": False, "error": "kinds must be an array of strings"}
+    assert sent[3] == {"ok": False, "error": "unknown_client"}
+    assert flt == EventFilter(include=("orders/",), exclude=("md/fx/",), text="EUR")
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, List
+
+import pytest
+import zmq
+
+from backend.config import Settings
+from backend.events import EventBus
+from backend.hub import Hub
+from backend.publisher import frames_from_message
+
+
+def test_frames_from_message_validates() -> None:
+    assert frames_from_message({"topic": "t", "payload": "aGk=", "encoding": "base64"}) == [b"t", b"hi"]
+    assert frames_from_message({"topic": "t", "multipart": ["YQ==", "Yg=="]}) == [b"t", b"a", b"b"]
+    for bad in ({"topic": ""}, {"topic": "t", "encoding": "hex"}, {"topic": "t", "multipart": "YQ=="}, []):
+        with pytest.raises(ValueError):
+            frames_from_message(bad)
+
+
+def test_inject_connect_is_refused(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert Settings().inject_connect == ""
+    monkeypatch.setenv("ZMQHUB_INJECT_CONNECT", "tcp://127.0.0.1:5551")
+    with pytest.raises(ValueError, match="inject_endpoint"):
+        Settings()
+
+
+def test_publish_frames_sends_and_echoes(make_settings: Any) -> None:
+    settings = make_settings()
+    ctx = zmq.Context()
+    sub = ctx.socket(zmq.SUB)
+    sub.setsockopt(zmq.SUBSCRIBE, b"ui/")
+    sub.connect(settings.xpub_bind)
+
+    async def run() -> List[Any]:
+        bus = EventBus(asyncio.get_running_loop())
+        hub = Hub(settings, bus)
+        hub.start()
+        try:
+            client, _ = await bus.subscribe()
+            frames = frames_from_message({"topic": "ui/x", "payload": "hi"})
+            # Until the subscription reaches the proxy, published messages go nowhere
+            for _ in range(200):
+                assert hub.publish_frames(frames)
+                if await asyncio.to_thread(sub.poll, 20):
+                    break
+            received = sub.recv_multipart()
+            while True:  # subscription and stats events share the stream
+                frame, _ = await asyncio.wait_for(client.next_frame(), 2.0)
+                event = json.loads(frame)
+                if event.get("source") == "inject":
+                    return [received, event]
+        finally:
+            hub.stop()
+
+    try:
+        received, echo = asyncio.run(run())
+    finally:
+        sub.close(0)
+        ctx.term()
+    assert received == [b"ui/x", b"hi"]
+    assert (echo["source"], echo["topic"], echo["payload"]) == ("inject", "ui/x", "hi")
+    assert echo["meta"]["ui_originated"] is True
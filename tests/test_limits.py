@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import pytest
+
+from backend.limits import DROP, HOLD, PASS, SamplingRule, TokenBucket, TopicSampler, parse_rules
+
+
+def test_token_bucket_refills_up_to_burst() -> None:
+    bucket = TokenBucket(rate=10.0, burst=2.0)
+    assert [bucket.take(0.0) for _ in range(3)] == [True, True, False]
+    assert bucket.take(0.05) is False
+    assert bucket.take(0.1) is True
+    # A long pause refills only up to the burst
+    assert [bucket.take(100.0) for _ in range(3)] == [True, True, False]
+
+
+def test_parse_rules() -> None:
+    rules = parse_rules([{"prefix": "md/", "every": 3}, {"max_rate": 5}, {"prefix": "x", "interval_ms": 100}])
+    assert [r.to_dict() for r in rules] == [
+        {"prefix": "md/", "every": 3},
+        {"prefix": "", "max_rate": 5.0},
+        {"prefix": "x", "interval_ms": 100.0},
+    ]
+    assert parse_rules(None) == ()
+    for bad in ({"prefix": "a"}, {"every": 2, "max_rate": 1}, {"every": True}, {"max_rate": -1}, {"prefix": 1, "every": 2}, "x"):
+        with pytest.raises(ValueError):
+            parse_rules([bad])
+    with pytest.raises(ValueError):
+        parse_rules({"every": 2})
+
+
+def test_every_counts_per_topic_and_longest_prefix_wins() -> None:
+    sampler = TopicSampler([SamplingRule(prefix="md/", every=3), SamplingRule(prefix="md/fx/", every=1)])
+    assert [sampler.check("md/eq", 0.0) for _ in range(7)] == [PASS, DROP, DROP, PASS, DROP, DROP, PASS]
+    # A quiet topic is not starved by a chatty one
+    assert sampler.check("md/bond", 0.0) == PASS
+    assert [sampler.check("md/fx/eur", 0.0) for _ in range(3)] == [PASS] * 3
+    assert sampler.check("other", 0.0) == PASS
+
+
+def test_max_rate() -> None:
+    sampler = TopicSampler([SamplingRule(max_rate=2.0)])
+    assert [sampler.check("t", 0.0) for _ in range(3)] == [PASS, PASS, DROP]
+    assert sampler.check("t", 0.5) == PASS
+    assert sampler.check("u", 0.5) == PASS
+
+
+def test_interval_holds_the_latest() -> None:
+    sampler = TopicSampler([SamplingRule(prefix="q/", interval_ms=100.0)])
+    assert sampler.check("q/a", 1.0) == PASS
+    assert sampler.check("q/a", 1.02) == HOLD
+    assert sampler.hold("q/a", "e1") == (False, pytest.approx(1.1))
+    assert sampler.check("q/a", 1.05) == HOLD
+    assert sampler.hold("q/a", "e2") == (True, pytest.approx(1.1))
+    assert sampler.due(1.08) == ([], pytest.approx(1.1))
+    # Only the newest held message goes out, and it restarts the interval
+    assert sampler.due(1.1) == (["e2"], None)
+    assert sampler.check("q/a", 1.15) == HOLD
+    assert sampler.check("q/a", 1.21) == PASS
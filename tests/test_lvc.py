@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import logging
+from typing import Any, List
+
+import zmq
+
+from backend.fanout import FanoutSink
+from backend.lvc import LastValueCache
+from backend.zmq_proxy import Proxy
+
+from conftest import free_port, wait_for
+
+
+def _drain(sock: zmq.Socket, wait_ms: int = 200) -> List[List[bytes]]:
+    out = []
+    while sock.poll(wait_ms):
+        out.append(sock.recv_multipart())
+        wait_ms = 50
+    return out
+
+
+def test_latest_prefers_the_exact_topic_then_the_newest() -> None:
+    lvc = LastValueCache(10, 0)
+    lvc.update(b"t/a", [b"t/a", b"1"])
+    lvc.update(b"t/b", [b"t/b", b"2"])
+    lvc.update(b"t", [b"t", b"3"])
+    assert lvc.latest(b"t") == [b"t", b"3"]
+    assert lvc.latest(b"t/") == [b"t/b", b"2"]
+    lvc.update(b"t/a", [b"t/a", b"4"])
+    assert lvc.latest(b"t/") == [b"t/a", b"4"]
+    assert lvc.latest(b"x") is None
+    assert lvc.stats()["sent"] == 3
+
+
+def test_cached_value_goes_to_the_new_subscriber_only(make_settings: Any, caplog: Any) -> None:
+    settings = make_settings(
+        lvc_enabled=True, proxy_mode="steerable", topics_enabled=False, lvc_snapshot_bind=f"tcp://127.0.0.1:{free_port()}"
+    )
+    sink = FanoutSink(settings)
+    sink.start()
+    proxy = Proxy(settings, sink)  # type: ignore[arg-type]
+    with caplog.at_level(logging.WARNING, logger="zmqhub.proxy"):
+        proxy.start()
+    assert "running proxy_mode=poll" in caplog.text
+    ctx = zmq.Context()
+    try:
+        old = ctx.socket(zmq.SUB)
+        old.setsockopt(zmq.SUBSCRIBE, b"t/")
+        old.connect(settings.xpub_bind)
+        pub = ctx.socket(zmq.PUB)
+        pub.connect(settings.xsub_bind)
+        # The cache subscribes upstream by itself; publish until the old subscriber sees it
+        assert wait_for(lambda: pub.send_multipart([b"t/a", b"v1"]) or old.poll(20))
+        _drain(old)
+        pub.send_multipart([b"t/b", b"v2"])
+        assert _drain(old) == [[b"t/b", b"v2"]]
+
+        new = ctx.socket(zmq.SUB)
+        new.setsockopt(zmq.SUBSCRIBE, b"t/a")
+        new.connect(settings.xpub_bind)
+        assert _drain(new) == [[b"t/a", b"v1"]]
+        assert _drain(old) == []  # no repeat for existing subscribers
+
+        # Live traffic reaches everyone again afterwards, also after an unsubscribe
+        other = ctx.socket(zmq.SUB)
+        other.setsockopt(zmq.SUBSCRIBE, b"none/")
+        other.connect(settings.xpub_bind)
+        assert wait_for(lambda: proxy.subscriptions.counts().get(b"none/"))
+        other.setsockopt(zmq.UNSUBSCRIBE, b"none/")
+        assert wait_for(lambda: not proxy.subscriptions.counts().get(b"none/"))
+        pub.send_multipart([b"t/a", b"v3"])
+        assert _drain(new) == [[b"t/a", b"v3"]]
+        assert _drain(old) == [[b"t/a", b"v3"]]
+        assert proxy.lvc is not None and proxy.lvc.stats()["sent"] == 1
+
+        # A snapshot carries every cached topic under the prefix, to the requester alone
+        pub.send_multipart([b"u/x", b"other"])
+        dealer = ctx.socket(zmq.DEALER)
+        dealer.connect(settings.lvc_snapshot_bind)
+        dealer.send(b"t/")
+        assert _drain(dealer) == [[b"V", b"t/b", b"v2"], [b"V", b"t/a", b"v3"], [b"E", b"2"]]
+        dealer.send(b"none/")
+        assert _drain(dealer) == [[b"E", b"0"]]
+        assert _drain(old) == [] and _drain(new) == []
+        assert proxy.lvc.stats()["snapshots"] == 2
+        for sock in (old, new, other, pub, dealer):
+            sock.close(0)
+    finally:
+        ctx.term()
+        proxy.stop()
+        sink.stop()
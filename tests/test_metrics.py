@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+import zmq
+
+from backend.events import EventBus, EventFilter
+from backend.metrics import CAPTURE_SKIPPED, TopK, topic_prefix
+from backend.subscriptions import subscription_event
+from backend.zmq_proxy import Proxy
+
+
+def test_topk_keeps_heavy_keys_with_exact_totals() -> None:
+    top = TopK(2)
+    for _ in range(10):
+        top.update("heavy", 5)
+    top.update("other", 1)
+    for i in range(10):
+        top.update(f"noise/{i}", 1)  # each new key ages the others instead of joining
+    items = {k: (n, b) for k, n, b in top.items()}
+    assert items["heavy"] == (10, 50)
+    assert len(items) <= 2
+
+
+def test_topic_prefix_cuts_levels() -> None:
+    assert topic_prefix("md/eu/x", 2) == "md/eu"
+    assert topic_prefix("md", 2) == "md"
+    assert topic_prefix("md/eu/x", 0) == "md/eu/x"
+
+
+def test_topics_are_counted_at_capture_even_when_skipped(make_settings: Any) -> None:
+    async def run() -> dict:
+        bus = EventBus(asyncio.get_running_loop(), topic_depth=1)
+        sub, _ = await bus.subscribe()
+        await bus.set_filter(sub.id, EventFilter.from_dict({"include": ["orders/"]}))
+        proxy = Proxy(make_settings(topics_enabled=False), bus)
+        skipped = CAPTURE_SKIPPED.value
+        proxy._on_capture([zmq.Frame(b"md/a"), zmq.Frame(b"1234")])
+        proxy._on_capture([zmq.Frame(b"orders/1"), zmq.Frame(b"x")])
+        assert CAPTURE_SKIPPED.value == skipped + 1
+        await asyncio.sleep(0.01)
+        # Echoes of injected messages and other events are not captured traffic
+        await bus.publish({"kind": "bus", "source": "inject", "topic": "md/b", "meta": {"sizes": [4, 2]}})
+        await bus.publish(subscription_event("subscribe", b"orders/", 1, ts=""))
+        await bus.publish({"kind": "monitor", "source": "xsub", "topic": "tcp://x", "meta": {}})
+        return {k: (n, b) for k, n, b in bus.topics.items()}
+
+    assert asyncio.run(run()) == {"md": (1, 8), "orders": (1, 9)}
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from backend import profiling
+from backend.app import app, debug_profile, debug_stages
+from backend.profiling import StageTracer, sample_stacks, watch_loop_lag
+
+
+def test_stage_quantiles_and_reset() -> None:
+    tracer = StageTracer()
+    for _ in range(98):
+        tracer.observe("send", 100_000)  # 0.1 ms
+    tracer.observe("send", 10_000_000)
+    tracer.observe("send", 2_000_000_000)
+    tracer.observe("ring", -5)  # clock skew counts as zero
+    stages = tracer.snapshot()["stages"]
+    assert set(stages) == {"send", "ring"}
+    send = stages["send"]
+    assert send["count"] == 100 and send["max_ms"] == 2000.0
+    assert send["p50_ms"] == send["p90_ms"] and abs(send["p50_ms"] - 0.1) <= 0.025
+    assert abs(send["p99_ms"] - 10.0) <= 2.5 and 1500 <= send["p999_ms"] <= 2000.0
+    assert stages["ring"]["p50_ms"] == 0.0
+    tracer.reset()
+    assert tracer.snapshot()["stages"] == {}
+
+
+def test_loop_lag_is_recorded() -> None:
+    async def run() -> Any:
+        tracer = StageTracer()
+        task = asyncio.ensure_future(watch_loop_lag(tracer, 0.01))
+        await asyncio.sleep(0.02)
+        time.sleep(0.05)  # blocks the loop
+        await asyncio.sleep(0.03)
+        task.cancel()
+        return tracer.snapshot()["stages"]["loop_lag"]
+
+    lag = asyncio.run(run())
+    assert lag["count"] >= 2 and lag["max_ms"] >= 30.0
+
+
+def _spin(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(100))
+
+
+def test_sample_stacks_collapses_thread_stacks() -> None:
+    stop = threading.Event()
+    worker = threading.Thread(target=_spin, args=(stop,), name="spinner", daemon=True)
+    worker.start()
+    try:
+        text, samples = sample_stacks(0.2, 100.0)
+    finally:
+        stop.set()
+        worker.join()
+    assert 10 <= samples <= 25
+    lines = [line.rsplit(" ", 1) for line in text.splitlines()]
+    spinner = [(stack.split(";"), int(n)) for stack, n in lines if stack.startswith("spinner;")]
+    assert spinner and sum(n for _, n in spinner) == samples
+    # Outermost first, innermost last
+    assert spinner[0][0][-1].startswith("_spin (tests/test_profiling.py:")
+    assert not any(stack.startswith("MainThread;") for stack, _ in lines)
+
+
+def test_one_profile_at_a_time() -> None:
+    started = threading.Event()
+    done: Any = []
+
+    def run() -> None:
+        started.set()
+        done.append(sample_stacks(0.3, 50.0))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    started.wait()
+    time.sleep(0.05)
+    with pytest.raises(RuntimeError):
+        sample_stacks(0.1, 10.0)
+    thread.join()
+    assert done[0][1] > 0
+
+
+def test_debug_endpoints(monkeypatch: pytest.MonkeyPatch, make_settings: Any) -> None:
+    tracer = StageTracer()
+    tracer.observe("fanout", 2_000_000)
+    monkeypatch.setattr(app.state, "bus", SimpleNamespace(tracer=None), raising=False)
+    monkeypatch.setattr(app.state, "settings", make_settings(profiling_enabled=False), raising=False)
+
+    async def run() -> Any:
+        off = [(await debug_stages()).status_code, (await debug_profile()).status_code]
+        app.state.bus.tracer = tracer
+        app.state.settings = make_settings(profiling_enabled=True, profiling_max_s=0.1)
+        stages = await debug_stages(reset=True)
+        after = await debug_stages()
+        # seconds is capped at profiling_max_s
+        t0 = time.monotonic()
+        profile = await debug_profile(seconds=60.0, hz=50.0)
+        elapsed = time.monotonic() - t0
+        with profiling._profiling:
+            busy = await debug_profile(seconds=0.1)
+        return off, stages, after, profile, elapsed, busy
+
+    off, stages, after, profile, elapsed, busy = asyncio.run(run())
+    assert off == [404, 404]
+    assert json.loads(stages.body)["stages"]["fanout"]["count"] == 1
+    assert json.loads(after.body)["stages"] == {}
+    assert profile.status_code == 200 and int(profile.headers["X-Zmqhub-Samples"]) >= 1
+    assert elapsed < 1.0
+    assert busy.status_code == 409
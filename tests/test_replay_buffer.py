@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, List
+
+from backend.events import BusEvent, EventBus
+from backend.replay_buffer import ReplayBuffer
+
+
+def test_since_and_last_on_topic() -> None:
+    ring = ReplayBuffer(max_events=4, max_bytes=1000)
+    for seq in range(1, 7):
+        ring.append(seq, "a" if seq % 2 else "b", seq, 10)
+    assert ring.first_seq == 3 and ring.last_seq == 6
+    assert ring.since(0) == [3, 4, 5, 6]
+    assert ring.since(4) == [5, 6]
+    assert ring.last(2) == [5, 6]
+    assert ring.last(5, "a") == [3, 5]
+    assert ring.stats()["bytes"] == 40
+
+
+def test_sparse_sequence_numbers() -> None:
+    # The bus leaves out topics the buffer does not keep
+    ring = ReplayBuffer(max_events=3, max_bytes=1000)
+    for seq in (1, 4, 9, 12):
+        ring.append(seq, "t", seq, 10)
+    assert ring.since(0) == [4, 9, 12]
+    assert ring.since(5) == [9, 12] and ring.since(12) == []
+    assert ring.first_seq == 2 and ring.last_seq == 12
+    assert ring.last(2, "t") == [9, 12]
+
+
+def test_byte_bound_evicts_oldest() -> None:
+    ring = ReplayBuffer(max_events=100, max_bytes=25)
+    for seq in range(1, 4):
+        ring.append(seq, None, seq, 10)
+    assert ring.since(0) == [2, 3]
+    assert ring.gap(0) and not ring.gap(1)
+
+
+def test_oversized_event_is_skipped_as_a_gap() -> None:
+    ring = ReplayBuffer(max_events=3, max_bytes=25)
+    for seq in (1, 2):
+        ring.append(seq, "t", seq, 10)
+    ring.append(3, "t", 3, 30)  # larger than the whole buffer
+    ring.append(4, "t", 4, 10)
+    # The history stays; only the one event is missing
+    assert ring.since(0) == [2, 4] and ring.last_seq == 4
+    assert ring.gap(1) and ring.gap(2) and not ring.gap(3) and not ring.gap(4)
+    ring.append(5, "t", 5, 10)  # evicts 2, then the skip at 3 is before the oldest
+    assert ring.since(0) == [4, 5] and ring.first_seq == 4 and not ring.gap(3)
+    assert ring.stats()["skipped"] == 0
+    # Consecutive skips at the start of the window just move it on
+    for seq in range(6, 10):
+        ring.append(seq, "t", seq, 30)
+    assert ring.stats()["skipped"] == 0 and ring.first_seq == 10
+    assert ring.since(0) == [] and ring.gap(8) and not ring.gap(9)
+    # Remembered skips are bounded by the capacity
+    for seq in (12, 14, 16, 18):
+        ring.append(seq, "t", seq, 30)
+    assert ring.stats()["skipped"] == 3 and ring.first_seq == 13
+    assert ring.gap(12) and ring.gap(17) and not ring.gap(18)
+
+
+def test_replaying_does_not_grow_retained_events() -> None:
+    async def run() -> List[Any]:
+        ring = ReplayBuffer(max_events=10, max_bytes=1 << 20)
+        bus = EventBus(asyncio.get_running_loop(), replay=ring)
+        await bus.subscribe()  # a live viewer, so the events are encoded
+        for i in range(3):
+            await bus.publish(BusEvent("xsub", [b"t/%d" % i, b"x" * 100]))
+        size = ring.stats()["bytes"]
+        _, backfill = await bus.subscribe(since=0)
+        _, binary = await bus.subscribe(last=2, binary=True)
+        retained = ring.since(0)
+        assert not any(e._json or e._bin or e._dict for e in retained)
+        assert ring.stats()["bytes"] == size == 3 * 103
+        assert len(binary) == 2
+        return [json.loads(t) for t in backfill]
+
+    events = asyncio.run(run())
+    assert [(e["seq"], e["topic"]) for e in events] == [(1, "t/0"), (2, "t/1"), (3, "t/2")]
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import gzip
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import pytest
+
+from backend.events import BusEvent
+from backend.sinks import SinkSpec, build_sink, parse_sinks
+
+from conftest import wait_for
+
+
+def _event(i: int, size: int = 1) -> Dict[str, Any]:
+    return {"kind": "bus", "source": "xsub", "topic": "t/%d" % i, "payload": "x" * size, "seq": i}
+
+
+def test_parse_sinks() -> None:
+    specs = parse_sinks([{"type": "file", "path": "/tmp/x", "include": ["md/"]}, {"type": "tcp", "address": "h:1"}])
+    assert [s.name for s in specs] == ["file", "tcp"]
+    assert specs[0].filter.include == ("md/",)
+    for bad in (
+        [{"type": "file"}],
+        [{"type": "http", "url": "ftp://x"}],
+        [{"type": "tcp", "address": "nope"}],
+        [{"type": "file", "path": "a", "on_full": "block"}],
+        [{"type": "file", "path": "a", "queue_bytes": -1}],
+        [{"type": "file", "path": "a"}, {"type": "file", "path": "b"}],
+    ):
+        with pytest.raises(ValueError):
+            parse_sinks(bad)
+
+
+def test_drop_oldest_and_drop_newest_accounting() -> None:
+    oldest = build_sink(SinkSpec(type="tcp", address="127.0.0.1:1", queue_size=3))
+    newest = build_sink(SinkSpec(type="tcp", address="127.0.0.1:1", queue_size=3, on_full="drop_newest"))
+    for i in range(5):
+        oldest.offer(_event(i))
+        newest.offer(_event(i))
+    assert [json.loads(line)["seq"] for line in oldest._buf] == [2, 3, 4]
+    assert [json.loads(line)["seq"] for line in newest._buf] == [0, 1, 2]
+    assert (oldest.accepted, oldest.dropped["queue_full"]) == (5, 2)
+    assert (newest.accepted, newest.dropped["queue_full"]) == (3, 2)
+
+
+def test_byte_bound() -> None:
+    line = len(json.dumps(_event(0, 100), separators=(",", ":"))) + 1
+    sink = build_sink(SinkSpec(type="tcp", address="127.0.0.1:1", queue_bytes=3 * line + 10))
+    for i in range(5):
+        sink.offer(_event(i, 100))
+    assert sink.queued == 3 and sink.dropped["queue_full"] == 2
+    assert sink.queued_bytes == sum(len(x) + 1 for x in sink._buf) <= 3 * line + 10
+    data, n = sink._take()
+    assert n == 3 and sink.queued_bytes == 0 and len(data) == sink._bytes_out
+    # An empty buffer takes any event, however large
+    sink.offer(_event(9, 10 * line))
+    assert sink.queued == 1
+
+
+def test_offer_encodes_on_the_calling_thread() -> None:
+    sink = build_sink(SinkSpec(type="tcp", address="127.0.0.1:1"))
+    event = BusEvent("xsub", [b"t/a", b"1"])
+    event.seq = 1
+    sink.offer(event)
+    # The shared event's JSON cache is filled here, not later on the sink thread
+    assert event._json is not None and sink._buf[0] == event.encode().encode("utf-8")
+
+
+def test_file_rotation_gzip_and_keep(tmp_path: Path) -> None:
+    spec = SinkSpec(type="file", path=str(tmp_path / "out" / "ev"), gzip=True, batch_max=2, rotate_bytes=1, keep=2)
+    sink = build_sink(spec)
+    for i in range(6):
+        sink.offer(_event(i))
+    sink.start()
+    sink.stop()  # sends everything buffered, one batch per file
+    files = sorted((tmp_path / "out").glob("ev-*.ndjson.gz"))
+    assert len(files) == 2
+    seqs = [json.loads(line)["seq"] for f in files for line in gzip.decompress(f.read_bytes()).splitlines()]
+    assert seqs == [2, 3, 4, 5]
+    assert (sink.sent, sink.batches) == (6, 3)
+
+
+class _Stub(BaseHTTPRequestHandler):
+    fail = 0
+    bodies: List[bytes] = []
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        cls = type(self)
+        if cls.fail > 0:
+            cls.fail -= 1
+            self.send_response(500)
+        else:
+            cls.bodies.append(gzip.decompress(body) if self.headers.get("Content-Encoding") == "gzip" else body)
+            self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def http_stub() -> Iterator[str]:
+    _Stub.fail = 0
+    _Stub.bodies = []
+    server = HTTPServer(("127.0.0.1", 0), _Stub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}/ingest"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_http_retries_then_succeeds(http_stub: str) -> None:
+    _Stub.fail = 2
+    sink = build_sink(SinkSpec(type="http", url=http_stub, gzip=True, retries=3, retry_backoff_ms=1.0, batch_ms=10.0))
+    sink.start()
+    try:
+        for i in range(3):
+            sink.offer(_event(i))
+        assert wait_for(lambda: sink.sent == 3)
+    finally:
+        sink.stop()
+    assert [json.loads(line)["seq"] for body in _Stub.bodies for line in body.splitlines()] == [0, 1, 2]
+    assert (sink.retries, sink.errors, sink.dropped["send_failed"], sink.failing) == (2, 2, 0, False)
+
+
+def test_http_drops_after_retries(http_stub: str) -> None:
+    _Stub.fail = 100
+    sink = build_sink(SinkSpec(type="http", url=http_stub, retries=2, retry_backoff_ms=1.0, batch_ms=10.0))
+    sink.start()
+    try:
+        sink.offer(_event(0))
+        sink.offer(_event(1))
+        assert wait_for(lambda: sink.dropped["send_failed"] == 2)
+    finally:
+        sink.stop()
+    assert (sink.sent, sink.retries, sink.errors, sink.failing) == (0, 2, 3, True)
+    assert sink.stats()["last_error"].startswith("HTTPError")
+
+
+def test_tcp_sink_writes_ndjson() -> None:
+    server = socket.create_server(("127.0.0.1", 0))
+    received = bytearray()
+
+    def serve() -> None:
+        conn, _ = server.accept()
+        with conn:
+            while chunk := conn.recv(65536):
+                received.extend(chunk)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    sink = build_sink(SinkSpec(type="tcp", address="127.0.0.1:%d" % server.getsockname()[1], batch_ms=10.0))
+    sink.start()
+    try:
+        for i in range(4):
+            sink.offer(_event(i))
+        assert wait_for(lambda: sink.sent == 4)
+    finally:
+        sink.stop()
+        thread.join(2.0)
+        server.close()
+    assert [json.loads(line)["seq"] for line in bytes(received).splitlines()] == [0, 1, 2, 3]
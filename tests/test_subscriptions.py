@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import time
+from typing import Any, List
+
+import pytest
+import zmq
+
+from backend.fanout import FanoutSink
+from backend.subscriptions import SubscriptionTable
+from backend.zmq_proxy import Proxy
+
+from conftest import wait_for
+
+
+def test_table_counts_subscribers_per_prefix() -> None:
+    table = SubscriptionTable()
+    assert table.update(b"\x01md/") == ("subscribe", b"md/", 1)
+    assert table.update(b"\x01md/") == ("subscribe", b"md/", 2)
+    assert table.update(b"\x00md/") == ("unsubscribe", b"md/", 1)
+    assert table.update(b"\x00md/") == ("unsubscribe", b"md/", 0)
+    assert table.update(b"md/") is None
+    assert table.counts() == {}
+
+
+@pytest.mark.parametrize("mode", ["steerable", "poll"])
+def test_published_frames_that_look_like_subscriptions(make_settings: Any, mode: str) -> None:
+    settings = make_settings(proxy_mode=mode, topics_enabled=False)
+    sink = FanoutSink(settings)
+    sink.start()
+    proxy = Proxy(settings, sink)  # type: ignore[arg-type]
+    captured: List[bytes] = []
+    on_capture = proxy._on_capture
+    proxy._on_capture = lambda msg, received_ns=0: captured.append(msg[0].bytes) or on_capture(msg, received_ns)  # type: ignore[method-assign]
+    proxy.start()
+    ctx = zmq.Context()
+    socks = []
+    try:
+        everything = ctx.socket(zmq.SUB)
+        everything.setsockopt(zmq.SUBSCRIBE, b"")
+        everything.connect(settings.xpub_bind)
+        shared = [ctx.socket(zmq.SUB) for _ in range(2)]
+        for sock in shared:
+            sock.setsockopt(zmq.SUBSCRIBE, b"t")
+            sock.connect(settings.xpub_bind)
+        pub = ctx.socket(zmq.PUB)
+        pub.connect(settings.xsub_bind)
+        socks = [everything, *shared, pub]
+        assert wait_for(lambda: proxy.subscriptions.counts() == {b"": 1, b"t": 2})
+        assert wait_for(lambda: pub.send(b"probe") or everything.poll(20))
+        while everything.poll(50):
+            everything.recv()
+
+        # Single-frame data shaped like (un)subscriptions to tracked prefixes
+        for frame in (b"\x00t", b"\x01t", b"\x01x", b"\x00"):
+            pub.send(frame)
+        got = [everything.recv() for _ in range(4) if everything.poll(2000)]
+        assert got == [b"\x00t", b"\x01t", b"\x01x", b"\x00"]
+        # Settled as published messages once the proxy has forwarded them, with nothing after them
+        assert wait_for(lambda: captured[-4:] == got)
+        assert proxy.subscriptions.counts() == {b"": 1, b"t": 2}
+        # One of two subscribers leaving is only seen on the mirror
+        shared[0].setsockopt(zmq.UNSUBSCRIBE, b"t")
+        assert wait_for(lambda: proxy.subscriptions.counts().get(b"t") == 1)
+        shared[1].setsockopt(zmq.UNSUBSCRIBE, b"t")
+        assert wait_for(lambda: proxy.subscriptions.counts() == {b"": 1})
+        pub.send(b"\x01t")
+        assert everything.poll(2000) and everything.recv() == b"\x01t"
+        assert wait_for(lambda: captured[-1:] == [b"\x01t"])
+        time.sleep(0.2)
+        assert proxy.subscriptions.counts() == {b"": 1}
+    finally:
+        for sock in socks:
+            sock.close(0)
+        ctx.term()
+        proxy.stop()
+        sink.stop()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from backend.histogram import bucket, bucket_value, quantiles
+from backend.topic_stats import TopicStats, _prefixes
+
+
+def test_prefixes_and_size_buckets() -> None:
+    assert _prefixes(b"md/fx/eur", 2) == [b"md", b"md/fx"]
+    assert _prefixes(b"md", 3) == [b"md", b"md", b"md"]
+    assert _prefixes(b"a/b", 0) == []
+    buckets = [bucket(n) for n in range(1 << 16)]
+    assert buckets == sorted(buckets)
+    for n in (0, 7, 8, 100, 1000, 65535):
+        assert abs(bucket_value(bucket(n)) - n) <= max(1, n // 4)
+    assert quantiles({}, (0.5, 0.9)) == [0, 0]
+    assert quantiles({bucket(10): 9, bucket(1000): 1}, (0.5, 0.9, 0.99)) == [bucket_value(bucket(10))] * 2 + [bucket_value(bucket(1000))]
+
+
+def test_sketch_never_undercounts() -> None:
+    stats = TopicStats(capacity=4, depth=1, width=16, rows=2)
+    truth = {}
+    for i in range(6000):
+        topic = b"t/%d" % (i % 1500)
+        stats.update(topic, i % 50)
+        m, b = truth.get(topic, (0, 0))
+        truth[topic] = (m + 1, b + i % 50)
+    # More distinct topics than one fold batch, into a tiny sketch
+    assert stats._cms_msgs != [0] * len(stats._cms_msgs)
+    for topic, (m, b) in truth.items():
+        est = stats.estimate(topic)
+        assert est["messages"] >= m and est["bytes"] >= b
+    assert stats.estimate(b"never-seen")["messages"] >= 0
+    assert stats.messages == 6000 and stats.bytes == sum(b for _, b in truth.values())
+
+
+def test_sketch_is_exact_without_collisions() -> None:
+    stats = TopicStats(width=4096, rows=4)
+    for _ in range(5):
+        stats.update(b"a", 10)
+    stats.update(b"b", 3)
+    assert stats.estimate(b"a") == {"messages": 5, "bytes": 50}
+    stats._fold()
+    assert stats.estimate(b"a") == {"messages": 5, "bytes": 50}
+    assert stats.estimate(b"b") == {"messages": 1, "bytes": 3}
+
+
+def test_heavy_hitters_survive_noise() -> None:
+    stats = TopicStats(capacity=8, depth=2)
+    for i in range(2000):
+        stats.update(b"hot/a/x", 100)
+        stats.update(b"cold-%d" % i, 10)
+    stats.tick()
+    snap = stats.snapshot(limit=3)
+    assert snap["messages"] == 4000
+    assert snap["tracked"] <= 8
+    hot = snap["topics"][0]
+    assert hot["topic"] == "hot/a/x" and hot["messages"] == 2000
+    assert hot["size"] == {"min": 100, "p50": 100, "p90": 100, "p99": 100, "max": 100}
+    assert [p["prefix"] for p in snap["prefixes"]["1"][:1]] == ["hot"]
+    assert [p["prefix"] for p in snap["prefixes"]["2"][:1]] == ["hot/a"]
+    assert [t["topic"] for t in stats.snapshot(prefix="hot/")["topics"]] == ["hot/a/x"]
+
+    found = stats.lookup("hot/a/x")
+    assert found["tracked"]["messages"] == 2000 and found["estimate"]["messages"] >= 2000
+    assert stats.lookup("cold-0")["tracked"] is None
+
+
+def test_size_quantiles() -> None:
+    stats = TopicStats()
+    for n in [100] * 90 + [1000] * 9 + [50000]:
+        stats.update(b"q", n)
+    size = stats.lookup("q")["tracked"]["size"]
+    assert size["min"] == 100 and size["max"] == 50000
+    assert 75 <= size["p50"] <= 125
+    assert size["p90"] == size["p50"]
+    assert 750 <= size["p99"] <= 1250
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import os
+import socket
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import pytest
+import zmq
+
+from backend import zmq_monitor
+from backend.zmq_monitor import ConnectionTable, MonitorService, _peer_name, monitor_event
+
+
+def test_peer_name_checks_the_fd_still_matches() -> None:
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        port = server.getsockname()[1]
+        with socket.create_connection(("127.0.0.1", port)) as client:
+            conn, _ = server.accept()
+            with conn:
+                expected = "127.0.0.1:%d" % client.getsockname()[1]
+                assert _peer_name(conn.fileno(), f"tcp://127.0.0.1:{port}") == expected
+                # Connected side: the endpoint names the far end's port
+                assert _peer_name(client.fileno(), f"tcp://127.0.0.1:{port}") == f"127.0.0.1:{port}"
+                # The fd was reused by an unrelated connection
+                assert _peer_name(conn.fileno(), "tcp://127.0.0.1:1") is None
+    with socket.socket(type=socket.SOCK_DGRAM) as udp:
+        udp.bind(("127.0.0.1", 0))
+        assert _peer_name(udp.fileno(), "tcp://127.0.0.1:%d" % udp.getsockname()[1]) is None
+    r, w = os.pipe()
+    try:
+        assert _peer_name(r, "tcp://127.0.0.1:5551") is None
+    finally:
+        os.close(r)
+        os.close(w)
+
+
+def test_connection_table_tracks_open_and_closed() -> None:
+    table = ConnectionTable(recent=2)
+    opened = monitor_event("xsub", {"event": zmq.EVENT_ACCEPTED, "value": -1, "endpoint": b"tcp://0.0.0.0:5551"}, ts="t0")
+    assert opened["meta"]["peer"] is None
+    opened["meta"]["value"] = 7
+    table.apply(opened)
+    assert [c["fd"] for c in table.snapshot()["connections"]] == [7]
+    table.apply(monitor_event("xsub", {"event": zmq.EVENT_DISCONNECTED, "value": 7, "endpoint": b"tcp://0.0.0.0:5551"}, ts="t1"))
+    snap = table.snapshot()
+    assert snap["connections"] == []
+    assert snap["recent"][0]["closed"] == "t1"
+    assert snap["endpoints"][0]["events"] == {"EVENT_ACCEPTED": 1, "EVENT_DISCONNECTED": 1}
+
+
+class _Bus:
+    def __init__(self) -> None:
+        self.events: List[Dict[str, Any]] = []
+
+    def publish_threadsafe(self, event: Dict[str, Any]) -> None:
+        self.events.append(event)
+
+
+def _retried(endpoint: str) -> Dict[str, Any]:
+    return {"event": zmq.EVENT_CONNECT_RETRIED, "value": 100, "endpoint": endpoint.encode()}
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> List[float]:
+    now = [100.0]
+    monkeypatch.setattr(zmq_monitor, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def _service(make_settings: Any, bus: _Bus) -> MonitorService:
+    settings = make_settings(monitor_aggregate=["EVENT_CONNECT_RETRIED"], monitor_burst=2, monitor_window_ms=1000.0)
+    return MonitorService(settings, bus)  # type: ignore[arg-type]
+
+
+def test_noisy_events_pass_a_burst_then_a_summary(make_settings: Any, clock: List[float]) -> None:
+    bus = _Bus()
+    mon = _service(make_settings, bus)
+    for _ in range(5):
+        mon._on_event("xsub", _retried("tcp://h:1"))
+    mon._on_event("xsub", {"event": zmq.EVENT_LISTENING, "value": 3, "endpoint": b"tcp://h:1"})
+    assert [e["meta"]["event"] for e in bus.events] == ["EVENT_CONNECT_RETRIED"] * 2 + ["EVENT_LISTENING"]
+    assert (mon.events, mon.suppressed) == (6, 3)
+    # The poll timeout runs to the end of the window
+    assert mon._flush(100.5) == 501 and len(bus.events) == 3
+    assert mon._flush(101.0) is None
+    summary = bus.events[-1]["meta"]
+    assert (summary["event"], summary["count"], summary["summary"], summary["window_ms"]) == (
+        "EVENT_CONNECT_RETRIED", 3, True, 1000.0,
+    )
+    assert mon._windows == {} and mon.summaries == 1
+    # A new window passes a new burst; a window with nothing held back ends quietly
+    clock[0] = 101.5
+    mon._on_event("xsub", _retried("tcp://h:1"))
+    assert mon._flush(102.5) is None
+    assert [e["meta"].get("summary") for e in bus.events[-2:]] == [True, None]
+    assert mon.summaries == 1
+
+
+def test_window_renewed_by_an_event_after_its_end(make_settings: Any, clock: List[float]) -> None:
+    bus = _Bus()
+    mon = _service(make_settings, bus)
+    for _ in range(3):
+        mon._on_event("xpub", _retried("tcp://h:2"))
+    clock[0] = 101.2  # before the service thread got to flush
+    mon._on_event("xpub", _retried("tcp://h:2"))
+    assert [e["meta"].get("count") for e in bus.events] == [None, None, 1, None]
+    # The replaced window's deadline is skipped, the new one's kept
+    assert mon._flush(101.5) == 701 and len(mon._windows) == 1
+    assert mon._flush(102.2) is None and mon._windows == {}
+
+
+def test_full_table_evicts_the_oldest_window(make_settings: Any, clock: List[float]) -> None:
+    bus = _Bus()
+    mon = _service(make_settings, bus)
+    mon._MAX_WINDOWS = 2
+    for endpoint in ("tcp://a:1", "tcp://b:1"):
+        for _ in range(3):
+            mon._on_event("xsub", _retried(endpoint))
+        clock[0] += 0.1
+    mon._on_event("xsub", _retried("tcp://c:1"))
+    # Only the oldest window was summarized early; the others keep suppressing
+    assert [k[2] for k in mon._windows] == ["tcp://b:1", "tcp://c:1"]
+    summaries = [e["meta"] for e in bus.events if e["meta"].get("summary")]
+    assert [(m["endpoint"], m["count"]) for m in summaries] == [("tcp://a:1", 1)]
+    assert mon._flush(101.1) is not None
+    assert [(m["endpoint"], m["count"]) for m in (e["meta"] for e in bus.events) if m.get("summary")] == [
+        ("tcp://a:1", 1), ("tcp://b:1", 1),
+    ]